@@ -0,0 +1,82 @@
+"""Time running wide flows of mostly-waiting tasks, sync vs async.
+
+Each task waits on simulated I/O for a few ticks, then completes.
+
+Usage: python -m benchmarks.async_flow_ticking [--num_tasks N ...]
+"""
+import argparse
+import asyncio
+import time
+
+from mc.flows.async_flow_engine import AsyncFlowEngine
+from mc.flows.flow_engine import FlowEngine
+
+from .flow_ticking import generate_wide_flow
+
+
+class WaitingTaskHandler(object):
+    """Waits io_time per tick, and completes after num_ticks ticks."""
+    def __init__(self, io_time=None, num_ticks=None):
+        self.io_time = io_time
+        self.num_ticks = num_ticks
+
+    def tick_task(self, task_ctx=None, **kwargs):
+        time.sleep(self.io_time)
+        self._count_tick(task=task_ctx['task'])
+
+    def _count_tick(self, task=None):
+        task['ticks'] = task.get('ticks', 0) + 1
+        if task['ticks'] >= self.num_ticks:
+            task['status'] = 'COMPLETED'
+
+
+class AsyncWaitingTaskHandler(WaitingTaskHandler):
+    async def tick_task(self, task_ctx=None, **kwargs):
+        await asyncio.sleep(self.io_time)
+        self._count_tick(task=task_ctx['task'])
+
+
+def benchmark_sync(num_tasks=None, io_time=None, num_ticks=None):
+    engine = FlowEngine(task_handler=WaitingTaskHandler(
+        io_time=io_time, num_ticks=num_ticks))
+    start = time.perf_counter()
+    engine.run_flow(flow=generate_wide_flow(num_tasks=num_tasks))
+    return time.perf_counter() - start
+
+
+def benchmark_async(num_tasks=None, io_time=None, num_ticks=None,
+                    max_concurrent_tasks=None):
+    engine = AsyncFlowEngine(
+        task_handler=AsyncWaitingTaskHandler(io_time=io_time,
+                                             num_ticks=num_ticks),
+        max_concurrent_tasks=max_concurrent_tasks)
+    start = time.perf_counter()
+    asyncio.run(engine.run_flow(flow=generate_wide_flow(num_tasks=num_tasks)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_tasks', type=int, nargs='+',
+                        default=[100, 1000, 5000])
+    parser.add_argument('--io_time', type=float, default=.01)
+    parser.add_argument('--num_ticks', type=int, default=3)
+    parser.add_argument('--max_concurrent_tasks', type=int, default=1000)
+    parser.add_argument('--max_sync_tasks', type=int, default=100,
+                        help="Skip the sync engine for larger flows.")
+    args = parser.parse_args()
+    row_fmt = '{:>10} {:>10} {:>10}'
+    print(row_fmt.format('num_tasks', 'sync_s', 'async_s'))
+    for num_tasks in args.num_tasks:
+        kwargs = {'num_tasks': num_tasks, 'io_time': args.io_time,
+                  'num_ticks': args.num_ticks}
+        sync_s = '-'
+        if num_tasks <= args.max_sync_tasks:
+            sync_s = '%.2f' % benchmark_sync(**kwargs)
+        async_s = benchmark_async(
+            max_concurrent_tasks=args.max_concurrent_tasks, **kwargs)
+        print(row_fmt.format(num_tasks, sync_s, '%.2f' % async_s))
+
+
+if __name__ == '__main__':
+    main()
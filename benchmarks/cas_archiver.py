@@ -0,0 +1,101 @@
+"""Compare ingest throughput and disk use of DirArchiver and CasArchiver, on
+many near-identical job dirs.
+
+Each job dir has shared inputs, which are the same in every dir, plus a few
+small files that are unique to the dir.
+
+Usage: python -m benchmarks.cas_archiver [--num_dirs N ...]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from mc.utils.archivers.cas_archiver import CasArchiver
+from mc.utils.archivers.dir_archiver import DirArchiver
+
+ARCHIVER_CLASSES = {'dir': DirArchiver, 'cas': CasArchiver}
+
+
+def generate_job_dirs(parent_dir=None, num_dirs=None, shared_inputs=None,
+                      num_unique_files=None):
+    job_dirs = []
+    for i in range(num_dirs):
+        job_dir = os.path.join(parent_dir, 'job_%s' % i)
+        os.makedirs(os.path.join(job_dir, 'inputs'))
+        for name, content in shared_inputs.items():
+            with open(os.path.join(job_dir, 'inputs', name), 'wb') as f:
+                f.write(content)
+        for j in range(num_unique_files):
+            with open(os.path.join(job_dir, 'out_%s.txt' % j), 'w') as f:
+                f.write('job %s, output %s\n' % (i, j))
+        job_dirs.append(job_dir)
+    return job_dirs
+
+
+def measure_disk_bytes(dir_=None):
+    """Sum file sizes, counting hardlinked files once."""
+    seen_inodes = set()
+    disk_bytes = 0
+    for dir_path, _, file_names in os.walk(dir_):
+        for file_name in file_names:
+            file_stat = os.lstat(os.path.join(dir_path, file_name))
+            if file_stat.st_ino in seen_inodes:
+                continue
+            seen_inodes.add(file_stat.st_ino)
+            disk_bytes += file_stat.st_size
+    return disk_bytes
+
+
+def benchmark_archiver(archiver_type=None, num_dirs=None, shared_inputs=None,
+                       num_unique_files=None):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        job_dirs = generate_job_dirs(
+            parent_dir=os.path.join(tmp_dir, 'jobs'), num_dirs=num_dirs,
+            shared_inputs=shared_inputs, num_unique_files=num_unique_files)
+        src_bytes = measure_disk_bytes(dir_=os.path.join(tmp_dir, 'jobs'))
+        archive_dir = os.path.join(tmp_dir, 'archive')
+        archiver = ARCHIVER_CLASSES[archiver_type](root_dir=archive_dir)
+        start_time = time.perf_counter()
+        for job_dir in job_dirs:
+            archiver.ingest(src=job_dir)
+        elapsed = time.perf_counter() - start_time
+        return {
+            'dirs_per_sec': num_dirs / elapsed,
+            'src_mb': src_bytes / 2**20,
+            'archive_mb': measure_disk_bytes(dir_=archive_dir) / 2**20,
+        }
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_dirs', type=int, nargs='+',
+                        default=[1000, 5000])
+    parser.add_argument('--shared_input_kb', type=int, default=64)
+    parser.add_argument('--num_shared_inputs', type=int, default=4)
+    parser.add_argument('--num_unique_files', type=int, default=3)
+    args = parser.parse_args()
+    shared_inputs = {
+        'input_%s.bin' % i: os.urandom(args.shared_input_kb * 1024)
+        for i in range(args.num_shared_inputs)
+    }
+    row_fmt = '{:>10} {:<10} {:>14} {:>12} {:>12}'
+    print(row_fmt.format('num_dirs', 'archiver', 'dirs_per_sec', 'src_mb',
+                         'archive_mb'))
+    for num_dirs in args.num_dirs:
+        for archiver_type in ARCHIVER_CLASSES:
+            result = benchmark_archiver(
+                archiver_type=archiver_type, num_dirs=num_dirs,
+                shared_inputs=shared_inputs,
+                num_unique_files=args.num_unique_files)
+            print(row_fmt.format(
+                num_dirs, archiver_type, '%.1f' % result['dirs_per_sec'],
+                '%.1f' % result['src_mb'], '%.1f' % result['archive_mb']))
+
+
+if __name__ == '__main__':
+    main()
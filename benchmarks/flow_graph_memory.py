@@ -0,0 +1,85 @@
+"""Compare memory use and serialized size of default and compact flow graphs.
+
+Usage: python -m benchmarks.flow_graph_memory [--num_tasks N ...]
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+from mc.flows.flow import Flow
+
+
+def generate_spread_flow_spec(num_tasks=None, graph_format=None):
+    """A spread flow: ROOT fans out to num_tasks tasks, which fan in."""
+    return {
+        'graph_format': graph_format,
+        'tasks': [
+            *[{'key': 'task_%s' % i, 'status': 'COMPLETED',
+               'precursors': [Flow.ROOT_TASK_KEY], 'successors': ['join']}
+              for i in range(num_tasks)],
+            {'key': 'join'},
+        ]
+    }
+
+
+def generate_flow_dict(num_tasks=None, graph_format=None):
+    flow_spec = generate_spread_flow_spec(num_tasks=num_tasks,
+                                          graph_format=graph_format)
+    flow_dict = Flow.from_flow_spec(flow_spec=flow_spec).to_flow_dict()
+    # Drop the spec's connection lists, so graph sizes only reflect edges.
+    for task in flow_dict['graph']['tasks'].values():
+        task.pop('precursors', None)
+        task.pop('successors', None)
+    return json.loads(json.dumps(flow_dict))
+
+
+def measure_hydrated_bytes(flow_dict=None):
+    """Measure memory allocated while hydrating a decoded flow dict.
+
+    Task dicts are already allocated, so this is mostly the flow's edge
+    storage, plus per-task bookkeeping that both formats share.
+    """
+    gc.collect()
+    tracemalloc.start()
+    flow = Flow.from_flow_dict(flow_dict=flow_dict)
+    flow_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return flow, flow_bytes
+
+
+def benchmark_graph_format(num_tasks=None, graph_format=None):
+    flow_dict = generate_flow_dict(num_tasks=num_tasks,
+                                   graph_format=graph_format)
+    num_edges = len(flow_dict['graph']['edges'])
+    flow, flow_bytes = measure_hydrated_bytes(flow_dict=flow_dict)
+    edges_json = json.dumps(flow.to_flow_dict()['graph']['edges'])
+    if 'task_keys' in flow_dict['graph']:
+        edges_json += json.dumps(flow_dict['graph']['task_keys'])
+    return {
+        'num_edges': num_edges,
+        'bytes_per_edge': flow_bytes / num_edges,
+        'json_bytes_per_edge': len(edges_json) / num_edges,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_tasks', type=int, nargs='+',
+                        default=[1000, 10000, 50000])
+    args = parser.parse_args()
+    row_fmt = '{:>10} {:>10} {:<10} {:>16} {:>20}'
+    print(row_fmt.format('num_tasks', 'num_edges', 'format',
+                         'bytes_per_edge', 'json_bytes_per_edge'))
+    for num_tasks in args.num_tasks:
+        for graph_format in ['default', 'compact']:
+            result = benchmark_graph_format(num_tasks=num_tasks,
+                                            graph_format=graph_format)
+            print(row_fmt.format(
+                num_tasks, result['num_edges'], graph_format,
+                '%.1f' % result['bytes_per_edge'],
+                '%.1f' % result['json_bytes_per_edge']))
+
+
+if __name__ == '__main__':
+    main()
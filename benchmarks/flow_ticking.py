@@ -0,0 +1,73 @@
+"""Time running large wide and diamond-shaped flows to completion.
+
+Usage: python -m benchmarks.flow_ticking [--num_tasks N ...]
+"""
+import argparse
+import time
+
+from mc.flows.flow import Flow
+from mc.flows.flow_engine import FlowEngine
+
+
+class CompletingTaskHandler(object):
+    """Completes every task on its first tick."""
+    def tick_task(self, task_ctx=None, **kwargs):
+        task_ctx['task']['status'] = 'COMPLETED'
+
+
+def generate_wide_flow(num_tasks=None):
+    flow = Flow()
+    for i in range(num_tasks):
+        flow.add_task(task={'key': 'task_%s' % i,
+                            'precursors': [Flow.ROOT_TASK_KEY]})
+    return flow
+
+
+def generate_diamond_flow(num_tasks=None):
+    """A chain of diamonds: each tail fans out to two tasks, which join."""
+    flow = Flow()
+    tail_key = Flow.ROOT_TASK_KEY
+    for i in range(num_tasks // 3):
+        for side in ['l', 'r']:
+            flow.add_task(task={'key': '%s_%s' % (i, side),
+                                'precursors': [tail_key]})
+        tail_key = 'join_%s' % i
+        flow.add_task(task={'key': tail_key,
+                            'precursors': ['%s_l' % i, '%s_r' % i]})
+    return flow
+
+
+FLOW_GENERATORS = {
+    'wide': generate_wide_flow,
+    'diamond': generate_diamond_flow,
+}
+
+
+def benchmark_run_flow(flow=None):
+    engine = FlowEngine(task_handler=CompletingTaskHandler())
+    start = time.perf_counter()
+    engine.run_flow(flow=flow, max_ticks=float('inf'))
+    return {'run_s': time.perf_counter() - start,
+            'ticks': flow.data['_tick_counter']}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_tasks', type=int, nargs='+',
+                        default=[1000, 10000, 50000])
+    parser.add_argument('--shapes', nargs='+', default=list(FLOW_GENERATORS))
+    args = parser.parse_args()
+    row_fmt = '{:>10} {:<10} {:>8} {:>10} {:>14}'
+    print(row_fmt.format('num_tasks', 'shape', 'ticks', 'run_s',
+                         'us_per_task'))
+    for num_tasks in args.num_tasks:
+        for shape in args.shapes:
+            flow = FLOW_GENERATORS[shape](num_tasks=num_tasks)
+            result = benchmark_run_flow(flow=flow)
+            print(row_fmt.format(
+                num_tasks, shape, result['ticks'], '%.2f' % result['run_s'],
+                '%.1f' % (1e6 * result['run_s'] / len(flow.tasks))))
+
+
+if __name__ == '__main__':
+    main()
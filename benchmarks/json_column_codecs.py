@@ -0,0 +1,79 @@
+"""Compare JSON column codecs on large synthetic flow graphs.
+
+Usage: python -m benchmarks.json_column_codecs [--num_tasks N ...]
+"""
+import argparse
+import json
+import timeit
+
+from mc.db import json_codecs
+from mc.flows.flow import Flow
+
+
+def generate_flow_graph(num_tasks=None):
+    flow_spec = {
+        'tasks': [
+            {
+                'key': 'task_%s' % i,
+                'task_type': 'mc.tasks.job',
+                'task_params': {'job_type': 'some.job_type',
+                                'job_params': {'index': i, 'name': 'x' * 20}},
+                'status': 'COMPLETED',
+                'data': {'_job_task_job_meta': {'key': 'job:%032d' % i}},
+            }
+            for i in range(num_tasks)
+        ]
+    }
+    return Flow.from_flow_spec(flow_spec=flow_spec).to_flow_dict()['graph']
+
+
+def get_codecs():
+    codecs = {
+        'stdlib json (previous)': json_codecs.JsonCodec(json_fns={
+            'dumps': lambda value: json.dumps(value, sort_keys=True),
+            'loads': json.loads,
+        }),
+        'fast json': json_codecs.JsonCodec(),
+        'fast json + zlib': json_codecs.JsonCodec(compression='zlib'),
+    }
+    try:
+        import zstandard  # noqa
+        codecs['fast json + zstd'] = json_codecs.JsonCodec(compression='zstd')
+    except ImportError:
+        pass
+    return codecs
+
+
+def benchmark_codec(codec=None, value=None, number=None):
+    encoded = codec.encode(value)
+    return {
+        'encode_ms': 1e3 * timeit.timeit(lambda: codec.encode(value),
+                                         number=number) / number,
+        'decode_ms': 1e3 * timeit.timeit(lambda: codec.decode(encoded),
+                                         number=number) / number,
+        'size_kb': len(encoded) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_tasks', type=int, nargs='+',
+                        default=[100, 1000, 10000])
+    parser.add_argument('--number', type=int, default=5)
+    args = parser.parse_args()
+    print("json library: %s" % json_codecs._get_json_fns()['name'])
+    row_fmt = '{:>10} {:<24} {:>12} {:>12} {:>12}'
+    print(row_fmt.format('num_tasks', 'codec', 'encode_ms', 'decode_ms',
+                         'size_kb'))
+    for num_tasks in args.num_tasks:
+        graph = generate_flow_graph(num_tasks=num_tasks)
+        for codec_name, codec in get_codecs().items():
+            result = benchmark_codec(codec=codec, value=graph,
+                                     number=args.number)
+            print(row_fmt.format(
+                num_tasks, codec_name, '%.2f' % result['encode_ms'],
+                '%.2f' % result['decode_ms'], '%.1f' % result['size_kb']))
+
+
+if __name__ == '__main__':
+    main()
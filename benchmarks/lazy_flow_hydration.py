@@ -0,0 +1,63 @@
+"""Time hydrating and ticking mostly-complete flows, eagerly and lazily.
+
+Usage: python -m benchmarks.lazy_flow_hydration [--num_tasks N ...]
+"""
+import argparse
+import json
+import time
+
+from mc.flows.flow import Flow
+from mc.flows.flow_engine import FlowEngine
+
+from .flow_ticking import CompletingTaskHandler
+
+
+def generate_flow_dict(num_tasks=None, fraction_completed=None):
+    """A chain of tasks, whose first fraction_completed are COMPLETED."""
+    num_completed = int(num_tasks * fraction_completed)
+    flow = Flow()
+    flow.tasks[Flow.ROOT_TASK_KEY]['status'] = 'COMPLETED'
+    tail_key = Flow.ROOT_TASK_KEY
+    for i in range(num_tasks):
+        key = 'task_%s' % i
+        flow.add_task(task={
+            'key': key, 'precursors': [tail_key],
+            'status': 'COMPLETED' if i < num_completed else 'PENDING'})
+        tail_key = key
+    return json.loads(json.dumps(flow.to_flow_dict()))
+
+
+def benchmark_tick(flow_dict=None, lazy=None):
+    engine = FlowEngine(task_handler=CompletingTaskHandler())
+    start = time.perf_counter()
+    flow = Flow.from_flow_dict(flow_dict=flow_dict, lazy=lazy)
+    hydrated_s = time.perf_counter() - start
+    engine.tick_flow(flow=flow)
+    flow.to_flow_dict()
+    return {'hydrate_s': hydrated_s,
+            'tick_s': time.perf_counter() - start,
+            'num_hydrated': len(flow.tasks)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_tasks', type=int, nargs='+',
+                        default=[10000, 100000])
+    parser.add_argument('--fraction_completed', type=float, default=.9)
+    args = parser.parse_args()
+    row_fmt = '{:>10} {:<6} {:>14} {:>10} {:>10}'
+    print(row_fmt.format('num_tasks', 'lazy', 'num_hydrated', 'hydrate_s',
+                         'tick_s'))
+    for num_tasks in args.num_tasks:
+        for lazy in [False, True]:
+            flow_dict = generate_flow_dict(
+                num_tasks=num_tasks,
+                fraction_completed=args.fraction_completed)
+            result = benchmark_tick(flow_dict=flow_dict, lazy=lazy)
+            print(row_fmt.format(
+                num_tasks, str(lazy), result['num_hydrated'],
+                '%.3f' % result['hydrate_s'], '%.3f' % result['tick_s']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Async versions of the record clients.
+
+Each client method runs on an :class:`mc.db.async_db.AsyncDb`'s thread
+pool, in a single unit of work, so multi-step operations like
+patch-and-release stay atomic.
+"""
+
+
+class BaseAsyncRecordClient(object):
+    METHOD_NAMES = []
+
+    def __init__(self, client=None, async_db=None):
+        """
+        Args:
+            client: a sync record client.
+            async_db (mc.db.async_db.AsyncDb): an AsyncDb for client.mc_db.
+        """
+        self.client = client
+        self.async_db = async_db
+
+    def __getattr__(self, name):
+        if name not in self.METHOD_NAMES:
+            return getattr(self.client, name)
+        method = getattr(self.client, name)
+
+        async def run_client_method(*args, **kwargs):
+            return await self.async_db.run(method, *args, **kwargs)
+        return run_client_method
+
+
+class AsyncFlowRecordClient(BaseAsyncRecordClient):
+    METHOD_NAMES = ['create_flow_record', 'create_flow_records',
+                    'get_flow_record', 'create_flow_record_from_flow_spec',
+                    'claim_flow_records', 'patch_and_release_flow_record']
+
+
+class AsyncJobRecordClient(BaseAsyncRecordClient):
+    METHOD_NAMES = ['create_job_record', 'create_job_records',
+                    'get_job_record', 'claim_job_records', 'patch_job_records']
+
@@ -1,7 +1,12 @@
+import time
+
 from mc.flows.flow_engine import FlowEngine
+from .prefetching import PrefetchingClientMixin
+
 
+class FlowRecordClient(PrefetchingClientMixin):
+    ITEM_TYPE = 'flow'
 
-class FlowRecordClient(object):
     def __init__(self, mc_db=None, queue_key=None, use_locks=False):
         """
         Args:
@@ -24,15 +29,31 @@ class FlowRecordClient(object):
             flow_meta (dict): a dictionary of metadata that can be passed to
                 get_flow_record to retrieve a flow.
         """
-        flow_record = self.mc_db.create_item(
-            item_type='flow', item_kwargs=flow_kwargs)
+        return self.create_flow_records(flow_kwargs_list=[flow_kwargs])[0]
+
+    def create_flow_records(self, flow_kwargs_list=None):
+        """Create several flow records in bulk.
+
+        Args:
+            flow_kwargs_list (list): a list of flow_kwargs dicts, as per
+                create_flow_record.
+
+        Returns:
+            flow_metas (list): a list of flow_metas, in the same order as
+                flow_kwargs_list.
+        """
+        flow_kwargs_list = [(flow_kwargs or {})
+                            for flow_kwargs in (flow_kwargs_list or [])]
+        flow_metas = self.mc_db.create_items(
+            item_type='flow', items_kwargs=flow_kwargs_list)
         if self.use_locks:
-            parent_key = flow_kwargs.get('parent_key')
-            if parent_key:
-                self.mc_db.create_lock(
-                    lockee_key=parent_key, locker_key=flow_record['key'])
-        flow_meta = {'key': flow_record['key']}
-        return flow_meta
+            self.mc_db.create_locks(locks=[
+                {'lockee_key': flow_kwargs['parent_key'],
+                 'locker_key': flow_meta['key']}
+                for flow_kwargs, flow_meta in zip(flow_kwargs_list, flow_metas)
+                if flow_kwargs.get('parent_key')
+            ])
+        return [{'key': flow_meta['key']} for flow_meta in flow_metas]
 
     def get_flow_record(self, flow_meta=None):
         """
@@ -61,18 +82,60 @@ class FlowRecordClient(object):
         flow_dict = FlowEngine.flow_to_flow_dict(flow=flow)
         return self.create_flow_record(flow_kwargs=flow_dict)
 
-    def claim_flow_records(self):
+    def claim_flow_records(self, params=None):
         """
+        Args:
+            params (dict, optional): claim params, such as 'limit',
+                'order_by', 'dirty_only' or 'changed_only'. These are passed
+                through to mc_db.claim_queue_items.
+
         Returns:
             flow_records (dict): a list of flow_records.
         """
         claimed = self.mc_db.claim_queue_items(
-            queue_key=self.queue_key)['items']
+            queue_key=self.queue_key, **(params or {}))['items']
         return claimed
 
+    def wait_for_dirty_flow_records(self, timeout=None, poll_interval=1.0):
+        """Wait until the queue has dirty flows that can be claimed.
+
+        Uses LISTEN/NOTIFY if the db supports it, and otherwise polls. Each
+        check runs in its own unit of work, so polling does not hold
+        transactions open.
+
+        Args:
+            timeout (float): maximum seconds to wait.
+            poll_interval (float, optional): seconds between polls, when
+                polling. Default: 1.0.
+
+        Returns:
+            has_dirty (bool): True if dirty flows are claimable, False if the
+                wait timed out.
+        """
+        deadline = time.time() + timeout
+        while True:
+            if self._has_dirty_flow_records():
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            if self.mc_db.supports_listen_notify:
+                self.mc_db.wait_for_notifications(
+                    channel=self.mc_db.DIRTY_FLOWS_CHANNEL, timeout=remaining)
+            else:
+                time.sleep(min(poll_interval, remaining))
+
+    def _has_dirty_flow_records(self):
+        # Check in a fresh transaction, to see other processes' commits.
+        with self.mc_db.unit_of_work():
+            return self.mc_db.has_claimable_queue_items(
+                queue_key=self.queue_key, dirty_only=True)
+
     def patch_and_release_flow_record(self, flow_record=None, patches=None):
         """Patches a flow_record and clears its 'claimed' value.
 
+        Marks the parent flow as dirty if the flow finishes.
+
         Args:
             flow_record (dict): a partial flow_record dict containing at least
                 the 'key' field.
@@ -85,7 +148,9 @@ class FlowRecordClient(object):
             item_type='flow', key=flow_record['key'],
             patches={'claimed': False, **patches}
         )
-        if self.use_locks:
-            if patches.get('status') in {'FAILED', 'COMPLETED'}:
+        if patches.get('status') in {'FAILED', 'COMPLETED'}:
+            self.mc_db.mark_parent_flows_dirty(item_type='flow',
+                                               keys=[flow_record['key']])
+            if self.use_locks:
                 self.mc_db.release_locks(locker_keys=[flow_record['key']])
         return patched
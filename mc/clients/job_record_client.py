@@ -1,4 +1,9 @@
-class JobRecordClient(object):
+from .prefetching import PrefetchingClientMixin
+
+
+class JobRecordClient(PrefetchingClientMixin):
+    ITEM_TYPE = 'job'
+
     def __init__(self, mc_db=None, queue_key=None, use_locks=False):
         """
         Args:
@@ -21,16 +26,31 @@ class JobRecordClient(object):
             job_meta (dict): a dictionary of metadata that can be passed to
                 get_job_record to retrieve a job.
         """
-        job_kwargs = {**(job_kwargs or {}), 'status': 'PENDING'}
-        job_record = self.mc_db.create_item(
-            item_type='job', item_kwargs=job_kwargs)
+        return self.create_job_records(job_kwargs_list=[job_kwargs])[0]
+
+    def create_job_records(self, job_kwargs_list=None):
+        """Create several job records in bulk.
+
+        Args:
+            job_kwargs_list (list): a list of job_kwargs dicts, as per
+                create_job_record.
+
+        Returns:
+            job_metas (list): a list of job_metas, in the same order as
+                job_kwargs_list.
+        """
+        job_kwargs_list = [{**(job_kwargs or {}), 'status': 'PENDING'}
+                           for job_kwargs in (job_kwargs_list or [])]
+        job_metas = self.mc_db.create_items(
+            item_type='job', items_kwargs=job_kwargs_list)
         if self.use_locks:
-            parent_key = job_kwargs.get('parent_key')
-            if parent_key:
-                self.mc_db.create_lock(
-                    lockee_key=parent_key, locker_key=job_record['key'])
-        job_meta = {'key': job_record['key']}
-        return job_meta
+            self.mc_db.create_locks(locks=[
+                {'lockee_key': job_kwargs['parent_key'],
+                 'locker_key': job_meta['key']}
+                for job_kwargs, job_meta in zip(job_kwargs_list, job_metas)
+                if job_kwargs.get('parent_key')
+            ])
+        return [{'key': job_meta['key']} for job_meta in job_metas]
 
     def get_job_record(self, job_meta=None):
         """
@@ -43,28 +63,42 @@ class JobRecordClient(object):
         return self.mc_db.get_item_by_key(
             item_type='job', key=job_meta['key'])
 
-    def claim_job_records(self, *args, **kwargs):
+    def claim_job_records(self, *args, params=None, **kwargs):
         """
+        Args:
+            params (dict, optional): claim params, such as 'limit' or
+                'order_by'. These are passed through to
+                mc_db.claim_queue_items.
+
         Returns:
             job_records (dict): a list of job_records.
         """
-        return self.mc_db.claim_queue_items(queue_key=self.queue_key)['items']
+        return self.mc_db.claim_queue_items(
+            queue_key=self.queue_key, **(params or {}))['items']
+
+    def patch_job_records(self, keyed_patches=None, return_records=True):
+        """Patch job records.
+
+        Marks the parent flows of jobs that finish as dirty.
 
-    def patch_job_records(self, keyed_patches=None):
-        """
         Args:
             keyed_patches (dict): a dict in which keys are job_record keys, and
                 values are dicts of job_record kwargs.
+            return_records (bool, optional): if False, skip fetching the
+                patched records. Default: True.
         Returns:
             job_records (dict): the patched items
         """
         patched = self.mc_db.patch_items(
-            item_type='job', keyed_patches=keyed_patches)
-        if self.use_locks:
-            locker_keys = [
-                job_key for job_key, patches in keyed_patches.items()
-                if patches.get('status') in {'FAILED', 'COMPLETED'}
-            ]
-            if locker_keys:
-                self.mc_db.release_locks(locker_keys=locker_keys)
+            item_type='job', keyed_patches=keyed_patches,
+            return_items=return_records)
+        finished_keys = [
+            job_key for job_key, patches in keyed_patches.items()
+            if patches.get('status') in {'FAILED', 'COMPLETED'}
+        ]
+        if finished_keys:
+            self.mc_db.mark_parent_flows_dirty(item_type='job',
+                                               keys=finished_keys)
+            if self.use_locks:
+                self.mc_db.release_locks(locker_keys=finished_keys)
         return patched
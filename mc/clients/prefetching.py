@@ -0,0 +1,59 @@
+class PrefetchingClientMixin(object):
+    """Mixin for record clients, to prefetch many records' statuses at once.
+
+    A runner can call :meth:`prefetch_records` with the metas of every
+    record its tasks will check in a tick, and task handlers can then read
+    statuses with :meth:`get_prefetched_status` instead of doing one lookup
+    per record.
+    """
+    ITEM_TYPE = None
+    PREFETCH_FIELDS = ['key', 'status', 'parent_key']
+
+    def prefetch_records(self, metas=None):
+        """Fetch and cache the statuses of records, in one query.
+
+        Args:
+            metas (list): record metas, with 'key' values.
+        """
+        self._prefetched_records = self.mc_db.get_items_by_keys(
+            item_type=self.ITEM_TYPE,
+            keys={meta['key'] for meta in (metas or [])},
+            fields=self.PREFETCH_FIELDS
+        )
+
+    def clear_prefetched_records(self): self._prefetched_records = {}
+
+    def get_prefetched_records(self, metas=None):
+        """Get prefetched records, e.g. to pass them to another process.
+
+        Args:
+            metas (list): record metas, with 'key' values.
+
+        Returns:
+            prefetched_records (dict): the prefetched records for metas that
+                were prefetched, keyed by record key.
+        """
+        prefetched_records = getattr(self, '_prefetched_records', {})
+        return {meta['key']: prefetched_records[meta['key']]
+                for meta in (metas or [])
+                if meta['key'] in prefetched_records}
+
+    def set_prefetched_records(self, records=None):
+        """Use records prefetched elsewhere, e.g. by another process.
+
+        Args:
+            records (dict): records, keyed by record key, as from
+                :meth:`get_prefetched_records`.
+        """
+        self._prefetched_records = {**(records or {})}
+
+    def get_prefetched_status(self, meta=None):
+        """
+        Returns:
+            status (str): the record's prefetched status, or None if the
+                record was not prefetched.
+        """
+        record = getattr(self, '_prefetched_records', {}).get(meta['key'])
+        if record is None:
+            return None
+        return record.get('status')
@@ -0,0 +1,57 @@
+import asyncio
+from concurrent import futures
+import functools
+
+
+class AsyncDb(object):
+    """Async access to a :class:`mc.db.db.Db`.
+
+    Db methods run on a thread pool, each in its own
+    :meth:`mc.db.db.Db.unit_of_work`, and are awaited from the event loop.
+    So many coroutines can wait on the db without blocking each other. e.g.
+    ::
+
+        async_db = AsyncDb(db=db)
+        flow = await async_db.get_item_by_key(item_type='flow', key=key)
+
+    For dbs without concurrent writes, i.e. sqlite, calls run one at a time.
+    """
+
+    def __init__(self, db=None, max_workers=None):
+        """
+        Args:
+            db (mc.db.db.Db): the db to wrap.
+            max_workers (int, optional): number of worker threads. Default:
+                10, or 1 if the db does not support concurrent writes.
+        """
+        self.db = db
+        if max_workers is None:
+            max_workers = 10 if db.supports_concurrent_writes else 1
+        self.executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    async def run(self, fn=None, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the thread pool, in a unit of work.
+
+        Returns:
+            result: fn's return value.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor,
+            functools.partial(self._run_in_unit_of_work, fn, *args, **kwargs)
+        )
+
+    def _run_in_unit_of_work(self, fn=None, *args, **kwargs):
+        with self.db.unit_of_work():
+            return fn(*args, **kwargs)
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        async def run_db_method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        return run_db_method
+
+    def shutdown(self):
+        self.executor.shutdown()
@@ -1,19 +1,50 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import threading
+from types import SimpleNamespace
+import time
+
 import sqlalchemy as _sqla
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 
 from mc.utils import update_helper
 from .query_builder import QueryBuilder
+from . import json_codecs
+from . import utils as _db_utils
 
 
 class Db(object):
     ITEM_TYPES = ['job', 'flow', 'queue']
+    DEFAULT_CLAIM_ORDER_BY = {'field': 'modified', 'direction': 'asc'}
+    DIRTY_FLOWS_CHANNEL = 'mc_dirty_flows'
 
     class ItemNotFoundError(Exception):
         pass
 
     def __init__(self, engine=None, db_uri=None, schema=None,
-                 ensure_tables=False):
+                 ensure_tables=False, engine_kwargs=None,
+                 json_compression=None):
+        """
+        Args:
+            engine (sqlalchemy.engine.Engine, optional): engine to use.
+            db_uri (str|callable, optional): uri for creating an engine, if
+                no engine was given.
+            schema (module, optional): schema module. Default: mc.db.schema.
+            ensure_tables (bool, optional): create and migrate tables on init.
+            engine_kwargs (dict, optional): extra kwargs for create_engine,
+                e.g. pool settings like ::
+
+                    {'pool_size': 5, 'max_overflow': 10,
+                     'pool_pre_ping': True, 'pool_recycle': 3600}
+
+            json_compression (dict, optional): kwargs for
+                :func:`mc.db.json_codecs.configure_compression`, e.g.
+                {'compression': 'zlib'}. Only applies to this Db's engine.
+                Default: None, for the process-wide codecs.
+        """
+        self.engine_kwargs = engine_kwargs or {}
+        self.json_compression = json_compression
         if engine:
             self.engine = engine
         else:
@@ -30,11 +61,15 @@ class Db(object):
             db_uri = self.db_uri
             if callable(db_uri):
                 db_uri = db_uri()
-            self._engine = create_engine(db_uri)
+            self.engine = create_engine(db_uri, **self.engine_kwargs)
         return self._engine
 
     @engine.setter
-    def engine(self, value): self._engine = value
+    def engine(self, value):
+        self._engine = value
+        if self.json_compression:
+            json_codecs.configure_compression(engine=value,
+                                              **self.json_compression)
 
     @property
     def schema(self):
@@ -51,13 +86,64 @@ class Db(object):
 
     @property
     def session(self):
-        if not hasattr(self, '_session'):
-            self._session = self.Session()
-        return self._session
+        """The current session.
+
+        This is the innermost :meth:`unit_of_work` session, if one is open in
+        this thread. Otherwise it is the thread's scoped session.
+        """
+        unit_of_work_sessions = self._get_unit_of_work_sessions()
+        if unit_of_work_sessions:
+            return unit_of_work_sessions[-1]
+        if hasattr(self, '_session'):
+            return self._session
+        return self.ScopedSession()
 
     @session.setter
     def session(self, value): self._session = value
 
+    @property
+    def ScopedSession(self):
+        if not hasattr(self, '_ScopedSession'):
+            self._ScopedSession = scoped_session(self.Session)
+        return self._ScopedSession
+
+    def remove_scoped_session(self):
+        """Close this thread's scoped session and discard its identity map."""
+        self.ScopedSession.remove()
+
+    def _get_unit_of_work_sessions(self):
+        if not hasattr(self, '_local'):
+            self._local = threading.local()
+        if not hasattr(self._local, 'unit_of_work_sessions'):
+            self._local.unit_of_work_sessions = []
+        return self._local.unit_of_work_sessions
+
+    @contextmanager
+    def unit_of_work(self):
+        """Run db operations in a fresh, short-lived session.
+
+        Within the block, :attr:`session` is the new session. It is committed
+        if the block succeeds, rolled back if it raises, and closed either
+        way, so that identity maps do not grow across units of work.
+
+        Usage: ::
+
+            with db.unit_of_work():
+                db.patch_item(...)
+        """
+        session = self.Session()
+        unit_of_work_sessions = self._get_unit_of_work_sessions()
+        unit_of_work_sessions.append(session)
+        try:
+            yield session
+            session.commit()
+        except:
+            session.rollback()
+            raise
+        finally:
+            unit_of_work_sessions.pop()
+            session.close()
+
     @property
     def Session(self):
         if not hasattr(self, '_Session'):
@@ -70,10 +156,71 @@ class Db(object):
     def ensure_tables(self):
         assert self.schema is not None
         self.create_tables()
+        return self.migrate_tables()
 
     def create_tables(self):
         self.schema.metadata.create_all(self.engine)
 
+    def migrate_tables(self):
+        """Bring existing tables up to date with the schema, in place.
+
+        Adds missing nullable columns and missing indexes. Never drops or
+        alters existing columns. Added columns that cache derived values, like
+        flow.active_lock_count, are backfilled.
+
+        Returns:
+            migration_result (dict): a dict in this shape: ::
+
+                {'added_columns': ['table.column', ...],
+                 'added_indexes': ['index_name', ...],
+                 'skipped_columns': ['table.column', ...]}
+        """
+        migration_result = {'added_columns': [], 'added_indexes': [],
+                            'skipped_columns': []}
+        inspector = _sqla.inspect(self.engine)
+        existing_table_names = set(inspector.get_table_names())
+        for table in self.schema.metadata.sorted_tables:
+            if table.name not in existing_table_names:
+                continue
+            existing_column_names = {
+                column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_column_names:
+                    continue
+                column_label = '%s.%s' % (table.name, column.name)
+                if column.primary_key or not column.nullable:
+                    migration_result['skipped_columns'].append(column_label)
+                else:
+                    self._add_column(table=table, column=column)
+                    migration_result['added_columns'].append(column_label)
+            existing_index_names = {
+                index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_index_names:
+                    index.create(bind=self.engine)
+                    migration_result['added_indexes'].append(index.name)
+        if 'flow.active_lock_count' in migration_result['added_columns']:
+            self._backfill_lock_counts(
+                has_lock_table=('lock' in existing_table_names))
+        return migration_result
+
+    def _backfill_lock_counts(self, has_lock_table=True):
+        if has_lock_table:
+            statement = self._generate_lock_counts_update()
+        else:
+            table = self.models.Flow.__table__
+            statement = table.update().values(active_lock_count=0,
+                                              modified=table.c.modified)
+        self.engine.execute(statement)
+
+    def _add_column(self, table=None, column=None):
+        dialect = self.engine.dialect
+        quote = dialect.identifier_preparer.quote
+        self.engine.execute(
+            'ALTER TABLE {table} ADD COLUMN {column} {type_}'.format(
+                table=quote(table.name), column=quote(column.name),
+                type_=column.type.compile(dialect=dialect)))
+
     def drop_tables(self):
         self.schema.metadata.drop_all(self.engine)
 
@@ -88,6 +235,74 @@ class Db(object):
             self.session.add(item)
         return self.item_to_dict(item)
 
+    def create_items(self, item_type=None, items_kwargs=None):
+        """Create several items in bulk.
+
+        Keys are generated client-side, and rows are written with one
+        executemany INSERT per table and per set of kwargs fields. Items with
+        kwargs that are not columns (e.g. 'tags') are created through the
+        ORM, which sets relationships, and rejects unknown kwargs.
+
+        Args:
+            item_type (str): one of :attr:`.ITEM_TYPES`
+            items_kwargs (list): a list of item kwargs dicts.
+
+        Returns:
+            item_metas (list): a list of item metas, in the same order as
+                items_kwargs. e.g. ::
+
+                    [{'key': key_1}, ..., {'key': key_n}]
+        """
+        if not items_kwargs:
+            return []
+        Model = self.get_model_for_item_type(item_type)
+        items_and_rows = []
+        with self.session.begin_nested():
+            for kwargs in items_kwargs:
+                if self._item_kwargs_need_orm(Model=Model,
+                                              item_kwargs=kwargs):
+                    item = Model(**kwargs)
+                    self.session.add(item)
+                    items_and_rows.append((item, None))
+                else:
+                    items_and_rows.append((None, self._generate_item_row(
+                        Model=Model, item_kwargs=kwargs)))
+            item_rows = [item_row for _, item_row in items_and_rows
+                         if item_row is not None]
+            node_type = Model.__mapper__.polymorphic_identity
+            node_rows = [{'node_key': item_row['node_ref'],
+                          'node_type': node_type}
+                         for item_row in item_rows]
+            self._execute_grouped_inserts(table=_db_utils.Node.__table__,
+                                          rows=node_rows)
+            self._execute_grouped_inserts(table=Model.__table__,
+                                          rows=item_rows)
+        return [{'key': item.key if item is not None else item_row['key']}
+                for item, item_row in items_and_rows]
+
+    def _item_kwargs_need_orm(self, Model=None, item_kwargs=None):
+        column_names = Model.__table__.columns.keys()
+        return any(field not in column_names for field in item_kwargs)
+
+    def _generate_item_row(self, Model=None, item_kwargs=None):
+        item_row = {**item_kwargs}
+        if item_row.get('key') is None:
+            key_generator = Model.get_key_generator()
+            item_row['key'] = key_generator(
+                SimpleNamespace(current_parameters=item_row))
+        item_row['node_ref'] = ':'.join(['node', _db_utils.generate_uuid()])
+        derive_kwargs = getattr(Model, 'derive_kwargs', None)
+        if derive_kwargs:
+            item_row.update(derive_kwargs(item_kwargs=item_kwargs))
+        return item_row
+
+    def _execute_grouped_inserts(self, table=None, rows=None):
+        rows_by_fields = defaultdict(list)
+        for row in rows:
+            rows_by_fields[tuple(sorted(row.keys()))].append(row)
+        for fields_rows in rows_by_fields.values():
+            self.session.execute(table.insert(), fields_rows)
+
     def get_model_for_item_type(self, item_type):
         return getattr(self.models, item_type.title())
 
@@ -111,6 +326,93 @@ class Db(object):
         q = self.generate_item_query(item_type=item_type, query_spec=query)
         return self.items_to_dicts(items=q)
 
+    def iter_items(self, item_type=None, query=None, fields=None,
+                   yield_per=1000):
+        """Stream items of item_type that match the given query.
+
+        Rows are fetched in batches and converted straight to dicts, without
+        loading ORM instances into the session.
+
+        Args:
+            item_type (str): one of :attr:`.ITEM_TYPES`
+            query (dict, optional): a query spec, as for :meth:`query_items`.
+            fields (list, optional): only fetch these columns, e.g.
+                ['key', 'status']. Default: all columns.
+            yield_per (int, optional): number of rows to fetch per batch.
+                Default: 1000.
+
+        Yields:
+            item (dict): an item dict, with only the requested fields.
+        """
+        table = self.get_model_for_item_type(item_type).__table__
+        if fields:
+            columns = [table.c[field] for field in fields]
+        else:
+            columns = list(table.columns)
+        q = (
+            self.generate_item_query(item_type=item_type, query_spec=query)
+            .with_entities(*columns)
+            .yield_per(yield_per)
+        )
+        for row in q:
+            yield self._row_to_dict(row)
+
+    def get_items_by_keys(self, item_type=None, keys=None, fields=None,
+                          batch_size=500):
+        """Get several items by key, with one 'IN' query per batch of keys.
+
+        Args:
+            item_type (str): one of :attr:`.ITEM_TYPES`
+            keys (list): item keys. Missing keys are skipped.
+            fields (list, optional): only fetch these columns, as for
+                :meth:`iter_items`. Default: all columns.
+            batch_size (int, optional): maximum number of keys per query, to
+                stay under dialects' bound parameter limits. Default: 500.
+
+        Returns:
+            items (dict): a dict of item dicts, keyed by item key.
+        """
+        return self._get_items_by_keys(
+            Model=self.get_model_for_item_type(item_type), keys=keys or [],
+            fields=fields, batch_size=batch_size)
+
+    def count_items(self, item_type=None, query=None):
+        """Count items of item_type that match the given query, in SQL.
+
+        Args:
+            item_type (str): one of :attr:`.ITEM_TYPES`
+            query (dict, optional): a query spec, as for :meth:`query_items`.
+
+        Returns:
+            count (int): the number of matching items.
+        """
+        return self._generate_item_keys_query(
+            item_type=item_type, query_spec=query).count()
+
+    def exists_items(self, item_type=None, query=None):
+        """Check whether any items of item_type match the given query.
+
+        Args:
+            item_type (str): one of :attr:`.ITEM_TYPES`
+            query (dict, optional): a query spec, as for :meth:`query_items`.
+
+        Returns:
+            exists (bool): True if at least one item matches.
+        """
+        keys_query = self._generate_item_keys_query(
+            item_type=item_type, query_spec=query)
+        return self.session.query(
+            _sqla.exists(keys_query.limit(1).statement)).scalar()
+
+    def _generate_item_keys_query(self, item_type=None, query_spec=None):
+        table = self.get_model_for_item_type(item_type).__table__
+        return (
+            self.generate_item_query(item_type=item_type,
+                                     query_spec=query_spec)
+            .with_entities(table.c.key)
+            .order_by(None)
+        )
+
     def generate_item_query(self, item_type=None, query_spec=None):
         Model = self.get_model_for_item_type(item_type)
         base_query = self.session.query(Model)
@@ -127,10 +429,17 @@ class Db(object):
 
         Returns:
             patched_item <dict>: the patched item.
+
+        Raises:
+            ItemNotFoundError
         """
         Model = self.get_model_for_item_type(item_type)
         with self.session.begin_nested():
             item = self.session.query(Model).filter_by(key=key).first()
+            if item is None:
+                raise self.ItemNotFoundError(
+                    "item_type '{item_type}', key '{key}'".format(
+                        item_type=item_type, key=key))
             for field, value in patches.items():
                 setattr(item, field, value)
             self.session.add(item)
@@ -187,28 +496,154 @@ class Db(object):
                 item_type=item_type, key=key)
             raise self.ItemNotFoundError(error_details)
 
-    def patch_items(self, item_type=None, keyed_patches=None):
-        """
+    def patch_items(self, item_type=None, keyed_patches=None,
+                    return_items=True):
+        """Patch several items in bulk.
+
+        Patches are grouped by the set of fields they change, and each group
+        is applied with a single executemany UPDATE.
+
         Args:
             item_type (str): item_type <str>: one of :attr:`.ITEM_TYPES`
             keyed_patches (dict): a dictionary in which the keys are item_keys
                 and the values are dicts of item props to update.
+            return_items (bool, optional): if True, fetch the patched items
+                and return them. Default: True.
 
         Returns:
             patched_items (dict): a dictionary of patched results, keyed by
-                item keys
+                item keys. Empty if return_items is False.
+
+        Raises:
+            ItemNotFoundError: if any item with patches does not exist. No
+                items are patched then.
         """
-        return {
-            key: self.patch_item(item_type=item_type, key=key, patches=patches)
+        if not keyed_patches:
+            return {}
+        Model = self.get_model_for_item_type(item_type)
+        self.session.flush()
+        bulk_keyed_patches = {}
+        with self.session.begin_nested():
+            for key, patches in keyed_patches.items():
+                if self._patches_need_orm(Model=Model, patches=patches):
+                    self.patch_item(item_type=item_type, key=key,
+                                    patches=patches)
+                else:
+                    bulk_keyed_patches[key] = patches
+            for fields, group_keyed_patches in (
+                self._group_keyed_patches_by_fields(
+                    Model=Model, keyed_patches=bulk_keyed_patches).items()
+            ):
+                self._execute_patch_group(Model=Model, fields=fields,
+                                          keyed_patches=group_keyed_patches)
+        self._expire_cached_items(Model=Model, keys=bulk_keyed_patches.keys())
+        if not return_items:
+            return {}
+        return self._get_items_by_keys(Model=Model, keys=keyed_patches.keys())
+
+    def _patches_need_orm(self, Model=None, patches=None):
+        """Some fields have ORM-level side effects (e.g. Job.job_hash), and
+        fields that are not columns (e.g. relationships) can only be set, or
+        rejected, by the ORM."""
+        orm_fields = getattr(Model, 'HASH_COMPONENTS', None) or []
+        if any(field in patches for field in orm_fields):
+            return True
+        column_names = Model.__table__.columns.keys()
+        return any(field not in column_names for field in patches)
+
+    def _group_keyed_patches_by_fields(self, Model=None, keyed_patches=None):
+        groups = defaultdict(dict)
+        for key, patches in keyed_patches.items():
+            if patches:
+                groups[tuple(sorted(patches.keys()))][key] = patches
+        return groups
+
+    def _execute_patch_group(self, Model=None, fields=None,
+                             keyed_patches=None):
+        table = Model.__table__
+        statement = (
+            table.update()
+            .where(table.c.key == _sqla.bindparam('_patch_key'))
+            .values({
+                field: _sqla.bindparam('_patch_' + field,
+                                       type_=table.c[field].type)
+                for field in fields
+            })
+        )
+        result = self.session.execute(statement, [
+            {
+                '_patch_key': key,
+                **{'_patch_' + field: value
+                   for field, value in patches.items()}
+            }
             for key, patches in keyed_patches.items()
-        }
+        ])
+        if (
+            self.engine.dialect.supports_sane_multi_rowcount
+            and result.rowcount == len(keyed_patches)
+        ):
+            return
+        # Some dialects don't count executemany rows, or only count changed
+        # rows, so look up which keys are missing.
+        missing_keys = (
+            set(keyed_patches.keys())
+            - set(self._get_items_by_keys(Model=Model,
+                                          keys=keyed_patches.keys(),
+                                          fields=['key']).keys())
+        )
+        if missing_keys:
+            raise self.ItemNotFoundError(
+                "item_type '{item_type}', keys {keys}".format(
+                    item_type=Model.__tablename__,
+                    keys=sorted(missing_keys)))
+
+    def _get_items_by_keys(self, Model=None, keys=None, fields=None,
+                           batch_size=500):
+        table = Model.__table__
+        keys = list(keys)
+        if fields:
+            columns = [table.c[field] for field in {'key', *fields}]
+        else:
+            columns = list(table.columns)
+        items_by_key = {}
+        for i in range(0, len(keys), batch_size):
+            query = (
+                self.session.query(*columns)
+                .filter(table.c.key.in_(keys[i:i + batch_size]))
+            )
+            for row in query:
+                item = self._row_to_dict(row)
+                items_by_key[item['key']] = item
+        return {key: items_by_key[key] for key in keys if key in items_by_key}
 
-    def claim_queue_items(self, queue_key=None, **kwargs):
+    def claim_queue_items(self, queue_key=None, limit=None, order_by=None,
+                          dirty_only=False, changed_only=False, **kwargs):
         """
-        Builds query for queue by examining queue's queue_spec.
+        Builds query for queue by examining queue's queue_spec, and claims
+        matching items.
+
+        Claiming is atomic: an item will only be returned to one claimer,
+        even if several runners poll the same queue concurrently.
 
         Args:
             queue_key (str): the queue's key
+            limit (int, optional): maximum number of items to claim. Default:
+                the queue_spec's 'claim_limit', or no limit.
+            order_by (dict, optional): an order_by spec, as per
+                :class:`.QueryBuilder`, that determines which items get
+                claimed first. e.g. ::
+
+                    {'field': 'depth', 'direction': 'desc'}
+
+                Default: the queue_spec's 'claim_order_by', or
+                :attr:`.DEFAULT_CLAIM_ORDER_BY` (oldest 'modified' first).
+            dirty_only (bool, optional): for flow queues, only claim flows
+                that are marked dirty. See :meth:`mark_parent_flows_dirty`.
+                Claiming a flow always clears its dirty mark. Default: False.
+            changed_only (bool, optional): for flow queues, only claim flows
+                that have no 'child_watermark', or that have a child job or
+                flow that finished after their 'child_watermark'. See
+                :meth:`generate_changed_flows_filter`. Default: False.
 
         Returns:
             claimed_items (dict): a dict of claim result, in this shape:
@@ -216,18 +651,170 @@ class Db(object):
                     {items: [claimed_item_1, ..., claimed_item_n]}
         """
         queue = self.get_item_by_key(item_type='queue', key=queue_key)
-        items_to_claim = self.get_queue_items_to_claim(queue=queue)
-        if items_to_claim:
-            claimed_items = self.patch_items(
-                item_type=queue['queue_spec']['item_type'],
-                keyed_patches={
-                    item['key']: {'claimed': True} for item in items_to_claim
-                }
-            ).values()
-        else:
-            claimed_items = []
+        queue_spec = queue['queue_spec']
+        if limit is None:
+            limit = queue_spec.get('claim_limit')
+        order_by = (order_by or queue_spec.get('claim_order_by')
+                    or self.DEFAULT_CLAIM_ORDER_BY)
+        claimable_query = self.query_builder.alter_query_per_query_spec(
+            query=self.generate_queue_claim_query(queue=queue,
+                                                  dirty_only=dirty_only,
+                                                  changed_only=changed_only),
+            query_spec={'order_by': order_by}
+        )
+        claimed_items = self.claim_items(
+            item_type=queue_spec['item_type'],
+            claimable_query=claimable_query,
+            limit=limit,
+            claim_values=self.get_claim_values(queue=queue)
+        )
         return {'items': claimed_items}
 
+    def get_claim_values(self, queue=None):
+        """Get extra values to set on items when they are claimed."""
+        if queue['queue_spec']['item_type'] == 'flow':
+            return {'dirty': False}
+        return {}
+
+    def has_claimable_queue_items(self, queue_key=None, dirty_only=False,
+                                  changed_only=False):
+        """Check whether a queue has any claimable items.
+
+        Args:
+            queue_key (str): the queue's key
+            dirty_only (bool, optional): as for :meth:`claim_queue_items`.
+            changed_only (bool, optional): as for :meth:`claim_queue_items`.
+
+        Returns:
+            has_claimable (bool): True if at least one item can be claimed.
+        """
+        queue = self.get_item_by_key(item_type='queue', key=queue_key)
+        table = self.get_model_for_item_type(
+            queue['queue_spec']['item_type']).__table__
+        keys_query = (
+            self.generate_queue_claim_query(queue=queue, dirty_only=dirty_only,
+                                            changed_only=changed_only)
+            .with_entities(table.c.key)
+            .order_by(None)
+        )
+        return self.session.query(
+            _sqla.exists(keys_query.limit(1).statement)).scalar()
+
+    def claim_items(self, item_type=None, claimable_query=None, limit=None,
+                    claim_values=None):
+        """Claim items that match a query.
+
+        Uses a single 'UPDATE ... WHERE key IN (SELECT ... FOR UPDATE SKIP
+        LOCKED) RETURNING' statement if the dialect supports it. Otherwise
+        falls back to a compare-and-set update per candidate item.
+
+        Args:
+            item_type (str): one of :attr:`.ITEM_TYPES`
+            claimable_query (sqlalchemy.orm.Query): query for claimable items.
+            limit (int, optional): maximum number of items to claim.
+            claim_values (dict, optional): extra column values to set on
+                claimed items.
+
+        Returns:
+            claimed_items (list): a list of claimed items.
+        """
+        if limit is not None and limit <= 0:
+            return []
+        Model = self.get_model_for_item_type(item_type)
+        self.session.flush()
+        if self.supports_update_returning:
+            claim_fn = self._claim_items_w_update_returning
+        else:
+            claim_fn = self._claim_items_w_compare_and_set
+        claimed_items = claim_fn(Model=Model, claimable_query=claimable_query,
+                                 limit=limit, claim_values=claim_values)
+        self._expire_cached_items(
+            Model=Model, keys=[item['key'] for item in claimed_items])
+        return claimed_items
+
+    @property
+    def supports_update_returning(self):
+        return getattr(self.engine.dialect, 'full_returning', False)
+
+    def _claim_items_w_update_returning(self, Model=None, claimable_query=None,
+                                        limit=None, claim_values=None):
+        statement = self._generate_update_returning_claim_statement(
+            Model=Model, claimable_query=claimable_query, limit=limit,
+            claim_values=claim_values)
+        return [self._row_to_dict(row)
+                for row in self.session.execute(statement)]
+
+    def _generate_update_returning_claim_statement(self, Model=None,
+                                                   claimable_query=None,
+                                                   limit=None,
+                                                   claim_values=None):
+        table = Model.__table__
+        keys_query = claimable_query.with_entities(table.c.key)
+        if limit is not None:
+            keys_query = keys_query.limit(limit)
+        keys_query = keys_query.with_for_update(skip_locked=True, of=table)
+        statement = (
+            table.update()
+            .where(table.c.key.in_(keys_query.subquery()))
+            .values(claimed=True, **(claim_values or {}))
+            .returning(*table.columns)
+        )
+        return statement
+
+    def _claim_items_w_compare_and_set(self, Model=None, claimable_query=None,
+                                       limit=None, claim_values=None):
+        table = Model.__table__
+        candidates_query = claimable_query.with_entities(*table.columns)
+        if limit is not None:
+            candidates_query = candidates_query.limit(limit)
+        candidates = [self._row_to_dict(row) for row in candidates_query]
+        return self._compare_and_set_claims(table=table, items=candidates,
+                                            claim_values=claim_values)
+
+    def _compare_and_set_claims(self, table=None, items=None,
+                                claim_values=None):
+        claimed_items = []
+        claim_values = {'claimed': True, 'modified': time.time(),
+                        **(claim_values or {})}
+        for item in items:
+            statement = (
+                table.update()
+                .where(table.c.key == item['key'])
+                .where(table.c.claimed == False)  # noqa
+                .values(**claim_values)
+            )
+            if self.session.execute(statement).rowcount == 1:
+                claimed_items.append({**item, **claim_values})
+        return claimed_items
+
+    def _row_to_dict(self, row):
+        return {key: value for key, value in zip(row.keys(), row)
+                if not key.startswith('_')}
+
+    def _expire_cached_items(self, Model=None, keys=None):
+        keys = set(keys)
+        for instance in list(self.session.identity_map.values()):
+            if isinstance(instance, Model) and instance.key in keys:
+                self.session.expire(instance)
+
+    def generate_queue_claim_query(self, queue=None, dirty_only=False,
+                                   changed_only=False):
+        """
+        Args:
+            queue (dict): a queue record
+            dirty_only (bool, optional): as for :meth:`claim_queue_items`.
+            changed_only (bool, optional): as for :meth:`claim_queue_items`.
+
+        Returns:
+            query (sqlalchemy.orm.Query): a query for items that match the
+                queue's queue_spec and that can be claimed.
+        """
+        queue_item_type = queue['queue_spec']['item_type']
+        if queue_item_type == 'flow':
+            return self.generate_flow_queue_claim_query(
+                queue=queue, dirty_only=dirty_only, changed_only=changed_only)
+        return self.generate_default_queue_claim_query(queue=queue)
+
     def get_queue_items_to_claim(self, queue=None):
         """
         Args:
@@ -246,28 +833,138 @@ class Db(object):
     def get_flow_queue_items_to_claim(self, queue=None):
         """Gets flow queue items.
 
-        Checks for lock records on items.
+        Checks lock counts on items.
         """
+        return self.items_to_dicts(
+            items=self.generate_flow_queue_claim_query(queue=queue))
+
+    def generate_flow_queue_claim_query(self, queue=None, dirty_only=False,
+                                        changed_only=False):
         Flow = self.models.Flow
         query = self.session.query(Flow)
         query = self.query_builder.alter_query_per_query_spec(
             query=query,
             query_spec={'filters': self.get_default_claiming_filters()}
         )
-        lock_count_subquery = self.get_lock_count_subquery()
-        query = (
-            query.join(
-                lock_count_subquery,
-                (Flow.key == lock_count_subquery.c.lockee_key),
-                isouter=True,
-            )
-            .filter(
-                (Flow.num_tickable_tasks.is_(None))
-                | (lock_count_subquery.c.lock_count.is_(None))
-                | (Flow.num_tickable_tasks > lock_count_subquery.c.lock_count)
+        query = query.filter(
+            (Flow.num_tickable_tasks.is_(None))
+            | (_sqla.func.coalesce(Flow.active_lock_count, 0) == 0)
+            | (Flow.num_tickable_tasks > Flow.active_lock_count)
+        )
+        if dirty_only:
+            # Flows from before the dirty column existed have NULL values.
+            query = query.filter((Flow.dirty == True)  # noqa
+                                 | (Flow.dirty.is_(None)))
+        if changed_only:
+            query = query.filter(self.generate_changed_flows_filter())
+        return query
+
+    def generate_changed_flows_filter(self):
+        """Generate a filter for flows that may have something to do.
+
+        A flow runner sets a flow's 'child_watermark' to the time when it
+        started ticking the flow, if, after the tick, the flow was only
+        waiting on child jobs and flows. The flow then has nothing to do
+        until one of its children finishes. Children are found by their
+        'parent_key' values.
+
+        Returns:
+            filter (sqlalchemy clause): matches flows that have no
+                'child_watermark', or that have a COMPLETED or FAILED child
+                job or flow whose 'modified' value is later than the flow's
+                'child_watermark'. Claiming a child, or other changes to
+                unfinished children, do not match.
+        """
+        flow_table = self.models.Flow.__table__
+        clauses = [flow_table.c.child_watermark.is_(None)]
+        for item_type in ['job', 'flow']:
+            child_table = self.get_model_for_item_type(
+                item_type).__table__.alias()
+            clauses.append(
+                _sqla.exists()
+                .where(child_table.c.parent_key == flow_table.c.key)
+                .where(child_table.c.status.in_(['COMPLETED', 'FAILED']))
+                .where(child_table.c.modified > flow_table.c.child_watermark)
             )
+        return _sqla.or_(*clauses)
+
+    def mark_parent_flows_dirty(self, item_type=None, keys=None):
+        """Mark the parent flows of items as dirty.
+
+        Call this when items finish, so that flow runners which only claim
+        dirty flows will re-tick their parents. Does not change the parents'
+        'modified' values.
+
+        If the dialect supports it, also sends a notification on
+        :attr:`DIRTY_FLOWS_CHANNEL`. Notifications are delivered when the
+        session commits.
+
+        Args:
+            item_type (str): 'job' or 'flow'.
+            keys (list): keys of the child items.
+        """
+        if not keys:
+            return
+        child_table = self.get_model_for_item_type(item_type).__table__
+        Flow = self.models.Flow
+        table = Flow.__table__
+        parent_keys_query = (
+            _sqla.select([child_table.c.parent_key])
+            .where(child_table.c.key.in_(list(keys)))
+        )
+        self.session.flush()
+        self.session.execute(
+            table.update()
+            .where(table.c.key.in_(parent_keys_query))
+            .values(dirty=True, modified=table.c.modified)
         )
-        return self.items_to_dicts(items=query)
+        if self.supports_listen_notify:
+            self.session.execute('NOTIFY %s' % self.DIRTY_FLOWS_CHANNEL)
+
+    @property
+    def supports_concurrent_writes(self):
+        """False for sqlite, where concurrent write transactions fail with
+        'database is locked' errors."""
+        return self.engine.dialect.name != 'sqlite'
+
+    @property
+    def supports_listen_notify(self):
+        return self.engine.dialect.name == 'postgresql'
+
+    def wait_for_notifications(self, channel=None, timeout=None):
+        """Wait for LISTEN/NOTIFY notifications on a channel.
+
+        Only supported for postgresql with psycopg2. Uses a dedicated
+        autocommit connection, which starts listening on the first call.
+
+        Args:
+            channel (str): the channel to listen on.
+            timeout (float, optional): maximum seconds to wait. Default: wait
+                indefinitely.
+
+        Returns:
+            notifications (list): payloads of received notifications. Empty
+                if the wait timed out.
+        """
+        import select
+        connection = self._get_listen_connection(channel=channel)
+        if select.select([connection], [], [], timeout) == ([], [], []):
+            return []
+        connection.poll()
+        notifications = [notify.payload for notify in connection.notifies]
+        del connection.notifies[:]
+        return notifications
+
+    def _get_listen_connection(self, channel=None):
+        if not hasattr(self, '_listen_connections'):
+            self._listen_connections = {}
+        if channel not in self._listen_connections:
+            connection = self.engine.raw_connection().connection
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute('LISTEN %s' % channel)
+            self._listen_connections[channel] = connection
+        return self._listen_connections[channel]
 
     def get_default_claiming_filters(self):
         """
@@ -291,9 +988,13 @@ class Db(object):
             items (list): a list of items that match the combination of the
                 filters and the queue's queue_spec.
         """
-        return self.query_items(
+        return self.items_to_dicts(
+            items=self.generate_default_queue_claim_query(queue=queue))
+
+    def generate_default_queue_claim_query(self, queue=None):
+        return self.generate_item_query(
             item_type=queue['queue_spec']['item_type'],
-            query={'filters': self.get_default_claiming_filters()}
+            query_spec={'filters': self.get_default_claiming_filters()}
         )
 
     def create_lock(self, lockee_key=None, locker_key=None):
@@ -304,23 +1005,54 @@ class Db(object):
             locker_key (str): key for the item that holds the lock.
 
         Returns:
-            lock_record (dict): a lock_record
+            lock_meta (dict): the lock's meta, as per :meth:`create_items`.
         """
-        self.create_item(
-            item_type='Lock',
-            item_kwargs={'lockee_key': lockee_key, 'locker_key': locker_key}
-        )
+        return self.create_locks(
+            locks=[{'lockee_key': lockee_key, 'locker_key': locker_key}])[0]
+
+    def create_locks(self, locks=None):
+        """Create lock records in bulk.
+
+        Also increments the lockees' active_lock_count.
+
+        Args:
+            locks (list): a list of dicts with 'lockee_key' and 'locker_key'.
+
+        Returns:
+            lock_metas (list): a list of lock metas, as per
+                :meth:`create_items`.
+        """
+        locks = locks or []
+        lock_metas = self.create_items(item_type='lock', items_kwargs=[
+            {'lockee_key': lock['lockee_key'],
+             'locker_key': lock['locker_key']}
+            for lock in locks
+        ])
+        self._adjust_lock_counts(lock_count_deltas=Counter(
+            [lock['lockee_key'] for lock in locks]))
+        return lock_metas
 
     def release_locks(self, locker_keys=None):
         """Release locks.
 
+        Also decrements the lockees' active_lock_count.
+
         Args:
             locker_key (str): key for the item that holds the lock.
 
         Returns:
             None
         """
-        return self.delete_items(
+        Lock = self.models.Lock
+        released_lock_counts = (
+            self.session.query(Lock.lockee_key,
+                               _sqla.func.count(Lock.key))
+            .filter(Lock.locker_key.in_(locker_keys))
+            .group_by(Lock.lockee_key)
+        )
+        lock_count_deltas = {lockee_key: -count
+                             for lockee_key, count in released_lock_counts}
+        result = self.delete_items(
             item_type='lock',
             query={
                 'filters': [
@@ -328,6 +1060,78 @@ class Db(object):
                 ]
             }
         )
+        self._adjust_lock_counts(lock_count_deltas=lock_count_deltas)
+        return result
+
+    def _adjust_lock_counts(self, lock_count_deltas=None):
+        if not lock_count_deltas:
+            return
+        Flow = self.models.Flow
+        table = Flow.__table__
+        statement = (
+            table.update()
+            .where(table.c.key == _sqla.bindparam('_lockee_key'))
+            .values(
+                active_lock_count=(
+                    _sqla.func.coalesce(table.c.active_lock_count, 0)
+                    + _sqla.bindparam('_delta')
+                ),
+                modified=table.c.modified,
+            )
+        )
+        self.session.execute(statement, [
+            {'_lockee_key': lockee_key, '_delta': delta}
+            for lockee_key, delta in lock_count_deltas.items()
+        ])
+        self._expire_cached_items(Model=Flow, keys=lock_count_deltas.keys())
+
+    def get_lock_count_mismatches(self):
+        """Find flows whose active_lock_count disagrees with the lock table.
+
+        Returns:
+            mismatches (dict): a dict of {flow_key: {'active_lock_count': int,
+                'lock_count': int}}
+        """
+        Flow = self.models.Flow
+        lock_count_subquery = self.get_lock_count_subquery()
+        lock_count = _sqla.func.coalesce(lock_count_subquery.c.lock_count, 0)
+        query = (
+            self.session.query(Flow.key, Flow.active_lock_count, lock_count)
+            .join(
+                lock_count_subquery,
+                (Flow.key == lock_count_subquery.c.lockee_key),
+                isouter=True,
+            )
+            .filter(_sqla.func.coalesce(Flow.active_lock_count, 0)
+                    != lock_count)
+        )
+        return {
+            key: {'active_lock_count': active_lock_count,
+                  'lock_count': lock_count}
+            for key, active_lock_count, lock_count in query
+        }
+
+    def rebuild_lock_counts(self):
+        """Recompute every flow's active_lock_count from the lock table.
+
+        Returns:
+            result (dict): {'num_rebuilt': number of flows updated}
+        """
+        self.session.flush()
+        result = self.session.execute(self._generate_lock_counts_update())
+        self.session.expire_all()
+        return {'num_rebuilt': result.rowcount}
+
+    def _generate_lock_counts_update(self):
+        flow_table = self.models.Flow.__table__
+        lock_table = self.models.Lock.__table__
+        lock_count = (
+            _sqla.select([_sqla.func.count(lock_table.c.key)])
+            .where(lock_table.c.lockee_key == flow_table.c.key)
+            .as_scalar()
+        )
+        return flow_table.update().values(active_lock_count=lock_count,
+                                          modified=flow_table.c.modified)
 
     def upsert(self, key=None, updates=None, model_type=None, commit=True):
         model_type = model_type or key.split(':')[0].title()
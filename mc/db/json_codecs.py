@@ -0,0 +1,213 @@
+"""Codecs for JSON columns.
+
+A codec turns a JSON-serializable value into column text, and back.
+
+Encoding uses orjson or ujson if one is installed, and falls back to the
+stdlib json module for values they can not encode exactly, like NaN and
+infinite floats. Codecs may compress values above a size threshold.
+Compressed values are stored as text with a header, e.g.
+'~zlib:<base64 payload>'. JSON text never starts with '~', so rows written
+without compression still decode.
+
+Codecs can be set per engine, with :func:`set_codec` or
+:func:`configure_compression`, so that Db instances with different settings
+can share a process.
+"""
+import base64
+import json
+import math
+import zlib
+
+MAGIC_PREFIX = '~'
+# Attribute of an engine's dialect that holds the engine's codecs.
+ENGINE_CODECS_ATTR = '_mc_json_codecs'
+
+
+def _stdlib_dumps(value): return json.dumps(value, sort_keys=True)
+
+
+def _has_non_finite_floats(value):
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_has_non_finite_floats(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_non_finite_floats(item) for item in value)
+    return False
+
+
+def _get_json_fns():
+    try:
+        import orjson
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+        def orjson_dumps(value):
+            text = orjson.dumps(value, option=option).decode()
+            # orjson writes NaN and infinite floats as null.
+            if 'null' in text and _has_non_finite_floats(value):
+                raise ValueError("orjson can not encode non-finite floats")
+            return text
+
+        return {
+            'name': 'orjson',
+            'dumps': orjson_dumps,
+            'loads': orjson.loads,
+        }
+    except ImportError:
+        pass
+    try:
+        import ujson
+        return {
+            'name': 'ujson',
+            'dumps': lambda value: ujson.dumps(value, sort_keys=True),
+            'loads': ujson.loads,
+        }
+    except ImportError:
+        pass
+    return {
+        'name': 'json',
+        'dumps': _stdlib_dumps,
+        'loads': json.loads,
+    }
+
+
+def _get_zstd_compressor():
+    import zstandard
+    return {
+        'compress': lambda bytes_: zstandard.ZstdCompressor().compress(bytes_),
+        'decompress': (
+            lambda bytes_: zstandard.ZstdDecompressor().decompress(bytes_)),
+    }
+
+
+def _get_zlib_compressor():
+    return {'compress': zlib.compress, 'decompress': zlib.decompress}
+
+
+COMPRESSOR_FACTORIES = {
+    'zlib': _get_zlib_compressor,
+    'zstd': _get_zstd_compressor,
+}
+
+
+class JsonCodec(object):
+    def __init__(self, json_fns=None, compression=None,
+                 compression_threshold=None):
+        """
+        Args:
+            json_fns (dict, optional): dict with 'dumps' and 'loads' fns.
+                Default: fastest available JSON library.
+            compression (str, optional): a key from
+                :attr:`COMPRESSOR_FACTORIES`, e.g. 'zlib'. Default: None, for
+                no compression.
+            compression_threshold (int, optional): only compress encoded
+                values with at least this many characters. Default: 0.
+        """
+        self.json_fns = json_fns or _get_json_fns()
+        self.compression = compression
+        self.compression_threshold = compression_threshold or 0
+        self._compressors = {}
+
+    def encode(self, value):
+        try:
+            text = self.json_fns['dumps'](value)
+        except (TypeError, ValueError, OverflowError):
+            text = _stdlib_dumps(value)
+        if self.compression and len(text) >= self.compression_threshold:
+            text = self.compress_text(text=text)
+        return text
+
+    def compress_text(self, text=None):
+        compressor = self.get_compressor(self.compression)
+        payload = base64.b64encode(compressor['compress'](text.encode()))
+        return '{prefix}{compression}:{payload}'.format(
+            prefix=MAGIC_PREFIX, compression=self.compression,
+            payload=payload.decode())
+
+    def get_compressor(self, compression=None):
+        if compression not in self._compressors:
+            self._compressors[compression] = (
+                COMPRESSOR_FACTORIES[compression]())
+        return self._compressors[compression]
+
+    def decode(self, text):
+        if text.startswith(MAGIC_PREFIX):
+            text = self.decompress_text(text=text)
+        try:
+            return self.json_fns['loads'](text)
+        except ValueError:
+            # e.g. NaN, which only the stdlib json module decodes.
+            return json.loads(text)
+
+    def decompress_text(self, text=None):
+        compression, payload = text[len(MAGIC_PREFIX):].split(':', 1)
+        compressor = self.get_compressor(compression)
+        return compressor['decompress'](base64.b64decode(payload)).decode()
+
+
+CODECS = {
+    # For small columns, like cfg and props. Encodes like the stdlib json
+    # module, so that equality filters on column text match older rows.
+    'default': JsonCodec(json_fns={**_get_json_fns(), 'dumps': _stdlib_dumps}),
+    # For big columns, like Flow.graph and Job.data, which are not filtered
+    # on. Encodes with the fastest JSON library, whose compact text may
+    # differ from older rows' text. Uncompressed unless configured with
+    # :func:`configure_compression`.
+    'large': JsonCodec(),
+}
+DEFAULT_COMPRESSION_THRESHOLD = 64 * 1024
+
+
+def get_codec(codec_name=None, dialect=None):
+    """Get a named codec.
+
+    Args:
+        codec_name (str, optional): Default: 'default'.
+        dialect (sqlalchemy.engine.interfaces.Dialect, optional): an engine's
+            dialect. Codecs set for the engine take precedence over the
+            process-wide codecs in :data:`CODECS`.
+    """
+    codec_name = codec_name or 'default'
+    engine_codecs = getattr(dialect, ENGINE_CODECS_ATTR, {})
+    return engine_codecs.get(codec_name) or CODECS[codec_name]
+
+
+def set_codec(codec_name=None, codec=None, engine=None):
+    """Replace a named codec, e.g. to change compression settings.
+
+    Decoding handles every known compression header, so rows written with
+    earlier settings stay readable.
+
+    Args:
+        codec_name (str): name of the codec to replace.
+        codec (JsonCodec): the new codec.
+        engine (sqlalchemy.engine.Engine, optional): only use the codec for
+            this engine's JSON columns. Default: None, to replace the codec
+            in :data:`CODECS`, for every engine.
+    """
+    if engine is None:
+        CODECS[codec_name] = codec
+        return
+    if not hasattr(engine.dialect, ENGINE_CODECS_ATTR):
+        setattr(engine.dialect, ENGINE_CODECS_ATTR, {})
+    getattr(engine.dialect, ENGINE_CODECS_ATTR)[codec_name] = codec
+
+
+def configure_compression(compression=None, compression_threshold=None,
+                          codec_name='large', engine=None):
+    """Set compression for a named codec.
+
+    Args:
+        compression (str, optional): a key from :attr:`COMPRESSOR_FACTORIES`,
+            e.g. 'zlib'. Default: None, for no compression.
+        compression_threshold (int, optional): only compress encoded values
+            with at least this many characters. Default:
+            :data:`DEFAULT_COMPRESSION_THRESHOLD`.
+        codec_name (str, optional): codec to configure. Default: 'large'.
+        engine (sqlalchemy.engine.Engine, optional): as for
+            :func:`set_codec`.
+    """
+    if compression_threshold is None:
+        compression_threshold = DEFAULT_COMPRESSION_THRESHOLD
+    set_codec(codec_name=codec_name, engine=engine, codec=JsonCodec(
+        compression=compression, compression_threshold=compression_threshold))
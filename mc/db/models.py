@@ -9,15 +9,22 @@ class Flow(*utils.common_supers):
     label = utils.generate_str_column()
     claimed = utils.generate_boolean_column()
     status = utils.generate_status_column()
-    parent_key = utils.generate_str_column(length=constants.KEY_LENGTH)
+    parent_key = utils.generate_str_column(length=constants.KEY_LENGTH,
+                                           index=True)
     cfg = utils.generate_json_column()
     data = utils.generate_json_column()
-    graph = utils.generate_json_column()
+    graph = utils.generate_json_column(codec_name='large')
     num_tickable_tasks = utils.generate_int_column()
+    active_lock_count = utils.generate_int_column(default=0)
     depth = utils.generate_int_column()
+    dirty = utils.generate_boolean_column(default=True)
+    child_watermark = utils.generate_float_column()
     __mapper_args__ = {
         'polymorphic_identity': 'flow',
     }
+    __table_args__ = (
+        utils.generate_claiming_index('flow'),
+    )
 
 
 class Job(*utils.common_supers):
@@ -25,17 +32,36 @@ class Job(*utils.common_supers):
     label = utils.generate_str_column()
     claimed = utils.generate_boolean_column()
     status = utils.generate_status_column()
-    parent_key = utils.generate_str_column(length=constants.KEY_LENGTH)
+    parent_key = utils.generate_str_column(length=constants.KEY_LENGTH,
+                                           index=True)
     job_type = utils.generate_str_column()
     job_params = utils.generate_json_column()
     cfg = utils.generate_json_column()
-    data = utils.generate_json_column()
+    data = utils.generate_json_column(codec_name='large')
     artifact_meta = utils.generate_json_column()
     job_hash = utils.generate_str_column(length=63, unique=True,
                                          nullable=True)
     __mapper_args__ = {
         'polymorphic_identity': 'job',
     }
+    __table_args__ = (
+        utils.generate_claiming_index('job'),
+    )
+
+    @classmethod
+    def derive_kwargs(cls, item_kwargs=None):
+        """Get derived column values, for inserts that bypass the ORM.
+
+        Mirrors what the hash component listeners set on a new Job.
+        """
+        if (
+            'job_params' not in item_kwargs
+            and item_kwargs.get('job_type') is None
+        ):
+            return {}
+        components = {component_name: item_kwargs.get(component_name)
+                      for component_name in cls.HASH_COMPONENTS}
+        return {'job_hash': hash_utils.hash_obj(components)}
 
     @classmethod
     def _receive_hash_component(cls, component_name=None, target=None,
@@ -73,8 +99,10 @@ class Queue(*utils.common_supers):
 
 
 class Lock(*utils.common_supers):
-    lockee_key = utils.generate_str_column(length=constants.KEY_LENGTH)
-    locker_key = utils.generate_str_column(length=constants.KEY_LENGTH)
+    lockee_key = utils.generate_str_column(length=constants.KEY_LENGTH,
+                                           index=True)
+    locker_key = utils.generate_str_column(length=constants.KEY_LENGTH,
+                                           index=True)
     __mapper_args__ = {
         'polymorphic_identity': 'lock',
     }
@@ -83,7 +111,7 @@ class Lock(*utils.common_supers):
 class Request(*utils.common_supers):
     HASH_COMPONENTS = ['request_type', 'instance_key', 'params']
     request_type = utils.generate_str_column(primary_key=True)
-    request_tag = utils.generate_str_column(primary_key=True)
+    request_tag = utils.generate_str_column(primary_key=True, index=True)
     instance_key = utils.generate_str_column(primary_key=True)
     params = utils.generate_json_column()
     status = utils.generate_status_column(default='PENDING')
@@ -111,5 +111,5 @@ class QueryBuilder(object):
         expr = self._get_expr_for_field(
             query=query, field=order_by_spec['field'])
         direction = order_by_spec.get('direction') or 'asc'
-        order_by_arg = getattr(expr, direction)
+        order_by_arg = getattr(expr, direction)()
         return order_by_arg
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from mc.clients.async_clients import AsyncFlowRecordClient
+from mc.clients.flow_record_client import FlowRecordClient
+from .. import db
+from ..async_db import AsyncDb
+
+
+class BaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        db_uri = 'sqlite:///%s' % os.path.join(self.tmp_dir, 'mc.db.sqlite')
+        self.db = db.Db(db_uri=db_uri, ensure_tables=True)
+        self.async_db = AsyncDb(db=self.db)
+        self.addCleanup(self.async_db.shutdown)
+
+
+class AsyncDbTestCase(BaseTestCase):
+    def test_runs_db_methods_in_units_of_work(self):
+        async def create_and_get_flows():
+            flows = await asyncio.gather(*[
+                self.async_db.create_item(item_type='flow',
+                                          item_kwargs={'label': str(i)})
+                for i in range(5)
+            ])
+            return await asyncio.gather(*[
+                self.async_db.get_item_by_key(item_type='flow',
+                                              key=flow['key'])
+                for flow in flows
+            ])
+        fetched_flows = asyncio.run(create_and_get_flows())
+        self.assertEqual([flow['label'] for flow in fetched_flows],
+                         [str(i) for i in range(5)])
+        with self.db.unit_of_work():
+            self.assertEqual(self.db.count_items(item_type='flow'), 5)
+
+    def test_uses_one_worker_for_sqlite(self):
+        self.assertEqual(self.async_db.executor._max_workers, 1)
+
+    def test_passes_through_attrs(self):
+        self.assertIs(self.async_db.models, self.db.models)
+
+
+class AsyncFlowRecordClientTestCase(BaseTestCase):
+    def test_runs_client_methods(self):
+        client = AsyncFlowRecordClient(
+            client=FlowRecordClient(mc_db=self.db), async_db=self.async_db)
+
+        async def create_and_get_flow_record():
+            flow_meta = await client.create_flow_record(
+                flow_kwargs={'label': 'some_label'})
+            return await client.get_flow_record(flow_meta=flow_meta)
+        flow_record = asyncio.run(create_and_get_flow_record())
+        self.assertEqual(flow_record['label'], 'some_label')
+
+    def test_wraps_existing_client_methods(self):
+        for method_name in AsyncFlowRecordClient.METHOD_NAMES:
+            self.assertTrue(callable(getattr(FlowRecordClient, method_name)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,11 @@
+import os
+import shutil
+import tempfile
+import threading
 import unittest
-from unittest.mock import call, MagicMock
+from unittest.mock import call, MagicMock, patch
+
+import sqlalchemy as _sqla
 
 from .. import db
 
@@ -71,6 +77,188 @@ class JobTestCase(BaseTestCase):
             self.assertEqual(patched_job[k], v)
 
 
+class CreateItemsTestCase(BaseTestCase):
+    def test_creates_items_in_input_order(self):
+        items_kwargs = [
+            {'label': 'job_0', 'data': {'some': 'data'}},
+            {'label': 'job_1'},
+            {'label': 'job_2', 'parent_key': 'some_parent_key'},
+        ]
+        item_metas = self.db.create_items(item_type='job',
+                                          items_kwargs=items_kwargs)
+        self.assertEqual(len(item_metas), len(items_kwargs))
+        for item_meta, item_kwargs in zip(item_metas, items_kwargs):
+            job = self.db.get_item_by_key(item_type='job',
+                                          key=item_meta['key'])
+            self.assertTrue(job['key'].startswith('job:'))
+            self.assertEqual(job['status'], 'PENDING')
+            self.assertEqual(job['claimed'], False)
+            for k, v in item_kwargs.items():
+                self.assertEqual(job[k], v)
+
+    def test_respects_given_keys(self):
+        item_metas = self.db.create_items(item_type='flow',
+                                          items_kwargs=[{'key': 'flow:a'}])
+        self.assertEqual(item_metas, [{'key': 'flow:a'}])
+        self.assertEqual(
+            self.db.get_item_by_key(item_type='flow', key='flow:a')['key'],
+            'flow:a'
+        )
+
+    def test_sets_same_job_hash_as_create_item(self):
+        job_kwargs = {'job_type': 'some.job_type',
+                      'job_params': {'some': 'job_params'}}
+        created_job = self.db.create_item(item_type='job',
+                                          item_kwargs=job_kwargs)
+        self.db.delete_items(item_type='job')
+        item_meta = self.db.create_items(item_type='job',
+                                         items_kwargs=[job_kwargs])[0]
+        job = self.db.get_item_by_key(item_type='job', key=item_meta['key'])
+        self.assertEqual(job['job_hash'], created_job['job_hash'])
+
+    def test_creates_tags_through_orm(self):
+        items_kwargs = [{'label': 'job_0'},
+                        {'label': 'job_1', 'tags': {'tag_1', 'tag_2'}},
+                        {'label': 'job_2'}]
+        item_metas = self.db.create_items(item_type='job',
+                                          items_kwargs=items_kwargs)
+        jobs = [self.db.get_item_by_key(item_type='job', key=item_meta['key'])
+                for item_meta in item_metas]
+        self.assertEqual([job['label'] for job in jobs],
+                         ['job_0', 'job_1', 'job_2'])
+        job_1 = self.db.session.query(self.db.models.Job).filter_by(
+            key=item_metas[1]['key']).one()
+        self.assertEqual(job_1.tags, {'tag_1', 'tag_2'})
+
+    def test_rejects_unknown_kwargs(self):
+        with self.assertRaises(TypeError):
+            self.db.create_items(item_type='job',
+                                 items_kwargs=[{'nonexistent': 'x'}])
+
+    def test_creates_locks(self):
+        lock_metas = self.db.create_locks(locks=[
+            {'lockee_key': 'lockee_%s' % i, 'locker_key': 'locker_%s' % i}
+            for i in range(2)
+        ])
+        locks = self.db.query_items(item_type='lock')
+        self.assertEqual(sorted([lock['key'] for lock in locks]),
+                         sorted([lock_meta['key'] for lock_meta in lock_metas]))
+
+
+class PatchItemsTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.jobs = [
+            self.db.create_item(
+                item_type='job',
+                item_kwargs={'label': 'job_%s' % i, 'data': {'i': i}}
+            )
+            for i in range(4)
+        ]
+
+    def test_patches_items(self):
+        keyed_patches = {
+            self.jobs[0]['key']: {'status': 'RUNNING'},
+            self.jobs[1]['key']: {'status': 'FAILED', 'data': {'x': 1}},
+            self.jobs[2]['key']: {'status': 'COMPLETED'},
+        }
+        patched_jobs = self.db.patch_items(item_type='job',
+                                           keyed_patches=keyed_patches)
+        self.assertEqual(list(patched_jobs.keys()), list(keyed_patches.keys()))
+        for key, patches in keyed_patches.items():
+            fetched_job = self.db.get_item_by_key(item_type='job', key=key)
+            for job in [patched_jobs[key], fetched_job]:
+                for field, value in patches.items():
+                    self.assertEqual(job[field], value)
+        untouched_job = self.db.get_item_by_key(item_type='job',
+                                                key=self.jobs[3]['key'])
+        self.assertEqual(untouched_job, self.jobs[3])
+
+    def test_updates_modified(self):
+        patched_jobs = self.db.patch_items(
+            item_type='job',
+            keyed_patches={self.jobs[0]['key']: {'status': 'RUNNING'}}
+        )
+        self.assertGreater(patched_jobs[self.jobs[0]['key']]['modified'],
+                           self.jobs[0]['modified'])
+
+    def test_executes_one_statement_per_group_of_fields(self):
+        keyed_patches = {
+            **{job['key']: {'status': 'RUNNING'} for job in self.jobs[:2]},
+            **{job['key']: {'status': 'FAILED', 'data': {}}
+               for job in self.jobs[2:]},
+        }
+        self.db._execute_patch_group = MagicMock()
+        self.db.patch_items(item_type='job', keyed_patches=keyed_patches,
+                            return_items=False)
+        self.assertEqual(
+            sorted([call_args[1]['fields'] for call_args in
+                    self.db._execute_patch_group.call_args_list]),
+            [('data', 'status'), ('status',)]
+        )
+
+    def test_skips_fetch_if_not_return_items(self):
+        result = self.db.patch_items(
+            item_type='job',
+            keyed_patches={self.jobs[0]['key']: {'status': 'RUNNING'}},
+            return_items=False
+        )
+        self.assertEqual(result, {})
+
+    def test_updates_job_hash_for_hash_components(self):
+        patched_jobs = self.db.patch_items(
+            item_type='job',
+            keyed_patches={
+                self.jobs[0]['key']: {'job_type': 'some.job_type'},
+                self.jobs[1]['key']: {'status': 'RUNNING'},
+            }
+        )
+        self.assertIsNotNone(patched_jobs[self.jobs[0]['key']]['job_hash'])
+        self.assertIsNone(patched_jobs[self.jobs[1]['key']]['job_hash'])
+
+    def test_patches_non_column_fields_through_orm(self):
+        keyed_patches = {
+            self.jobs[0]['key']: {'status': 'RUNNING', 'not_a_column': 1},
+            self.jobs[1]['key']: {'status': 'RUNNING'},
+        }
+        self.db.patch_item = MagicMock()
+        self.db._execute_patch_group = MagicMock()
+        self.db.patch_items(item_type='job', keyed_patches=keyed_patches,
+                            return_items=False)
+        self.assertEqual(
+            self.db.patch_item.call_args_list,
+            [call(item_type='job', key=self.jobs[0]['key'],
+                  patches=keyed_patches[self.jobs[0]['key']])]
+        )
+        self.assertEqual(
+            self.db._execute_patch_group.call_args[1]['keyed_patches'],
+            {self.jobs[1]['key']: {'status': 'RUNNING'}}
+        )
+
+    def test_raises_for_missing_keys(self):
+        for patches in [{'status': 'RUNNING'}, {'job_type': 'some.job_type'}]:
+            keyed_patches = {self.jobs[0]['key']: patches,
+                             'missing_key': patches}
+            with self.assertRaises(self.db.ItemNotFoundError):
+                self.db.patch_items(item_type='job',
+                                    keyed_patches=keyed_patches)
+            self.assertEqual(
+                self.db.get_item_by_key(item_type='job',
+                                        key=self.jobs[0]['key']),
+                self.jobs[0])
+
+    def test_checks_existing_keys_if_rowcount_is_off(self):
+        self.db.engine.dialect.supports_sane_multi_rowcount = False
+        self.addCleanup(setattr, self.db.engine.dialect,
+                        'supports_sane_multi_rowcount', True)
+        self.db.patch_items(
+            item_type='job',
+            keyed_patches={self.jobs[0]['key']: {'status': 'RUNNING'}})
+        with self.assertRaises(self.db.ItemNotFoundError):
+            self.db.patch_items(item_type='job',
+                                keyed_patches={'missing_key': {'label': 'x'}})
+
+
 class JobQueueTestCase(BaseTestCase):
     def setUp(self):
         super().setUp()
@@ -101,6 +289,66 @@ class JobQueueTestCase(BaseTestCase):
         expected_keys = sorted([flow['key'] for flow in flows])
         self.assertEqual(actual_keys, expected_keys)
 
+    def test_claim_queue_items_w_limit(self):
+        queue_kwargs = {'label': 'initial_label',
+                        'queue_spec': {'item_type': 'job'}}
+        queue = self._create_queue(queue_kwargs=queue_kwargs)
+        jobs = [
+            self.db.create_item(
+                item_type='job', item_kwargs={'label': 'job_%s' % i})
+            for i in range(3)
+        ]
+        claimed_keys = []
+        for expected_num_claimed in [2, 1, 0]:
+            claimed_jobs = self.db.claim_queue_items(
+                queue_key=queue['key'], limit=2)['items']
+            self.assertEqual(len(claimed_jobs), expected_num_claimed)
+            self.assertTrue(all(job['claimed'] for job in claimed_jobs))
+            claimed_keys.extend([job['key'] for job in claimed_jobs])
+        self.assertEqual(sorted(claimed_keys),
+                         sorted([job['key'] for job in jobs]))
+
+    def test_compare_and_set_skips_items_claimed_by_others(self):
+        jobs = [
+            self.db.create_item(
+                item_type='job', item_kwargs={'label': 'job_%s' % i})
+            for i in range(2)
+        ]
+        self.db.patch_item(item_type='job', key=jobs[0]['key'],
+                           patches={'claimed': True})
+        claimed_jobs = self.db._compare_and_set_claims(
+            table=self.db.models.Job.__table__, items=jobs)
+        self.assertEqual([job['key'] for job in claimed_jobs],
+                         [jobs[1]['key']])
+
+    def test_patch_after_claim_releases_cached_item(self):
+        queue_kwargs = {'label': 'initial_label',
+                        'queue_spec': {'item_type': 'job'}}
+        queue = self._create_queue(queue_kwargs=queue_kwargs)
+        job = self.db.create_item(item_type='job', item_kwargs={})
+        cached_job = (self.db.session.query(self.db.models.Job)
+                      .filter_by(key=job['key']).first())
+        self.db.claim_queue_items(queue_key=queue['key'])
+        self.db.patch_item(item_type='job', key=job['key'],
+                           patches={'claimed': False})
+        self.assertFalse(cached_job.claimed)
+        claimed_jobs = self.db.claim_queue_items(
+            queue_key=queue['key'])['items']
+        self.assertEqual([job['key'] for job in claimed_jobs], [job['key']])
+
+    def test_update_returning_claim_statement(self):
+        from sqlalchemy.dialects import postgresql
+        queue = {'queue_spec': {'item_type': 'job'}}
+        statement = self.db._generate_update_returning_claim_statement(
+            Model=self.db.models.Job,
+            claimable_query=self.db.generate_queue_claim_query(queue=queue),
+            limit=2
+        )
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+        self.assertIn('FOR UPDATE OF job SKIP LOCKED', sql)
+        self.assertIn('LIMIT', sql)
+        self.assertIn('RETURNING', sql)
+
 
 class FlowQueueTestCase(BaseTestCase):
     def setUp(self):
@@ -140,6 +388,43 @@ class FlowQueueTestCase(BaseTestCase):
         expected_keys = sorted([flow['key'] for flow in flows])
         self.assertEqual(actual_keys, expected_keys)
 
+    def test_claim_queue_items_w_order_by(self):
+        queue_kwargs = {'label': 'initial_label',
+                        'queue_spec': {'item_type': 'flow'}}
+        queue = self._create_queue(queue_kwargs=queue_kwargs)
+        flows = [
+            self.db.create_item(
+                item_type='flow',
+                item_kwargs={'label': 'flow_%s' % i, 'depth': i}
+            )
+            for i in range(3)
+        ]
+        claimed_flows = self.db.claim_queue_items(
+            queue_key=queue['key'], limit=1,
+            order_by={'field': 'depth', 'direction': 'desc'}
+        )['items']
+        self.assert_flow_lists_match(claimed_flows, [flows[2]])
+
+    def test_claim_queue_items_w_queue_spec_claim_params(self):
+        queue_kwargs = {
+            'label': 'initial_label',
+            'queue_spec': {
+                'item_type': 'flow',
+                'claim_limit': 2,
+                'claim_order_by': {'field': 'depth', 'direction': 'asc'},
+            }
+        }
+        queue = self._create_queue(queue_kwargs=queue_kwargs)
+        flows = [
+            self.db.create_item(
+                item_type='flow',
+                item_kwargs={'label': 'flow_%s' % i, 'depth': 2 - i}
+            )
+            for i in range(3)
+        ]
+        claimed_flows = self._claim_flows(queue=queue)
+        self.assert_flow_lists_match(claimed_flows, flows[1:])
+
     def test_locks(self):
         queue_kwargs = {'label': 'initial_label',
                         'queue_spec': {'item_type': 'flow'}}
@@ -163,6 +448,108 @@ class FlowQueueTestCase(BaseTestCase):
             claimed_flows, [unlocked_flow, flow_to_unlock])
         self._release_flows(flows=claimed_flows)
 
+    def test_maintains_active_lock_count(self):
+        flow = self.db.create_item(item_type='flow', item_kwargs={})
+        self.db.create_locks(locks=[
+            {'lockee_key': flow['key'], 'locker_key': 'locker_%s' % i}
+            for i in range(3)
+        ])
+        lock_meta = self.db.create_lock(lockee_key=flow['key'],
+                                        locker_key='locker_3')
+        self.assertEqual(
+            self.db.get_item_by_key(item_type='lock',
+                                    key=lock_meta['key'])['locker_key'],
+            'locker_3')
+        self.assertEqual(self._get_active_lock_count(flow=flow), 4)
+        self.db.release_locks(locker_keys=['locker_0', 'locker_1'])
+        self.assertEqual(self._get_active_lock_count(flow=flow), 2)
+        self.assertEqual(self.db.get_lock_count_mismatches(), {})
+
+    def _get_active_lock_count(self, flow=None):
+        return self.db.get_item_by_key(
+            item_type='flow', key=flow['key'])['active_lock_count']
+
+    def test_rebuilds_lock_counts(self):
+        flow = self.db.create_item(item_type='flow', item_kwargs={})
+        self.db.create_lock(lockee_key=flow['key'], locker_key='locker')
+        self.db.patch_item(item_type='flow', key=flow['key'],
+                           patches={'active_lock_count': 5})
+        self.assertEqual(
+            self.db.get_lock_count_mismatches(),
+            {flow['key']: {'active_lock_count': 5, 'lock_count': 1}}
+        )
+        self.db.rebuild_lock_counts()
+        self.assertEqual(self._get_active_lock_count(flow=flow), 1)
+        self.assertEqual(self.db.get_lock_count_mismatches(), {})
+
+    def test_claims_only_dirty_flows_if_dirty_only(self):
+        queue = self._create_queue(queue_kwargs={
+            'queue_spec': {'item_type': 'flow'}})
+        parent_flow = self.db.create_item(item_type='flow', item_kwargs={})
+        other_flow = self.db.create_item(item_type='flow', item_kwargs={})
+        self.assertTrue(self.db.has_claimable_queue_items(
+            queue_key=queue['key'], dirty_only=True))
+        claimed_flows = self._claim_flows(queue=queue)
+        self.assertTrue(all(not flow['dirty'] for flow in claimed_flows))
+        self._release_flows(flows=claimed_flows)
+        self.assertFalse(self.db.has_claimable_queue_items(
+            queue_key=queue['key'], dirty_only=True))
+        self.assertTrue(self.db.has_claimable_queue_items(
+            queue_key=queue['key']))
+        job = self.db.create_item(item_type='job', item_kwargs={
+            'parent_key': parent_flow['key']})
+        self.db.mark_parent_flows_dirty(item_type='job', keys=[job['key']])
+        claimed_flows = self.db.claim_queue_items(
+            queue_key=queue['key'], dirty_only=True)['items']
+        self.assert_flow_lists_match(claimed_flows, [parent_flow])
+        self._release_flows(flows=claimed_flows)
+        self.assertEqual(
+            self.db.claim_queue_items(
+                queue_key=queue['key'], dirty_only=True)['items'],
+            [])
+        self.assert_flow_lists_match(self._claim_flows(queue=queue),
+                                     [parent_flow, other_flow])
+
+    def test_claims_only_changed_flows_if_changed_only(self):
+        queue = self._create_queue(queue_kwargs={
+            'queue_spec': {'item_type': 'flow'}})
+        parent_flow = self.db.create_item(item_type='flow', item_kwargs={})
+        job = self.db.create_item(item_type='job', item_kwargs={
+            'parent_key': parent_flow['key']})
+        self.db.patch_item(item_type='flow', key=parent_flow['key'],
+                           patches={'child_watermark': job['modified']})
+        new_flow = self.db.create_item(item_type='flow', item_kwargs={})
+        claimed_flows = self.db.claim_queue_items(
+            queue_key=queue['key'], changed_only=True)['items']
+        self.assert_flow_lists_match(claimed_flows, [new_flow])
+        self.assertFalse(self.db.has_claimable_queue_items(
+            queue_key=queue['key'], changed_only=True))
+        self.db.patch_item(item_type='job', key=job['key'],
+                           patches={'modified': job['modified'] + 1})
+        self.assertFalse(self.db.has_claimable_queue_items(
+            queue_key=queue['key'], changed_only=True))
+        self.db.patch_item(item_type='job', key=job['key'],
+                           patches={'status': 'COMPLETED',
+                                    'modified': job['modified'] + 2})
+        claimed_flows = self.db.claim_queue_items(
+            queue_key=queue['key'], changed_only=True)['items']
+        self.assert_flow_lists_match(claimed_flows, [parent_flow])
+
+    def test_mark_parent_flows_dirty_keeps_modified(self):
+        parent_flow = self.db.create_item(item_type='flow', item_kwargs={
+            'dirty': False})
+        child_flow = self.db.create_item(item_type='flow', item_kwargs={
+            'parent_key': parent_flow['key'], 'dirty': False})
+        self.db.mark_parent_flows_dirty(item_type='flow',
+                                        keys=[child_flow['key']])
+        self.db.session.expire_all()
+        for flow, expected_dirty in [(parent_flow, True),
+                                     (child_flow, False)]:
+            fetched_flow = self.db.get_item_by_key(item_type='flow',
+                                                   key=flow['key'])
+            self.assertEqual(fetched_flow['dirty'], expected_dirty)
+            self.assertEqual(fetched_flow['modified'], flow['modified'])
+
     def assert_flow_lists_match(self, flows_a, flows_b):
         self.assertEqual(sorted([flow['key'] for flow in flows_a]),
                          sorted([flow['key'] for flow in flows_b]))
@@ -215,3 +602,270 @@ class ExecuteActionTestCase(BaseTestCase):
         self.db.execute_action(action=action)
         self.assertEqual(self.db.upsert.call_args,
                          call(**action['params'], commit=False))
+
+
+class QueryPlanTestCase(BaseTestCase):
+    """Fails if a hot query regresses to a table scan."""
+
+    def _explain(self, query=None):
+        statement = getattr(query, 'statement', query)
+        compiled = statement.compile(dialect=self.db.engine.dialect,
+                                     compile_kwargs={'literal_binds': True})
+        rows = self.db.session.execute('EXPLAIN QUERY PLAN ' + str(compiled))
+        return [row[-1] for row in rows]
+
+    def _assert_uses_index(self, query=None, table_name=None):
+        plan = self._explain(query=query)
+        table_steps = [step for step in plan
+                       if step.split()[1:2] == [table_name]
+                       or step.split()[1:3] == ['TABLE', table_name]]
+        self.assertTrue(table_steps, plan)
+        for step in table_steps:
+            self.assertTrue(step.startswith('SEARCH'), plan)
+            self.assertIn('INDEX', step, plan)
+
+    def test_claim_queries(self):
+        for item_type in ['flow', 'job']:
+            queue = {'queue_spec': {'item_type': item_type}}
+            query = self.db.query_builder.alter_query_per_query_spec(
+                query=self.db.generate_queue_claim_query(queue=queue),
+                query_spec={'order_by': self.db.DEFAULT_CLAIM_ORDER_BY}
+            )
+            table = self.db.get_model_for_item_type(item_type).__table__
+            self._assert_uses_index(
+                query=query.with_entities(*table.columns).limit(10),
+                table_name=item_type
+            )
+
+    def test_lock_release_query(self):
+        Lock = self.db.models.Lock
+        self._assert_uses_index(
+            query=(self.db.session.query(Lock.__table__.c.lockee_key)
+                   .filter(Lock.locker_key.in_(['locker_1', 'locker_2']))),
+            table_name='lock'
+        )
+        self._assert_uses_index(
+            query=(self.db.session.query(Lock.__table__.c.key)
+                   .filter(Lock.lockee_key == 'lockee')),
+            table_name='lock'
+        )
+
+    def test_parent_key_queries(self):
+        for item_type in ['flow', 'job']:
+            query = self.db.generate_item_query(item_type=item_type, query_spec={
+                'filters': [{'field': 'parent_key', 'op': '=', 'arg': 'p'}]
+            })
+            self._assert_uses_index(query=query, table_name=item_type)
+
+    def test_request_tag_query(self):
+        Request = self.db.models.Request
+        self._assert_uses_index(
+            query=(self.db.session.query(Request.__table__.c.key)
+                   .filter(Request.request_tag == 'some_tag')),
+            table_name='request'
+        )
+
+
+class MigrateTablesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = _sqla.create_engine('sqlite://')
+        self.db = db.Db(engine=self.engine)
+        self._create_legacy_flow_table()
+
+    def _create_legacy_flow_table(self):
+        legacy_metadata = _sqla.MetaData()
+        legacy_columns = [
+            column.copy() for column in self.db.models.Flow.__table__.columns
+            if column.name != 'active_lock_count'
+        ]
+        for column in legacy_columns:
+            column.index = None
+        self.legacy_flow_table = _sqla.Table('flow', legacy_metadata,
+                                             *legacy_columns)
+        legacy_metadata.create_all(self.engine)
+
+    def test_adds_missing_columns_and_indexes(self):
+        migration_result = self.db.ensure_tables()
+        self.assertEqual(migration_result['added_columns'],
+                         ['flow.active_lock_count'])
+        self.assertEqual(
+            sorted(migration_result['added_indexes']),
+            sorted([index.name for index in
+                    self.db.models.Flow.__table__.indexes])
+        )
+        inspector = _sqla.inspect(self.engine)
+        self.assertIn('active_lock_count', [
+            column['name'] for column in inspector.get_columns('flow')])
+        flow = self.db.create_item(item_type='flow', item_kwargs={})
+        self.assertEqual(flow['active_lock_count'], 0)
+
+    def test_is_idempotent(self):
+        self.db.ensure_tables()
+        self.assertEqual(self.db.migrate_tables(), {
+            'added_columns': [], 'added_indexes': [], 'skipped_columns': []})
+
+    def test_backfills_zero_lock_counts_without_lock_table(self):
+        self.engine.execute(self.legacy_flow_table.insert(),
+                            [{'key': 'some_flow'}])
+        self.db.migrate_tables()
+        self.assertEqual(
+            list(self.engine.execute('SELECT active_lock_count FROM flow')),
+            [(0,)]
+        )
+
+
+class MigrateLegacyLockCountsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = _sqla.create_engine('sqlite://')
+        self.db = db.Db(engine=self.engine, ensure_tables=True)
+        self.flows = {
+            label: self.db.create_item(
+                item_type='flow',
+                item_kwargs={'label': label, 'num_tickable_tasks': 1})
+            for label in ['locked', 'unlocked']
+        }
+        self.db.create_lock(lockee_key=self.flows['locked']['key'],
+                            locker_key='some_locker')
+        self.db.session.commit()
+        # Make a db from before flows had active_lock_count.
+        self.db.session.close()
+        self.engine.execute('ALTER TABLE flow DROP COLUMN active_lock_count')
+
+    def get_lock_counts(self):
+        return {
+            flow['label']: flow['active_lock_count']
+            for flow in self.db.query_items(item_type='flow')
+        }
+
+    def test_backfills_active_lock_counts(self):
+        self.db.ensure_tables()
+        self.assertEqual(self.get_lock_counts(), {'locked': 1, 'unlocked': 0})
+        self.db.release_locks(locker_keys=['some_locker'])
+        self.assertEqual(self.get_lock_counts(), {'locked': 0, 'unlocked': 0})
+
+    def test_keeps_locked_flows_unclaimable(self):
+        self.db.ensure_tables()
+        query = self.db.generate_flow_queue_claim_query()
+        self.assertEqual([flow.label for flow in query],
+                         ['unlocked'])
+
+
+class UnitOfWorkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        db_uri = 'sqlite:///%s' % os.path.join(self.tmp_dir, 'mc.db.sqlite')
+        self.db = db.Db(db_uri=db_uri, ensure_tables=True)
+
+    def test_uses_unit_of_work_session_within_block(self):
+        with self.db.unit_of_work() as session:
+            self.assertIs(self.db.session, session)
+            with self.db.unit_of_work() as inner_session:
+                self.assertIs(self.db.session, inner_session)
+            self.assertIs(self.db.session, session)
+        self.assertIs(self.db.session, self.db.ScopedSession())
+
+    def test_commits_on_success(self):
+        with self.db.unit_of_work():
+            flow = self.db.create_item(item_type='flow', item_kwargs={})
+        with self.db.unit_of_work():
+            self.assertEqual(
+                self.db.get_item_by_key(item_type='flow',
+                                        key=flow['key'])['key'],
+                flow['key'])
+
+    def test_rolls_back_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with self.db.unit_of_work() as session:
+                session.add(self.db.models.Flow())
+                session.flush()
+                raise RuntimeError()
+        with self.db.unit_of_work():
+            self.assertEqual(self.db.query_items(item_type='flow'), [])
+
+    def test_closes_session(self):
+        with self.db.unit_of_work() as session:
+            flow = self.db.models.Flow()
+            session.add(flow)
+            session.flush()
+            self.assertTrue(len(session.identity_map) > 0)
+        self.assertEqual(len(session.identity_map), 0)
+
+    def test_scoped_sessions_are_per_thread(self):
+        thread_sessions = []
+        thread = threading.Thread(
+            target=lambda: thread_sessions.append(self.db.session))
+        thread.start()
+        thread.join()
+        self.assertIsNot(thread_sessions[0], self.db.session)
+
+
+class EngineKwargsTestCase(unittest.TestCase):
+    def test_passes_engine_kwargs_to_create_engine(self):
+        engine_kwargs = {'pool_pre_ping': True, 'pool_recycle': 3600}
+        _db = db.Db(db_uri='sqlite://', engine_kwargs=engine_kwargs)
+        with patch.object(db, 'create_engine') as mock_create_engine:
+            self.assertEqual(_db.engine, mock_create_engine.return_value)
+        self.assertEqual(mock_create_engine.call_args,
+                         call('sqlite://', **engine_kwargs))
+
+
+class StreamingQueryTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db.create_items(item_type='flow', items_kwargs=[
+            {'label': 'flow_%s' % i, 'status': status, 'graph': {'i': i}}
+            for i, status in enumerate(['PENDING', 'RUNNING', 'COMPLETED'])
+        ])
+        self.unfinished_query = {'filters': [
+            {'field': 'status', 'op': '! IN', 'arg': ['COMPLETED', 'FAILED']}
+        ]}
+
+    def test_iter_items_matches_query_items(self):
+        self.assertEqual(
+            sorted(self.db.iter_items(item_type='flow', yield_per=2),
+                   key=lambda item: item['key']),
+            sorted(self.db.query_items(item_type='flow'),
+                   key=lambda item: item['key'])
+        )
+
+    def test_iter_items_projects_fields(self):
+        items = list(self.db.iter_items(
+            item_type='flow', query={**self.unfinished_query,
+                                     'order_by': {'field': 'label'}},
+            fields=['label', 'status']
+        ))
+        self.assertEqual(items, [{'label': 'flow_0', 'status': 'PENDING'},
+                                 {'label': 'flow_1', 'status': 'RUNNING'}])
+
+    def test_iter_items_does_not_load_instances(self):
+        self.db.session.expunge_all()
+        list(self.db.iter_items(item_type='flow'))
+        self.assertEqual(len(self.db.session.identity_map), 0)
+
+    def test_count_items(self):
+        self.assertEqual(self.db.count_items(item_type='flow'), 3)
+        self.assertEqual(
+            self.db.count_items(item_type='flow',
+                                query=self.unfinished_query),
+            2
+        )
+        self.assertEqual(self.db.count_items(item_type='job'), 0)
+
+    def test_exists_items(self):
+        self.assertTrue(self.db.exists_items(item_type='flow',
+                                             query=self.unfinished_query))
+        self.assertFalse(self.db.exists_items(item_type='flow', query={
+            'filters': [{'field': 'status', 'op': '=', 'arg': 'FAILED'}]}))
+        self.assertFalse(self.db.exists_items(item_type='job'))
+
+    def test_get_items_by_keys(self):
+        flows = self.db.query_items(item_type='flow')[:2]
+        items = self.db.get_items_by_keys(
+            item_type='flow',
+            keys=[*[flow['key'] for flow in flows], 'missing_key'],
+            fields=['status'], batch_size=1)
+        self.assertEqual(items, {
+            flow['key']: {'key': flow['key'], 'status': flow['status']}
+            for flow in flows
+        })
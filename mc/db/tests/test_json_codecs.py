@@ -0,0 +1,143 @@
+import json
+import math
+import unittest
+
+from .. import json_codecs
+from .. import db
+
+
+class JsonCodecTestCase(unittest.TestCase):
+    def setUp(self):
+        self.value = {'b': [1, 2.5, None, True], 'a': {'nested': 'str'}}
+
+    def test_round_trips(self):
+        codec = json_codecs.JsonCodec()
+        self.assertEqual(codec.decode(codec.encode(self.value)), self.value)
+
+    def test_encodes_with_sorted_keys(self):
+        encoded = json_codecs.JsonCodec().encode(self.value)
+        self.assertLess(encoded.index('"a"'), encoded.index('"b"'))
+
+    def test_falls_back_to_stdlib_json(self):
+        def failing_dumps(value): raise TypeError()
+        codec = json_codecs.JsonCodec(json_fns={'dumps': failing_dumps,
+                                                'loads': json.loads})
+        self.assertEqual(codec.decode(codec.encode(self.value)), self.value)
+
+    def test_round_trips_non_finite_floats(self):
+        value = {'nan': float('nan'), 'inf': float('inf'),
+                 'neg_inf': [float('-inf')], 'none': None}
+        codec = json_codecs.JsonCodec()
+        decoded = codec.decode(codec.encode(value))
+        self.assertTrue(math.isnan(decoded['nan']))
+        self.assertEqual(decoded['inf'], float('inf'))
+        self.assertEqual(decoded['neg_inf'], [float('-inf')])
+        self.assertIsNone(decoded['none'])
+
+    def test_compresses_above_threshold(self):
+        codec = json_codecs.JsonCodec(compression='zlib',
+                                      compression_threshold=100)
+        small_value = {'a': 1}
+        self.assertEqual(codec.encode(small_value),
+                         json_codecs.JsonCodec().encode(small_value))
+        large_value = {'a': 'x' * 1000}
+        encoded = codec.encode(large_value)
+        self.assertTrue(encoded.startswith('~zlib:'))
+        self.assertLess(len(encoded), 1000)
+        self.assertEqual(codec.decode(encoded), large_value)
+
+    def test_decodes_uncompressed_legacy_text(self):
+        codec = json_codecs.JsonCodec(compression='zlib')
+        legacy_text = json.dumps(self.value, sort_keys=True)
+        self.assertEqual(codec.decode(legacy_text), self.value)
+
+    def test_decodes_any_known_compression(self):
+        zlib_codec = json_codecs.JsonCodec(compression='zlib')
+        codec = json_codecs.JsonCodec()
+        self.assertEqual(codec.decode(zlib_codec.encode(self.value)),
+                         self.value)
+
+
+class ConfigureCompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.orig_codec = json_codecs.get_codec('large')
+        self.addCleanup(json_codecs.set_codec, 'large', self.orig_codec)
+
+    def test_large_codec_is_uncompressed_by_default(self):
+        self.assertIsNone(self.orig_codec.compression)
+
+    def test_sets_compression(self):
+        json_codecs.configure_compression(compression='zlib')
+        codec = json_codecs.get_codec('large')
+        self.assertEqual(codec.compression, 'zlib')
+        self.assertEqual(codec.compression_threshold,
+                         json_codecs.DEFAULT_COMPRESSION_THRESHOLD)
+
+    def test_sets_compression_per_engine(self):
+        engine = db.Db(db_uri='sqlite://').engine
+        other_engine = db.Db(db_uri='sqlite://').engine
+        json_codecs.configure_compression(compression='zlib', engine=engine)
+        self.assertEqual(
+            json_codecs.get_codec('large', dialect=engine.dialect).compression,
+            'zlib')
+        self.assertIsNone(json_codecs.get_codec(
+            'large', dialect=other_engine.dialect).compression)
+        self.assertIsNone(json_codecs.get_codec('large').compression)
+
+
+class DefaultCodecTestCase(unittest.TestCase):
+    def test_encodes_like_stdlib_json(self):
+        value = {'b': [1, 2.5, None], 'a': {'nested': 'str/\u00e9'}}
+        self.assertEqual(json_codecs.get_codec().encode(value),
+                         json.dumps(value, sort_keys=True))
+
+
+class JsonColumnTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = db.Db(db_uri='sqlite://', ensure_tables=True)
+        self.orig_codec = json_codecs.get_codec('large')
+        json_codecs.set_codec('large', json_codecs.JsonCodec(
+            compression='zlib', compression_threshold=100))
+
+    def tearDown(self):
+        json_codecs.set_codec('large', self.orig_codec)
+
+    def test_stores_compressed_graph(self):
+        graph = {'tasks': {str(i): {'key': str(i)} for i in range(100)}}
+        flow = self.db.create_item(item_type='flow',
+                                   item_kwargs={'graph': graph})
+        raw_graph = self.db.session.execute(
+            'SELECT graph FROM flow WHERE key = :key',
+            {'key': flow['key']}
+        ).scalar()
+        self.assertTrue(raw_graph.startswith('~zlib:'))
+        fetched_flow = self.db.get_item_by_key(item_type='flow',
+                                               key=flow['key'])
+        self.assertEqual(fetched_flow['graph'], graph)
+
+
+class PerDbJsonCompressionTestCase(unittest.TestCase):
+    def _get_raw_graph(self, mc_db=None, graph=None):
+        flow = mc_db.create_item(item_type='flow',
+                                 item_kwargs={'graph': graph})
+        self.assertEqual(
+            mc_db.get_item_by_key(item_type='flow', key=flow['key'])['graph'],
+            graph)
+        return mc_db.session.execute(
+            'SELECT graph FROM flow WHERE key = :key',
+            {'key': flow['key']}
+        ).scalar()
+
+    def test_only_compresses_for_configured_db(self):
+        graph = {'tasks': {str(i): {'key': str(i)} for i in range(100)}}
+        compressing_db = db.Db(
+            db_uri='sqlite://', ensure_tables=True,
+            json_compression={'compression': 'zlib',
+                              'compression_threshold': 100})
+        other_db = db.Db(db_uri='sqlite://', ensure_tables=True)
+        self.assertTrue(
+            self._get_raw_graph(mc_db=compressing_db,
+                                graph=graph).startswith('~zlib:'))
+        self.assertFalse(
+            self._get_raw_graph(mc_db=other_db,
+                                graph=graph).startswith('~zlib:'))
@@ -56,3 +56,15 @@ class FiltersTestCase(BaseTestCase):
         )
         results = q.all()
         self.assertEqual(set(results), set([self.instances['instance_1']]))
+
+
+class OrderByTestCase(FiltersTestCase):
+    def test_order_by(self):
+        for direction, expected_int_attrs in [('asc', [0, 1, 2]),
+                                              ('desc', [2, 1, 0])]:
+            q = self.query_builder.alter_query_per_order_by(
+                query=self.session.query(MyModel),
+                order_by={'field': 'int_attr', 'direction': direction}
+            )
+            self.assertEqual([result.int_attr for result in q],
+                             expected_int_attrs)
@@ -1,4 +1,3 @@
-import json
 import uuid
 import time
 
@@ -11,6 +10,7 @@ from sqlalchemy.orm.collections import attribute_mapped_collection
 
 from .base import class_registry, Base
 from . import constants
+from . import json_codecs
 
 
 def _time(): return time.time()
@@ -24,6 +24,10 @@ def generate_int_column(*args, length=None, **kwargs):
     return _sqla.Column(*args, _sqla.types.Integer, **kwargs)
 
 
+def generate_float_column(*args, **kwargs):
+    return _sqla.Column(*args, _sqla.types.Float(), **kwargs)
+
+
 def generate_str_column(*args, length=None, **kwargs):
     return _sqla.Column(*args, _sqla.types.String(length=length), **kwargs)
 
@@ -33,22 +37,37 @@ def generate_boolean_column(*args, **kwargs):
                         **{'default': False, **kwargs})
 
 
-def generate_json_column(*args, **kwargs):
-    return _sqla.Column(*args, JSONEncodedDict(),
+def generate_json_column(*args, codec_name=None, **kwargs):
+    return _sqla.Column(*args, JSONEncodedDict(codec_name=codec_name),
                         **{'default': {}, 'nullable': True, **kwargs})
 
 
 class JSONEncodedDict(_sqla.TypeDecorator):
     impl = _sqla.VARCHAR
 
+    def __init__(self, *args, codec_name=None, **kwargs):
+        """
+        Args:
+            codec_name (str, optional): name of a codec in
+                :data:`mc.db.json_codecs.CODECS`. Looked up on each use, for
+                the engine's dialect, so codecs can be reconfigured after
+                models are defined, and per engine. Default: 'default'.
+        """
+        super().__init__(*args, **kwargs)
+        self.codec_name = codec_name
+
+    def get_codec(self, dialect=None):
+        return json_codecs.get_codec(codec_name=self.codec_name,
+                                     dialect=dialect)
+
     def process_bind_param(self, value, dialect):
         if value is not None:
-            value = json.dumps(value, sort_keys=True)
+            value = self.get_codec(dialect=dialect).encode(value)
         return value
 
     def process_result_value(self, value, dialect):
         if value is not None:
-            value = json.loads(value)
+            value = self.get_codec(dialect=dialect).decode(value)
         return value
 
 
@@ -57,6 +76,13 @@ def generate_status_column(*args,  **kwargs):
                         **{'default': 'PENDING', 'nullable': True, **kwargs})
 
 
+def generate_claiming_index(table_name=None):
+    """Index for claim queries: filter on status and claimed, order by
+    modified."""
+    return _sqla.Index('ix_%s_status_claimed_modified' % table_name,
+                       'status', 'claimed', 'modified')
+
+
 def generate_uuid(): return str(uuid.uuid4())
 
 
@@ -301,7 +327,8 @@ class TagsMixin(object):
                 '__tablename__': "%s_tag" % cls.__tablename__,
                 'parent_key': _sqla.Column(
                     _sqla.String(length=constants.KEY_LENGTH),
-                    _sqla.ForeignKey("%s.key" % cls.__tablename__)
+                    _sqla.ForeignKey("%s.key" % cls.__tablename__),
+                    index=True
                 ),
                 'parent': _orm.relationship(cls)
             }
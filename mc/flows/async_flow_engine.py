@@ -0,0 +1,182 @@
+import asyncio
+from concurrent import futures
+import functools
+import inspect
+import time
+import traceback
+
+from .flow_engine import FlowEngine
+
+
+class AsyncFlowEngine(FlowEngine):
+    """A FlowEngine that ticks tasks concurrently, with asyncio.
+
+    The RUNNING tasks of a flow are ticked concurrently, and
+    :meth:`tick_flows` ticks several flows concurrently. The number of task
+    ticks in flight is bounded by max_concurrent_tasks.
+
+    Async task handlers define :code:`async def tick_task(task_ctx=None,
+    **kwargs)`, e.g. subclasses of
+    :class:`mc.task_handlers.base_async_task_handler.BaseAsyncTaskHandler`.
+    Sync task handlers are called on a thread pool, so they do not block the
+    event loop.
+
+    Tick methods are coroutines, and must be awaited. Flow bookkeeping, like
+    status changes, happens on the event loop thread.
+    """
+
+    def __init__(self, *args, max_concurrent_tasks=100, executor=None,
+                 sync_handler_ctx_fn=None, **kwargs):
+        """
+        Args:
+            max_concurrent_tasks (int, optional): maximum number of task ticks
+                to run at once. Default: 100.
+            executor (concurrent.futures.Executor, optional): executor for
+                calling sync task handlers. Default: a ThreadPoolExecutor
+                with max_concurrent_tasks workers.
+            sync_handler_ctx_fn (callable, optional): fn that returns a
+                context manager to call each sync task handler in, e.g.
+                mc_db.unit_of_work, so that handlers get a db session for
+                their executor thread. Default: None.
+            *args, **kwargs: as for :class:`FlowEngine`.
+        """
+        super().__init__(*args, **kwargs)
+        self.max_concurrent_tasks = max_concurrent_tasks
+        self.executor = executor
+        self.sync_handler_ctx_fn = sync_handler_ctx_fn
+        self._semaphores = {}
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = futures.ThreadPoolExecutor(
+                max_workers=self.max_concurrent_tasks)
+        return self.executor
+
+    def get_semaphore(self):
+        # Semaphores belong to an event loop, so keep one per loop.
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(
+                self.max_concurrent_tasks)
+        return self._semaphores[loop]
+
+    async def run_flow(self, flow=None, task_ctx=None, max_ticks=5e2,
+                       tick_kwargs=None):
+        """Async version of :meth:`FlowEngine.run_flow`."""
+        completed_statuses = {'COMPLETED', 'FAILED'}
+        tick_counter = 0
+        while flow.status not in completed_statuses:
+            tick_counter += 1
+            await self.tick_flow(flow=flow, task_ctx=task_ctx,
+                                 **(tick_kwargs or {}))
+            if tick_counter > max_ticks:
+                raise Exception("Exceeed max ticks")
+        if flow.status == 'FAILED':
+            raise self.FlowError(flow=flow)
+
+    async def tick_flows(self, flows=None, task_ctx=None, **tick_kwargs):
+        """Tick several flows concurrently.
+
+        Deeper flows, i.e. nested subflows, are started first, so their tasks
+        get the first task tick slots.
+
+        Args:
+            flows (list): flows to tick.
+            task_ctx (dict, optional): task_ctx to include when ticking flows
+            **tick_kwargs: kwargs to pass to the tick_task calls.
+        """
+        await asyncio.gather(*[
+            self.tick_flow(flow=flow, task_ctx=task_ctx, **tick_kwargs)
+            for flow in sorted(flows, key=lambda flow: -(flow.depth or 0))
+        ])
+
+    async def tick_flow(self, flow=None, task_ctx=None, **tick_kwargs):
+        """Async version of :meth:`FlowEngine.tick_flow`."""
+        try:
+            self.start_flow_tick(flow=flow)
+            await self.tick_running_tasks(flow=flow, task_ctx=task_ctx,
+                                          **tick_kwargs)
+            self.finish_flow_tick(flow=flow)
+        except Exception as exception:
+            self.handle_flow_tick_exception(flow=flow, exception=exception)
+
+    async def tick_flow_until_has_no_pending(self, flow=None, task_ctx=None,
+                                             tick_kwargs=None, deadline=None):
+        """Async version of :meth:`FlowEngine.tick_flow_until_has_no_pending`.
+        """
+        tick_flow_kwargs = {'flow': flow, 'task_ctx': task_ctx,
+                            **(tick_kwargs or {})}
+        await self.tick_flow(**tick_flow_kwargs)
+        while (
+            flow.status in {'PENDING', 'RUNNING'}
+            and len(self.get_startable_pending_tasks(flow=flow)) > 0
+        ):
+            if deadline is not None and time.time() >= deadline:
+                break
+            await self.tick_flow(**tick_flow_kwargs)
+
+    async def tick_running_tasks(self, flow=None, task_ctx=None,
+                                 **tick_kwargs):
+        """Tick a flow's RUNNING tasks concurrently.
+
+        If task ticks raise errors, waits for the other ticks to finish
+        before raising the first error.
+        """
+        tick_coroutines = []
+        for task in flow.get_tasks_by_status(status='RUNNING'):
+            if self.task_is_running(task=task):
+                tick_coroutines.append(self.tick_task(
+                    task=task, flow=flow, task_ctx=task_ctx, **tick_kwargs))
+            else:
+                self.complete_task(flow=flow, task=task)
+        results = await asyncio.gather(*tick_coroutines,
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    async def tick_task(self, task=None, flow=None, task_ctx=None,
+                        **tick_kwargs):
+        """Async version of :meth:`FlowEngine.tick_task`."""
+        task_ctx = task_ctx or {}
+        try:
+            if self.is_proxying_task(task=task):
+                await self.tick_proxying_task(
+                    proxying_task=task, flow=flow, task_ctx=task_ctx,
+                    **tick_kwargs)
+            else:
+                async with self.get_semaphore():
+                    await self.call_task_handler(
+                        task_ctx=self.get_handler_task_ctx(
+                            task=task, flow=flow, task_ctx=task_ctx),
+                        **tick_kwargs
+                    )
+            self.handle_ticked_task(task=task, flow=flow)
+        except Exception as exception:
+            self.fail_task(flow=flow, task=task, error=traceback.format_exc())
+
+    async def tick_proxying_task(self, proxying_task=None, flow=None,
+                                 task_ctx=None, **tick_kwargs):
+        proxied_task = proxying_task['proxied_task']
+        await self.tick_task(task=proxied_task, flow=flow, task_ctx=task_ctx,
+                             **tick_kwargs)
+
+    async def call_task_handler(self, task_ctx=None, **tick_kwargs):
+        """Call the task handler: await it if async, else call it on the
+        executor."""
+        tick_task = self.task_handler.tick_task
+        if inspect.iscoroutinefunction(tick_task):
+            return await tick_task(task_ctx=task_ctx, **tick_kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.get_executor(),
+            functools.partial(self.call_sync_task_handler, task_ctx=task_ctx,
+                              **tick_kwargs)
+        )
+
+    def call_sync_task_handler(self, task_ctx=None, **tick_kwargs):
+        if self.sync_handler_ctx_fn is None:
+            return self.task_handler.tick_task(task_ctx=task_ctx,
+                                               **tick_kwargs)
+        with self.sync_handler_ctx_fn():
+            return self.task_handler.tick_task(task_ctx=task_ctx,
+                                               **tick_kwargs)
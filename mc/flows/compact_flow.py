@@ -0,0 +1,160 @@
+from array import array
+
+from .flow import Flow
+
+
+class CompactFlow(Flow):
+    """A flow whose graph edges are stored compactly.
+
+    Task keys are interned as integer indices, and edges are stored as
+    parallel arrays of (src, dest) indices. Successor and precursor lookups
+    use CSR-style adjacency arrays (offsets + neighbor indices), which are
+    built on demand and rebuilt after edges are added.
+
+    The serialized graph stores edges as index pairs into a task key list: ::
+
+        {'format': 'compact',
+         'task_keys': ['ROOT', 'a', 'b'],
+         'tasks': {...},
+         'edges': [[0, 1], [1, 2]]}
+
+    Edges carry no data other than their endpoints.
+
+    Create compact flows from flow_specs that have
+    :code:`'graph_format': 'compact'`. :meth:`Flow.from_flow_dict` returns a
+    CompactFlow for compact graphs.
+    """
+    GRAPH_FORMAT = 'compact'
+
+    def _init_edges(self):
+        self._task_keys = []
+        self._task_indices = {}
+        self._edge_srcs = array('i')
+        self._edge_dests = array('i')
+        self._out_degrees = array('i')
+        self._in_degrees = array('i')
+        self._edge_ids = None  # built on demand, for has_edge checks.
+        self._adjacency = None  # built on demand, for neighbor lookups.
+
+    def _intern_key(self, key=None):
+        index = self._task_indices.get(key)
+        if index is None:
+            index = len(self._task_keys)
+            self._task_indices[key] = index
+            self._task_keys.append(key)
+            self._out_degrees.append(0)
+            self._in_degrees.append(0)
+        return index
+
+    def _store_edge(self, src_key=None, dest_key=None, edge=None):
+        src_index = self._intern_key(key=src_key)
+        dest_index = self._intern_key(key=dest_key)
+        edge_ids = self._get_edge_ids()
+        edge_id = self._get_edge_id(src_index=src_index, dest_index=dest_index)
+        if edge_id in edge_ids:
+            return False
+        edge_ids.add(edge_id)
+        self._append_edge(src_index=src_index, dest_index=dest_index)
+        return True
+
+    def _append_edge(self, src_index=None, dest_index=None):
+        self._edge_srcs.append(src_index)
+        self._edge_dests.append(dest_index)
+        self._out_degrees[src_index] += 1
+        self._in_degrees[dest_index] += 1
+        self._adjacency = None
+
+    def _get_edge_id(self, src_index=None, dest_index=None):
+        return (src_index << 32) | dest_index
+
+    def _get_edge_ids(self):
+        if self._edge_ids is None:
+            self._edge_ids = {
+                self._get_edge_id(src_index=src_index, dest_index=dest_index)
+                for src_index, dest_index in zip(self._edge_srcs,
+                                                 self._edge_dests)
+            }
+        return self._edge_ids
+
+    def _load_graph(self, graph=None, add_task_connections=True):
+        if graph.get('format') != self.GRAPH_FORMAT:
+            return super()._load_graph(
+                graph=graph, add_task_connections=add_task_connections)
+        # Intern keys in serialized order, so stored indices stay valid.
+        for key in graph['task_keys']:
+            self._intern_key(key=key)
+        # Edges from tasks' precursors and successors are already in the
+        # serialized edges.
+        for task in graph.get('tasks', {}).values():
+            self._register_task(task=task)
+            self._last_added_task = task
+        task_keys = self._task_keys
+        for src_index, dest_index in graph.get('edges', []):
+            # Serialized edges are unique, so skip the has_edge check.
+            self._append_edge(src_index=src_index, dest_index=dest_index)
+            self._count_new_edge(src_key=task_keys[src_index],
+                                 dest_key=task_keys[dest_index])
+        self._edge_ids = None
+
+    def _serialize_graph(self):
+        return {
+            'format': self.GRAPH_FORMAT,
+            'task_keys': list(self._task_keys),
+            'tasks': {key: task for key, task in self.tasks.items()},
+            'edges': [[src_index, dest_index]
+                      for src_index, dest_index in zip(self._edge_srcs,
+                                                       self._edge_dests)],
+        }
+
+    def has_edge(self, src_key=None, dest_key=None):
+        src_index = self._task_indices.get(src_key)
+        dest_index = self._task_indices.get(dest_key)
+        if src_index is None or dest_index is None:
+            return False
+        return self._get_edge_id(src_index=src_index,
+                                 dest_index=dest_index) in self._get_edge_ids()
+
+    def _get_precursor_keys(self, key=None):
+        return self._get_neighbor_keys(key=key, direction='incoming',
+                                       degrees=self._in_degrees)
+
+    def _get_successor_keys(self, key=None):
+        return self._get_neighbor_keys(key=key, direction='outgoing',
+                                       degrees=self._out_degrees)
+
+    def _get_neighbor_keys(self, key=None, direction=None, degrees=None):
+        index = self._task_indices.get(key)
+        if index is None or degrees[index] == 0:
+            return []
+        offsets, neighbors = self._get_adjacency()[direction]
+        return [self._task_keys[neighbor_index] for neighbor_index
+                in neighbors[offsets[index]:offsets[index + 1]]]
+
+    def _get_adjacency(self):
+        if self._adjacency is None:
+            self._adjacency = {
+                'outgoing': self._build_csr(row_indices=self._edge_srcs,
+                                            col_indices=self._edge_dests),
+                'incoming': self._build_csr(row_indices=self._edge_dests,
+                                            col_indices=self._edge_srcs),
+            }
+        return self._adjacency
+
+    def _build_csr(self, row_indices=None, col_indices=None):
+        num_rows = len(self._task_keys)
+        offsets = array('i', bytes(4 * (num_rows + 1)))
+        for row_index in row_indices:
+            offsets[row_index + 1] += 1
+        for row_index in range(num_rows):
+            offsets[row_index + 1] += offsets[row_index]
+        cursors = offsets[:-1]
+        cols = array('i', bytes(4 * len(col_indices)))
+        for row_index, col_index in zip(row_indices, col_indices):
+            cols[cursors[row_index]] = col_index
+            cursors[row_index] += 1
+        return offsets, cols
+
+    def _get_tail_task_keys(self):
+        return [key for index, key in enumerate(self._task_keys)
+                if (self._out_degrees[index] == 0
+                    and self._in_degrees[index] > 0)]
@@ -1,5 +1,6 @@
 import collections
 import copy
+import heapq
 from uuid import uuid4
 
 
@@ -12,10 +13,14 @@ class Flow(object):
     SIMPLE_ATTRS = {'key', 'cfg', 'data', 'label', 'status', 'depth',
                     'parent_key'}
 
+    FINISHED_TASK_STATUSES = {'COMPLETED', 'FAILED'}
+
+    GRAPH_FORMAT = None
+
     @staticmethod
     def sanitize_flow_kwargs(flow_kwargs):
         flow_kwargs = flow_kwargs or {}
-        special_keys = {'tasks', 'edges', 'graph'}
+        special_keys = {'tasks', 'edges', 'graph', 'graph_format'}
         return {k: v for k, v in flow_kwargs.items() if k not in special_keys}
 
     def __init__(self, key=None, cfg=None, data=None, label=None,
@@ -40,13 +45,23 @@ class Flow(object):
         self.depth = depth or 0
         self.parent_key = parent_key
         self.tasks = {}
-        self._edges = {}
-        self._edges_by_key = collections.defaultdict(
-            lambda: collections.defaultdict(dict))
+        self._opaque_graph = {}
+        self._init_edges()
         self._last_added_task = None
+        # Frontier state, kept in sync as tasks change status.
+        self._task_statuses = {}
+        self._num_precursors = collections.defaultdict(int)
+        self._num_uncompleted_precursors = collections.defaultdict(int)
+        self._ready_keys = {}  # ordered set of tickable pending task keys
+        self._task_keys_by_status = collections.defaultdict(dict)
         if add_root_task:
             self.add_root_task()
 
+    def _init_edges(self):
+        self._edges = {}
+        self._edges_by_key = collections.defaultdict(
+            lambda: collections.defaultdict(dict))
+
     def add_root_task(self):
         self.add_task(task={'key': self.ROOT_TASK_KEY, 'status': 'COMPLETED'},
                       add_default_connections=False)
@@ -60,9 +75,7 @@ class Flow(object):
         Returns:
             task <dict>: altered task dict
         """
-        task.setdefault('key', self.generate_key())
-        task.setdefault('status', 'PENDING')
-        self.tasks[task['key']] = task
+        self._register_task(task=task)
         if add_default_connections:
             self.add_default_connections_to_task(task=task)
         for precursor_key in task.get('precursors', []):
@@ -74,6 +87,14 @@ class Flow(object):
         self._last_added_task = task
         return task
 
+    def _register_task(self, task=None):
+        task.setdefault('key', self.generate_key())
+        task.setdefault('status', 'PENDING')
+        self.tasks[task['key']] = task
+        self._handle_task_status_change(
+            key=task['key'], prev_status=self._task_statuses.get(task['key']),
+            status=task['status'])
+
     def generate_key(self):
         """Generate keys as uuid.uuid4 strings"""
         return str(uuid4())
@@ -102,15 +123,43 @@ class Flow(object):
         src_key, dest_key = (edge['src_key'], edge['dest_key'])
         if dest_key is self.ROOT_TASK_KEY:
             raise Exception("Root task can not be an edge dest")
+        if self._store_edge(src_key=src_key, dest_key=dest_key, edge=edge):
+            self._count_new_edge(src_key=src_key, dest_key=dest_key)
+
+    def _store_edge(self, src_key=None, dest_key=None, edge=None):
+        """Store an edge. Returns True if the edge is new."""
         edge_key = (src_key, dest_key)
+        is_new_edge = edge_key not in self._edges
         self._edges[edge_key] = edge
         self._edges_by_key[src_key]['outgoing'][edge_key] = edge
         self._edges_by_key[dest_key]['incoming'][edge_key] = edge
+        return is_new_edge
+
+    def _count_new_edge(self, src_key=None, dest_key=None):
+        self._num_precursors[dest_key] += 1
+        if self._task_statuses.get(src_key) != 'COMPLETED':
+            self._num_uncompleted_precursors[dest_key] += 1
+        self._update_readiness(key=dest_key)
+
+    @classmethod
+    def get_flow_class(cls, graph_format=None):
+        """Get the flow class that handles the given graph format."""
+        if graph_format == 'compact':
+            from .compact_flow import CompactFlow
+            return CompactFlow
+        return Flow
 
     @classmethod
     def from_flow_spec(cls, flow_spec=None, deep_copy_tasks=True):
-        """Create flow from flow_spec."""
-        flow = Flow(**Flow.sanitize_flow_kwargs(flow_spec))
+        """Create flow from flow_spec.
+
+        If flow_spec has a 'graph_format' of 'compact', a
+        :class:`mc.flows.compact_flow.CompactFlow` is created.
+        """
+        if cls is Flow:
+            cls = cls.get_flow_class(
+                graph_format=flow_spec.get('graph_format'))
+        flow = cls(**cls.sanitize_flow_kwargs(flow_spec))
         for i, task in enumerate(flow_spec.get('tasks', [])):
             if deep_copy_tasks:
                 task = copy.deepcopy(task)
@@ -118,66 +167,278 @@ class Flow(object):
         return flow
 
     @classmethod
-    def from_flow_dict(cls, flow_dict=None, **kwargs):
-        """Create flow from flow dict."""
+    def from_flow_dict(cls, flow_dict=None, lazy=False, **kwargs):
+        """Create flow from flow dict.
+
+        The flow's class is picked from the format of its serialized graph,
+        so compact graphs stay compact.
+
+        Args:
+            flow_dict (dict): a flow dict, as from :meth:`to_flow_dict`.
+            lazy (bool, optional): if True, only hydrate tasks that are not
+                COMPLETED, plus their immediate neighbors. Other tasks and
+                edges are kept as opaque serialized values, and are written
+                back unchanged by :meth:`to_flow_dict`. Opaque tasks get
+                hydrated when accessed by key via :attr:`tasks`, but are not
+                included when iterating over tasks. :meth:`hydrate` hydrates
+                the rest of the graph. Default: False.
+        """
+        graph = flow_dict.get('graph', {})
+        if cls is Flow:
+            cls = cls.get_flow_class(graph_format=graph.get('format'))
         flow = cls(**cls.sanitize_flow_kwargs(flow_dict),
                    add_root_task=False)
-        graph = flow_dict.get('graph', {})
-        for task in graph.get('tasks', {}).values():
-            flow.add_task(task=task, add_default_connections=False)
-        for edge in graph.get('edges', []):
-            flow.add_edge(edge=edge)
-        if flow.ROOT_TASK_KEY not in flow.tasks:
+        if lazy:
+            flow._load_graph(graph=flow._split_off_opaque_graph(graph=graph),
+                             add_task_connections=False)
+        else:
+            flow._load_graph(graph=graph)
+        if not flow._has_task(key=flow.ROOT_TASK_KEY):
             flow.add_root_task()
         return flow
 
-    def to_flow_dict(self):
-        """Create flow_dict from flow."""
+    def _load_graph(self, graph=None, add_task_connections=True):
+        for task in graph.get('tasks', {}).values():
+            if add_task_connections:
+                self.add_task(task=task, add_default_connections=False)
+            else:
+                self._register_task(task=task)
+                self._last_added_task = task
+        for src_key, dest_key, edge in self._iter_serialized_edges(
+            graph=graph
+        ):
+            self.add_edge(edge=edge or {'src_key': src_key,
+                                        'dest_key': dest_key})
+
+    def _iter_serialized_edges(self, graph=None):
+        """Yield (src_key, dest_key, edge_dict) for a serialized graph's edges.
+
+        edge_dict is None for compact graphs, whose edges are index pairs.
+        """
+        if graph.get('format') == 'compact':
+            task_keys = graph['task_keys']
+            for src_index, dest_index in graph.get('edges', []):
+                yield task_keys[src_index], task_keys[dest_index], None
+        else:
+            for edge in graph.get('edges', []):
+                yield edge['src_key'], edge['dest_key'], edge
+
+    def _split_off_opaque_graph(self, graph=None):
+        """Split a serialized graph into an active part and an opaque part.
+
+        The active part has tasks that are not COMPLETED, plus their
+        immediate neighbors, and the edges that touch active tasks. The rest
+        is kept in self._opaque_graph, in serialized form.
+
+        Returns:
+            active_graph (dict): the active part, in the graph's format.
+        """
+        tasks = graph.get('tasks', {})
+        raw_edges = graph.get('edges', [])
+        active_keys = {key for key, task in tasks.items()
+                       if task.get('status') != 'COMPLETED'}
+        hydrated_keys = set(active_keys)
+        hydrated_edges = []
+        opaque_edges = []
+        for raw_edge, (src_key, dest_key, _) in zip(
+            raw_edges, self._iter_serialized_edges(graph=graph)
+        ):
+            if src_key in active_keys or dest_key in active_keys:
+                hydrated_edges.append(raw_edge)
+                hydrated_keys.add(src_key)
+                hydrated_keys.add(dest_key)
+            else:
+                opaque_edges.append(raw_edge)
+        # Keep the graph's other fields, e.g. a compact graph's task_keys, so
+        # that the opaque part can be loaded by :meth:`hydrate`.
+        self._opaque_graph = {
+            **graph,
+            'tasks': {key: task for key, task in tasks.items()
+                      if key not in hydrated_keys},
+            'edges': opaque_edges,
+        }
+        self.tasks = _HydratingTasks(flow=self)
+        return {
+            **graph,
+            'tasks': {key: task for key, task in tasks.items()
+                      if key in hydrated_keys},
+            'edges': hydrated_edges,
+        }
+
+    def _hydrate_opaque_task(self, key=None):
+        task = self._opaque_graph['tasks'].pop(key)
+        self._register_task(task=task)
+        return task
+
+    def _has_task(self, key=None):
+        return (key in self.tasks
+                or key in self._opaque_graph.get('tasks', {}))
+
+    def hydrate(self):
+        """Hydrate the opaque part of a lazily hydrated flow's graph, for
+        queries that need the whole graph."""
+        if not self._opaque_graph:
+            return
+        opaque_graph = self._opaque_graph
+        self._opaque_graph = {}
+        self.tasks = dict(self.tasks)
+        self._load_graph(graph=opaque_graph, add_task_connections=False)
+
+    def to_flow_dict(self, include_graph=True):
+        """Create flow_dict from flow.
+
+        Args:
+            include_graph (bool, optional): if False, leave out the 'graph',
+                e.g. when only the hydrated part of a lazily hydrated flow's
+                graph is needed, via :meth:`serialize_hydrated_graph`.
+                Default: True.
+        """
         flow_dict = {
             **{attr: getattr(self, attr, None) for attr in self.SIMPLE_ATTRS},
-            'graph': {
-                'tasks': {key: task for key, task in self.tasks.items()},
-                'edges': [edge for edge in self._edges.values()],
-            },
-            'num_tickable_tasks': len(self.get_tickable_tasks())
+            'num_tickable_tasks': (len(self.get_running_tasks())
+                                   + len(self.get_startable_pending_tasks()))
         }
+        if include_graph:
+            flow_dict['graph'] = self.serialize_graph()
         if 'key' in flow_dict and flow_dict['key'] is None:
             del flow_dict['key']
         return flow_dict
 
+    def serialize_graph(self):
+        """Serialize the whole graph, including the opaque part of a lazily
+        hydrated flow's graph."""
+        return self._merge_opaque_graph(graph=self._serialize_graph())
+
+    def serialize_hydrated_graph(self):
+        """Serialize the tasks and edges that are hydrated.
+
+        For lazily hydrated flows, this skips the opaque part of the graph,
+        which stays unchanged until it is hydrated, so its cost is
+        proportional to the active part of the graph.
+        """
+        graph = self._serialize_graph()
+        return {'tasks': graph['tasks'], 'edges': graph['edges']}
+
+    def _serialize_graph(self):
+        return {
+            'tasks': {key: task for key, task in self.tasks.items()},
+            'edges': [edge for edge in self._edges.values()],
+        }
+
+    def _merge_opaque_graph(self, graph=None):
+        if not self._opaque_graph:
+            return graph
+        return {
+            **graph,
+            'tasks': {**self._opaque_graph['tasks'], **graph['tasks']},
+            'edges': [*self._opaque_graph['edges'], *graph['edges']],
+        }
+
     def has_edge(self, src_key=None, dest_key=None):
         return (src_key, dest_key) in self._edges
 
     def get_precursors(self, task=None):
-        task_edges = self._edges_by_key[task['key']]
-        precursors = [self.tasks[edge['src_key']]
-                      for edge in task_edges['incoming'].values()]
-        return precursors
+        return [self.tasks[key]
+                for key in self._get_precursor_keys(key=task['key'])]
 
     def get_successors(self, task=None):
-        task_edges = self._edges_by_key[task['key']]
-        successors = [self.tasks[edge['dest_key']]
-                      for edge in task_edges['outgoing'].values()]
-        return successors
+        return [self.tasks[key]
+                for key in self._get_successor_keys(key=task['key'])]
+
+    def _get_precursor_keys(self, key=None):
+        task_edges = self._edges_by_key.get(key)
+        if not task_edges:
+            return []
+        return [src_key for (src_key, _) in task_edges['incoming']]
+
+    def _get_successor_keys(self, key=None):
+        task_edges = self._edges_by_key.get(key)
+        if not task_edges:
+            return []
+        return [dest_key for (_, dest_key) in task_edges['outgoing']]
 
     def get_nearest_tickable_pending_tasks(self):
         """
-        Tickable pending tasks are tasks with status 'PENDING' which can be
-        reached by starting from the flow root and advancing only through tasks
-        with status 'COMPLETED'.
-        """
-        nearest_tickable_pending_tasks = []
-        cursors = [self.tasks[self.ROOT_TASK_KEY]]
-        while len(cursors) > 0:
-            next_cursors = []
-            for cursor in cursors:
-                if cursor['status'] == 'PENDING':
-                    nearest_tickable_pending_tasks.append(cursor)
-                elif cursor['status'] == 'COMPLETED':
-                    successors = self.get_successors(task=cursor)
-                    next_cursors.extend(successors)
-            cursors = next_cursors
-        return nearest_tickable_pending_tasks
+        Tickable pending tasks are tasks with status 'PENDING' whose
+        precursors all have status 'COMPLETED'.
+
+        These are read from the frontier that the flow maintains as task
+        statuses change, so the cost is proportional to the number of
+        tickable tasks, not to the size of the graph.
+        """
+        for key in list(self._ready_keys):
+            self.sync_task_status(task=self.tasks[key])
+        return [self.tasks[key] for key in self._ready_keys]
+
+    def set_task_status(self, task=None, status=None):
+        """Set a task's status, and update the frontier accordingly."""
+        task['status'] = status
+        self.sync_task_status(task=task)
+
+    def sync_task_status(self, task=None):
+        """Update the frontier for a task whose status may have been changed
+        directly, e.g. by a task handler.
+
+        Tasks that do not belong to this flow are ignored.
+        """
+        key = task.get('key')
+        if self.tasks.get(key) is not task:
+            return
+        prev_status = self._task_statuses.get(key)
+        if task.get('status') != prev_status:
+            self._handle_task_status_change(key=key, prev_status=prev_status,
+                                            status=task.get('status'))
+
+    def sync_task_statuses(self):
+        """Update the frontier for all tasks."""
+        for task in self.tasks.values():
+            self.sync_task_status(task=task)
+
+    def _handle_task_status_change(self, key=None, prev_status=None,
+                                   status=None):
+        self._task_statuses[key] = status
+        self._update_status_index(key=key, prev_status=prev_status,
+                                  status=status)
+        was_completed = (prev_status == 'COMPLETED')
+        is_completed = (status == 'COMPLETED')
+        if was_completed != is_completed:
+            delta = -1 if is_completed else 1
+            for successor_key in self._get_successor_keys(key=key):
+                self._num_uncompleted_precursors[successor_key] += delta
+                self._update_readiness(key=successor_key)
+        self._update_readiness(key=key)
+
+    def _update_status_index(self, key=None, prev_status=None, status=None):
+        prev_keys = self._task_keys_by_status.get(prev_status)
+        if prev_keys is not None:
+            prev_keys.pop(key, None)
+            if not prev_keys:
+                del self._task_keys_by_status[prev_status]
+        self._task_keys_by_status[status][key] = True
+
+    def _get_task_keys_by_status(self, status=None):
+        """Get keys of tasks with the given status, from the status index.
+
+        Indexed tasks whose status was changed directly get re-synced first.
+        """
+        keys = self._task_keys_by_status.get(status, {})
+        stale_keys = [key for key in keys
+                      if self.tasks[key].get('status') != status]
+        for key in stale_keys:
+            self.sync_task_status(task=self.tasks[key])
+        return [key for key in self._task_keys_by_status.get(status, {})
+                if key != self.ROOT_TASK_KEY]
+
+    def _update_readiness(self, key=None):
+        is_ready = (
+            self._task_statuses.get(key) == 'PENDING'
+            and self._num_precursors.get(key, 0) > 0
+            and self._num_uncompleted_precursors.get(key, 0) == 0
+        )
+        if is_ready:
+            self._ready_keys[key] = True
+        else:
+            self._ready_keys.pop(key, None)
 
     def filter_tasks(self, filters=None, include_root_task=False):
         """
@@ -203,27 +464,48 @@ class Flow(object):
         return result
 
     def get_tasks_by_status(self, status=None):
-        def status_filter(task): return task['status'] == status
-        return self.filter_tasks(filters=[status_filter])
+        return [self.tasks[key]
+                for key in self._get_task_keys_by_status(status=status)]
 
     def has_incomplete_tasks(self):
-        dead_statuses = ['COMPLETED', 'FAILED']
-        def filter_fn(task): return task['status'] not in dead_statuses  # noqa
-        incomplete_tasks = self.filter_tasks(filters=[filter_fn])
-        return len(incomplete_tasks) > 0
+        for status in list(self._task_keys_by_status.keys()):
+            if status in self.FINISHED_TASK_STATUSES:
+                continue
+            if self._has_task_with_status(status=status):
+                return True
+        return False
+
+    def _has_task_with_status(self, status=None):
+        stale_keys = []
+        has_task = False
+        for key in self._task_keys_by_status.get(status, {}):
+            if self.tasks[key].get('status') != status:
+                stale_keys.append(key)
+            elif key != self.ROOT_TASK_KEY:
+                has_task = True
+                break
+        for key in stale_keys:
+            self.sync_task_status(task=self.tasks[key])
+        return has_task
 
     def get_tail_tasks(self):
-        """Get tasks that are the edge of the graph."""
+        """Get tasks that are the edge of the graph.
+
+        Lazily hydrated flows get hydrated first, since tails can be in the
+        opaque part of the graph.
+        """
+        self.hydrate()
         if len(self.tasks) == 1 and self.ROOT_TASK_KEY in self.tasks:
             tail_tasks = [self.tasks[self.ROOT_TASK_KEY]]
         else:
-            tail_tasks = [
-                self.tasks[key]
-                for key, task_edges in self._edges_by_key.items()
-                if len(task_edges['outgoing']) == 0
-            ]
+            tail_tasks = [self.tasks[key]
+                          for key in self._get_tail_task_keys()]
         return tail_tasks
 
+    def _get_tail_task_keys(self):
+        return [key for key, task_edges in self._edges_by_key.items()
+                if len(task_edges['outgoing']) == 0]
+
     def get_tickable_tasks(self):
         """Tickable tasks are nearest tickable tasks + running tasks."""
         return (self.get_running_tasks() +
@@ -231,3 +513,65 @@ class Flow(object):
 
     def get_running_tasks(self):
         return self.get_tasks_by_status(status='RUNNING')
+
+    def get_startable_pending_tasks(self):
+        """Get the nearest tickable pending tasks that can start now.
+
+        Tasks with higher 'priority' values start first, and tasks with equal
+        priorities start in the order they became tickable. Two caps limit
+        how many tasks start:
+
+        - cfg['max_running_tasks']: the maximum number of RUNNING tasks in
+          the flow.
+        - a task's 'max_concurrency': the maximum number of RUNNING tasks
+          with the task's 'task_type'.
+
+        Tasks that are held back stay PENDING, and start on later ticks, as
+        running tasks finish.
+
+        Returns:
+            startable_tasks (list): tasks to start, in priority order.
+        """
+        ready_tasks = self.get_nearest_tickable_pending_tasks()
+        max_running_tasks = (self.cfg or {}).get('max_running_tasks')
+        if max_running_tasks is None and not any(
+            ('priority' in task or 'max_concurrency' in task)
+            for task in ready_tasks
+        ):
+            return ready_tasks
+        running_tasks = self.get_running_tasks()
+        num_slots = len(ready_tasks)
+        if max_running_tasks is not None:
+            num_slots = min(num_slots,
+                            max_running_tasks - len(running_tasks))
+        running_counts = collections.Counter(task.get('task_type')
+                                             for task in running_tasks)
+        # Heap entries are (-priority, ready order, task), so that higher
+        # priorities pop first and ties keep ready order.
+        ready_heap = [(-(task.get('priority') or 0), i, task)
+                      for i, task in enumerate(ready_tasks)]
+        heapq.heapify(ready_heap)
+        startable_tasks = []
+        while ready_heap and len(startable_tasks) < num_slots:
+            task = heapq.heappop(ready_heap)[-1]
+            max_concurrency = task.get('max_concurrency')
+            if max_concurrency is not None:
+                task_type = task.get('task_type')
+                if running_counts[task_type] >= max_concurrency:
+                    continue
+                running_counts[task_type] += 1
+            startable_tasks.append(task)
+        return startable_tasks
+
+
+class _HydratingTasks(dict):
+    """A flow's tasks dict, which hydrates opaque tasks when accessed by key.
+    """
+    def __init__(self, *args, flow=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._flow = flow
+
+    def __missing__(self, key):
+        if key not in self._flow._opaque_graph['tasks']:
+            raise KeyError(key)
+        return self._flow._hydrate_opaque_task(key=key)
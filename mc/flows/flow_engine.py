@@ -1,4 +1,5 @@
 import logging
+import time
 import traceback
 
 from mc.utils import debug_utils
@@ -60,11 +61,14 @@ class FlowEngine(object):
         return Flow.from_flow_spec(flow_spec=flow_spec)
 
     @classmethod
-    def flow_dict_to_flow(cls, flow_dict=None, **kwargs):
+    def flow_dict_to_flow(cls, flow_dict=None, lazy=False, **kwargs):
+        if lazy:
+            return Flow.from_flow_dict(flow_dict=flow_dict, lazy=True)
         return Flow.from_flow_dict(flow_dict=flow_dict)
 
     @classmethod
-    def flow_to_flow_dict(cls, flow=None): return flow.to_flow_dict()
+    def flow_to_flow_dict(cls, flow=None, **kwargs):
+        return flow.to_flow_dict(**kwargs)
 
     @classmethod
     def flow_spec_to_flow_dict(cls, flow_spec=None, **kwargs):
@@ -108,39 +112,53 @@ class FlowEngine(object):
         """
         self.debug_locals()
         try:
-            flow.data.setdefault('_tick_counter', 0)
-            flow.data['_tick_counter'] += 1
-            if flow.status == 'PENDING':
-                self.start_flow(flow=flow)
-            self.start_nearest_tickable_pending_tasks(flow=flow)
+            self.start_flow_tick(flow=flow)
             self.tick_running_tasks(flow=flow, task_ctx=task_ctx,
                                     **tick_kwargs)
-            if not flow.has_incomplete_tasks():
-                self.complete_flow(flow=flow)
+            self.finish_flow_tick(flow=flow)
         except Exception as exception:
-            fail_flow = True
-            self.append_flow_error(flow=flow, error=traceback.format_exc())
-            if isinstance(exception, self.TaskError):
-                if not flow.cfg.get('fail_fast', True):
-                    fail_flow = False
-            if fail_flow:
-                self.fail_flow(flow=flow)
+            self.handle_flow_tick_exception(flow=flow, exception=exception)
+
+    def start_flow_tick(self, flow=None):
+        flow.data.setdefault('_tick_counter', 0)
+        flow.data['_tick_counter'] += 1
+        if flow.status == 'PENDING':
+            self.start_flow(flow=flow)
+        self.start_nearest_tickable_pending_tasks(flow=flow)
+
+    def finish_flow_tick(self, flow=None):
+        if not flow.has_incomplete_tasks():
+            self.complete_flow(flow=flow)
+
+    def handle_flow_tick_exception(self, flow=None, exception=None):
+        fail_flow = True
+        self.append_flow_error(flow=flow, error=traceback.format_exc())
+        if isinstance(exception, self.TaskError):
+            if not flow.cfg.get('fail_fast', True):
+                fail_flow = False
+        if fail_flow:
+            self.fail_flow(flow=flow)
 
     def tick_flow_until_has_no_pending(self, flow=None, task_ctx=None,
-                                       tick_kwargs=None):
+                                       tick_kwargs=None, deadline=None):
         """Tick a flow until it has no tickable pending tasks.
 
         Args:
             flow (flow): flow to tick
             task_ctx (dict, optional): task_ctx to include when ticking flow
+            deadline (float, optional): a time.time() value after which to
+                stop ticking, even if the flow has tickable pending tasks.
+                The flow is always ticked at least once. Default: no deadline.
         """
         tick_flow_kwargs = {'flow': flow, 'task_ctx': task_ctx,
                             **(tick_kwargs or {})}
         self.tick_flow(**tick_flow_kwargs)
         while (
             flow.status in {'PENDING', 'RUNNING'}
-            and len(flow.get_nearest_tickable_pending_tasks()) > 0
+            and len(self.get_startable_pending_tasks(flow=flow)) > 0
         ):
+            if deadline is not None and time.time() >= deadline:
+                break
             self.tick_flow(**tick_flow_kwargs)
 
     def start_flow(self, flow=None):
@@ -148,15 +166,35 @@ class FlowEngine(object):
         flow.status = 'RUNNING'
 
     def start_nearest_tickable_pending_tasks(self, flow=None):
-        for task in flow.get_nearest_tickable_pending_tasks():
+        for task in self.get_startable_pending_tasks(flow=flow):
             try:
                 self.start_task(flow=flow, task=task)
             except:
-                self.fail_task(task=task, error=traceback.format_exc())
+                self.fail_task(flow=flow, task=task,
+                               error=traceback.format_exc())
+
+    def get_startable_pending_tasks(self, flow=None):
+        """Get the nearest tickable pending tasks that can start now.
+
+        See :meth:`mc.flows.flow.Flow.get_startable_pending_tasks`.
+
+        Args:
+            flow (flow): flow to get tasks for.
+
+        Returns:
+            startable_tasks (list): tasks to start, in priority order.
+        """
+        return flow.get_startable_pending_tasks()
 
     def start_task(self, flow=None, task=None):
         self.debug_locals()
-        task['status'] = 'RUNNING'
+        self.set_task_status(flow=flow, task=task, status='RUNNING')
+
+    def set_task_status(self, flow=None, task=None, status=None):
+        if flow is not None:
+            flow.set_task_status(task=task, status=status)
+        else:
+            task['status'] = status
 
     def tick_running_tasks(self, flow=None, task_ctx=None, **tick_kwargs):
         for task in flow.get_tasks_by_status(status='RUNNING'):
@@ -164,7 +202,7 @@ class FlowEngine(object):
                 self.tick_task(task=task, flow=flow, task_ctx=task_ctx,
                                **tick_kwargs)
             else:
-                self.complete_task(task=task)
+                self.complete_task(flow=flow, task=task)
             if flow.status == 'COMPLETED':
                 break
 
@@ -189,14 +227,22 @@ class FlowEngine(object):
                                         task_ctx=task_ctx, **tick_kwargs)
             else:
                 self.task_handler.tick_task(
-                    task_ctx={'flow_engine': self, **task_ctx,
-                              'task': task, 'flow': flow},
+                    task_ctx=self.get_handler_task_ctx(
+                        task=task, flow=flow, task_ctx=task_ctx),
                     **tick_kwargs
                 )
-            if task.get('status') == 'COMPLETED':
-                self.complete_task(flow=flow, task=task)
+            self.handle_ticked_task(task=task, flow=flow)
         except Exception as exception:
-            self.fail_task(task=task, error=traceback.format_exc())
+            self.fail_task(flow=flow, task=task, error=traceback.format_exc())
+
+    def get_handler_task_ctx(self, task=None, flow=None, task_ctx=None):
+        return {'flow_engine': self, **task_ctx, 'task': task, 'flow': flow}
+
+    def handle_ticked_task(self, task=None, flow=None):
+        if flow is not None:
+            flow.sync_task_status(task=task)
+        if task.get('status') == 'COMPLETED':
+            self.complete_task(flow=flow, task=task)
 
     def is_proxying_task(self, task=None):
         """Determine if a task is a proxying task.
@@ -219,9 +265,9 @@ class FlowEngine(object):
         self.tick_task(task=proxied_task, flow=flow, task_ctx=task_ctx,
                        **tick_kwargs)
 
-    def fail_task(self, task=None, error=None):
+    def fail_task(self, flow=None, task=None, error=None):
         task['error'] = error
-        task['status'] = 'FAILED'
+        self.set_task_status(flow=flow, task=task, status='FAILED')
         msg = "Task with key '{key}' failed, error: {error}".format(
             key=task.get('key', '<unknown key>'),
             error=error
@@ -244,7 +290,7 @@ class FlowEngine(object):
         return text
 
     def complete_task(self, flow=None, task=None):
-        task['status'] = 'COMPLETED'
+        self.set_task_status(flow=flow, task=task, status='COMPLETED')
 
     def complete_flow(self, flow=None):
         if flow.data.get('errors'):
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from ..async_flow_engine import AsyncFlowEngine
+from ..flow import Flow
+
+
+class BaseTestCase(unittest.TestCase):
+    def generate_flow(self, num_tasks=3):
+        flow = Flow()
+        for i in range(num_tasks):
+            flow.add_task(task={'key': 'task_%s' % i,
+                                'precursors': [Flow.ROOT_TASK_KEY]})
+        return flow
+
+
+class AsyncSleepingTaskHandler(object):
+    def __init__(self, sleep_time=None, num_ticks=2):
+        self.sleep_time = sleep_time
+        self.num_ticks = num_ticks
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def tick_task(self, task_ctx=None, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.in_flight, self.max_in_flight)
+        await asyncio.sleep(self.sleep_time)
+        self.in_flight -= 1
+        task = task_ctx['task']
+        task['ticks'] = task.get('ticks', 0) + 1
+        if task['ticks'] >= self.num_ticks:
+            task['status'] = 'COMPLETED'
+
+
+class RunFlowTestCase(BaseTestCase):
+    def test_ticks_running_tasks_concurrently(self):
+        task_handler = AsyncSleepingTaskHandler(sleep_time=.05)
+        engine = AsyncFlowEngine(task_handler=task_handler)
+        flow = self.generate_flow(num_tasks=50)
+        start = time.time()
+        asyncio.run(engine.run_flow(flow=flow))
+        self.assertEqual(flow.status, 'COMPLETED')
+        self.assertEqual(task_handler.max_in_flight, 50)
+        self.assertLess(time.time() - start, 1)
+
+    def test_bounds_concurrent_task_ticks(self):
+        task_handler = AsyncSleepingTaskHandler(sleep_time=.01)
+        engine = AsyncFlowEngine(task_handler=task_handler,
+                                 max_concurrent_tasks=3)
+        flow = self.generate_flow(num_tasks=10)
+        asyncio.run(engine.run_flow(flow=flow))
+        self.assertEqual(flow.status, 'COMPLETED')
+        self.assertEqual(task_handler.max_in_flight, 3)
+
+    def test_fails_flow_if_task_fails(self):
+        class FailingTaskHandler(object):
+            async def tick_task(self, task_ctx=None, **kwargs):
+                if task_ctx['task']['key'] == 'task_1':
+                    raise Exception('some error')
+                task_ctx['task']['status'] = 'COMPLETED'
+
+        engine = AsyncFlowEngine(task_handler=FailingTaskHandler())
+        flow = self.generate_flow(num_tasks=3)
+        with self.assertRaises(engine.FlowError):
+            asyncio.run(engine.run_flow(flow=flow))
+        self.assertEqual(flow.tasks['task_1']['status'], 'FAILED')
+        self.assertEqual(flow.tasks['task_2']['status'], 'COMPLETED')
+
+
+class SyncTaskHandlerTestCase(BaseTestCase):
+    def test_calls_sync_handlers_on_executor(self):
+        thread_names = set()
+
+        class SyncTaskHandler(object):
+            def tick_task(self, task_ctx=None, **kwargs):
+                thread_names.add(threading.current_thread().name)
+                task_ctx['task']['status'] = 'COMPLETED'
+
+        sync_handler_ctx_fn = MagicMock()
+        engine = AsyncFlowEngine(task_handler=SyncTaskHandler(),
+                                 sync_handler_ctx_fn=sync_handler_ctx_fn)
+        flow = self.generate_flow(num_tasks=3)
+        asyncio.run(engine.run_flow(flow=flow))
+        self.assertEqual(flow.status, 'COMPLETED')
+        self.assertNotIn(threading.current_thread().name, thread_names)
+        self.assertEqual(sync_handler_ctx_fn.call_count, 3)
+
+
+class TickFlowsTestCase(BaseTestCase):
+    def test_ticks_flows_concurrently(self):
+        task_handler = AsyncSleepingTaskHandler(sleep_time=.01, num_ticks=1)
+        engine = AsyncFlowEngine(task_handler=task_handler)
+        flows = [self.generate_flow(num_tasks=2) for i in range(3)]
+        asyncio.run(engine.tick_flows(flows=flows))
+        self.assertEqual(task_handler.max_in_flight, 6)
+        for flow in flows:
+            self.assertEqual(flow.status, 'COMPLETED')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import json
+import unittest
+
+from ..compact_flow import CompactFlow
+from ..flow import Flow
+from ..flow_engine import FlowEngine
+
+
+class BaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.flow_spec = {
+            'graph_format': 'compact',
+            'label': 'some_label',
+            'tasks': [
+                {'key': 'a', 'precursors': [Flow.ROOT_TASK_KEY]},
+                {'key': 'b', 'precursors': [Flow.ROOT_TASK_KEY]},
+                {'key': 'c', 'precursors': ['a', 'b']},
+            ]
+        }
+        self.flow = Flow.from_flow_spec(flow_spec=self.flow_spec)
+
+
+class FromFlowSpecTestCase(BaseTestCase):
+    def test_creates_compact_flow(self):
+        self.assertTrue(isinstance(self.flow, CompactFlow))
+        self.assertEqual(self.flow.label, 'some_label')
+
+    def test_has_expected_edges(self):
+        for src_key, dest_key in [(Flow.ROOT_TASK_KEY, 'a'),
+                                  (Flow.ROOT_TASK_KEY, 'b'),
+                                  ('a', 'c'), ('b', 'c')]:
+            self.assertTrue(self.flow.has_edge(src_key=src_key,
+                                               dest_key=dest_key))
+        self.assertFalse(self.flow.has_edge(src_key='c', dest_key='a'))
+
+    def test_ignores_duplicate_edges(self):
+        self.flow.add_edge(edge={'src_key': 'a', 'dest_key': 'c'})
+        self.assertEqual(len(self.flow.to_flow_dict()['graph']['edges']), 4)
+
+
+class NeighborsTestCase(BaseTestCase):
+    def _get_keys(self, tasks): return sorted(task['key'] for task in tasks)
+
+    def test_gets_successors(self):
+        self.assertEqual(
+            self._get_keys(self.flow.get_successors(
+                task=self.flow.tasks[Flow.ROOT_TASK_KEY])),
+            ['a', 'b'])
+        self.assertEqual(
+            self._get_keys(self.flow.get_successors(
+                task=self.flow.tasks['c'])),
+            [])
+
+    def test_gets_precursors(self):
+        self.assertEqual(
+            self._get_keys(self.flow.get_precursors(
+                task=self.flow.tasks['c'])),
+            ['a', 'b'])
+
+    def test_gets_neighbors_of_edges_added_later(self):
+        self.flow.get_successors(task=self.flow.tasks['a'])
+        self.flow.add_task(task={'key': 'd', 'precursors': ['a']})
+        self.assertEqual(
+            self._get_keys(self.flow.get_successors(
+                task=self.flow.tasks['a'])),
+            ['c', 'd'])
+
+    def test_gets_tail_tasks(self):
+        self.assertEqual(self._get_keys(self.flow.get_tail_tasks()), ['c'])
+
+
+class RoundTripTestCase(BaseTestCase):
+    def _round_trip(self, flow=None):
+        flow_dict = json.loads(json.dumps(flow.to_flow_dict()))
+        return Flow.from_flow_dict(flow_dict=flow_dict)
+
+    def test_serializes_edges_as_index_pairs(self):
+        graph = self.flow.to_flow_dict()['graph']
+        self.assertEqual(graph['format'], 'compact')
+        self.assertEqual(
+            sorted((graph['task_keys'][src_index],
+                    graph['task_keys'][dest_index])
+                   for src_index, dest_index in graph['edges']),
+            sorted([(Flow.ROOT_TASK_KEY, 'a'), (Flow.ROOT_TASK_KEY, 'b'),
+                    ('a', 'c'), ('b', 'c')])
+        )
+
+    def test_round_trips(self):
+        self.flow.set_task_status(task=self.flow.tasks['a'],
+                                  status='COMPLETED')
+        flow = self._round_trip(flow=self.flow)
+        self.assertTrue(isinstance(flow, CompactFlow))
+        self.assertEqual(flow.to_flow_dict(), self.flow.to_flow_dict())
+        self.assertEqual(
+            [task['key'] for task in flow.get_nearest_tickable_pending_tasks()],
+            ['b'])
+
+    def test_loads_default_graphs(self):
+        default_flow = Flow.from_flow_spec(flow_spec={
+            **self.flow_spec, 'graph_format': None})
+        flow = CompactFlow.from_flow_dict(
+            flow_dict=default_flow.to_flow_dict())
+        self.assertTrue(flow.has_edge(src_key='a', dest_key='c'))
+
+    def test_default_flow_loads_compact_graph_edges(self):
+        default_flow = Flow(add_root_task=False)
+        default_flow._load_graph(graph=self.flow.to_flow_dict()['graph'])
+        self.assertTrue(default_flow.has_edge(src_key='a', dest_key='c'))
+
+
+class RunFlowTestCase(BaseTestCase):
+    def test_runs_flow(self):
+        class CompletingTaskHandler(object):
+            def tick_task(self, task_ctx=None, **kwargs):
+                task_ctx['task']['status'] = 'COMPLETED'
+
+        engine = FlowEngine(task_handler=CompletingTaskHandler())
+        engine.run_flow(flow=self.flow)
+        self.assertEqual(self.flow.status, 'COMPLETED')
+
+
+if __name__ == '__main__':
+    unittest.main()
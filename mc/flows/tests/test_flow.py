@@ -198,6 +198,20 @@ class ToFlowDictTestCase(BaseTestCase):
         }
         self.assertEqual(self.result['graph'], expected_graph)
 
+    def test_counts_running_and_startable_tasks(self):
+        self.flow.cfg = {'max_running_tasks': 2}
+        for i, status in enumerate(['RUNNING', 'PENDING', 'PENDING']):
+            self.flow.add_task(task={'key': 'task_%s' % i, 'status': status,
+                                     'precursors': [Flow.ROOT_TASK_KEY]})
+        self.assertEqual(self.flow.to_flow_dict()['num_tickable_tasks'], 2)
+
+    def test_does_not_count_tasks_held_back_by_caps(self):
+        self.flow.cfg = {'max_running_tasks': 1}
+        for i, status in enumerate(['RUNNING', 'PENDING', 'PENDING']):
+            self.flow.add_task(task={'key': 'task_%s' % i, 'status': status,
+                                     'precursors': [Flow.ROOT_TASK_KEY]})
+        self.assertEqual(self.flow.to_flow_dict()['num_tickable_tasks'], 1)
+
 class GetNearestPendingTasksTestCase(BaseTestCase):
     def setUp(self):
         super().setUp()
@@ -237,6 +251,179 @@ class GetNearestPendingTasksTestCase(BaseTestCase):
             _sans_precursors(expected_nearest_pending_tasks)
         )
 
+class FrontierTestCase(BaseTestCase):
+    def _add_task(self, key=None, status='PENDING', precursors=None):
+        return self.flow.add_task(task=self.generate_task(
+            key=key, status=status,
+            precursors=(precursors or [self.flow.ROOT_TASK_KEY])))
+
+    def _get_tickable_keys(self):
+        return [task['key']
+                for task in self.flow.get_nearest_tickable_pending_tasks()]
+
+    def test_waits_for_all_precursors(self):
+        a = self._add_task(key='a')
+        b = self._add_task(key='b')
+        self._add_task(key='c', precursors=['a', 'b'])
+        self.assertEqual(self._get_tickable_keys(), ['a', 'b'])
+        self.flow.set_task_status(task=a, status='COMPLETED')
+        self.assertEqual(self._get_tickable_keys(), ['b'])
+        self.flow.set_task_status(task=b, status='RUNNING')
+        self.assertEqual(self._get_tickable_keys(), [])
+        self.flow.set_task_status(task=b, status='COMPLETED')
+        self.assertEqual(self._get_tickable_keys(), ['c'])
+
+    def test_does_not_tick_past_failed_tasks(self):
+        a = self._add_task(key='a')
+        self._add_task(key='b', precursors=['a'])
+        self.flow.set_task_status(task=a, status='FAILED')
+        self.assertEqual(self._get_tickable_keys(), [])
+
+    def test_syncs_directly_changed_statuses(self):
+        a = self._add_task(key='a')
+        self._add_task(key='b', precursors=['a'])
+        a['status'] = 'COMPLETED'
+        self.flow.sync_task_status(task=a)
+        self.assertEqual(self._get_tickable_keys(), ['b'])
+
+    def test_drops_directly_started_tasks(self):
+        a = self._add_task(key='a')
+        a['status'] = 'RUNNING'
+        self.assertEqual(self._get_tickable_keys(), [])
+
+    def test_handles_edges_added_before_tasks(self):
+        flow = Flow.from_flow_dict(flow_dict={'graph': {
+            'tasks': {
+                'b': {'key': 'b', 'status': 'PENDING'},
+                'a': {'key': 'a', 'status': 'COMPLETED'},
+                Flow.ROOT_TASK_KEY: {'key': Flow.ROOT_TASK_KEY,
+                                     'status': 'COMPLETED'},
+            },
+            'edges': [{'src_key': Flow.ROOT_TASK_KEY, 'dest_key': 'a'},
+                      {'src_key': 'a', 'dest_key': 'b'}],
+        }})
+        self.assertEqual(
+            [task['key'] for task in flow.get_nearest_tickable_pending_tasks()],
+            ['b'])
+
+    def test_handles_chained_diamonds(self):
+        tail_key = self.flow.ROOT_TASK_KEY
+        for i in range(100):
+            for side in ['l', 'r']:
+                self._add_task(key='%s_%s' % (i, side), status='COMPLETED',
+                               precursors=[tail_key])
+            tail_key = 'join_%s' % i
+            self._add_task(key=tail_key, status='COMPLETED',
+                           precursors=['%s_l' % i, '%s_r' % i])
+        self._add_task(key='last', precursors=[tail_key])
+        self.assertEqual(self._get_tickable_keys(), ['last'])
+
+class LazyHydrationTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.flow = self._generate_flow()
+        self.flow_dict = self.flow.to_flow_dict()
+
+    def _generate_flow(self, graph_format=None):
+        tasks = []
+        tail_key = Flow.ROOT_TASK_KEY
+        for i in range(3):
+            key = 'done_%s' % i
+            tasks.append({'key': key, 'status': 'COMPLETED',
+                          'precursors': [tail_key]})
+            tail_key = key
+        tasks.append({'key': 'pending', 'status': 'PENDING',
+                      'precursors': [tail_key]})
+        tasks.append({'key': 'side', 'status': 'COMPLETED',
+                      'precursors': [Flow.ROOT_TASK_KEY]})
+        flow = Flow.from_flow_spec(flow_spec={'graph_format': graph_format,
+                                              'tasks': tasks})
+        flow.set_task_status(task=flow.tasks[Flow.ROOT_TASK_KEY],
+                             status='COMPLETED')
+        return flow
+
+    def _lazy_load(self, flow_dict=None):
+        return Flow.from_flow_dict(flow_dict=(flow_dict or self.flow_dict),
+                                   lazy=True)
+
+    def test_only_hydrates_active_tasks_and_neighbors(self):
+        flow = self._lazy_load()
+        self.assertEqual(sorted(flow.tasks.keys()), ['done_2', 'pending'])
+        self.assertEqual(
+            [task['key'] for task in flow.get_nearest_tickable_pending_tasks()],
+            ['pending'])
+
+    def test_hydrates_opaque_tasks_on_access(self):
+        flow = self._lazy_load()
+        self.assertEqual(flow.tasks['done_0']['key'], 'done_0')
+        self.assertTrue('done_0' in flow.tasks)
+        with self.assertRaises(KeyError):
+            flow.tasks['not_a_task']
+
+    def test_does_not_add_extra_root_task(self):
+        flow = self._lazy_load()
+        self.assertEqual(
+            flow.tasks[flow.ROOT_TASK_KEY]['status'], 'COMPLETED')
+
+    def test_round_trips_graph(self):
+        flow = self._lazy_load()
+        graph = flow.to_flow_dict()['graph']
+        expected_graph = self.flow_dict['graph']
+        self.assertEqual(graph['tasks'], expected_graph['tasks'])
+        self.assertEqual(
+            sorted((edge['src_key'], edge['dest_key'])
+                   for edge in graph['edges']),
+            sorted((edge['src_key'], edge['dest_key'])
+                   for edge in expected_graph['edges']))
+
+    def test_round_trips_compact_graph(self):
+        flow_dict = self._generate_flow(graph_format='compact').to_flow_dict()
+        flow = self._lazy_load(flow_dict=flow_dict)
+        self.assertEqual(sorted(flow.tasks.keys()), ['done_2', 'pending'])
+        graph = flow.to_flow_dict()['graph']
+        self.assertEqual(graph['task_keys'], flow_dict['graph']['task_keys'])
+        self.assertEqual(graph['tasks'], flow_dict['graph']['tasks'])
+        self.assertEqual(sorted(graph['edges']),
+                         sorted(flow_dict['graph']['edges']))
+
+    def test_keeps_new_tasks_and_status_changes(self):
+        flow = self._lazy_load()
+        flow.set_task_status(task=flow.tasks['pending'], status='COMPLETED')
+        flow.add_task(task=self.generate_task(key='new',
+                                              precursors=['pending']))
+        reloaded = Flow.from_flow_dict(flow_dict=flow.to_flow_dict())
+        self.assertEqual(reloaded.tasks['pending']['status'], 'COMPLETED')
+        self.assertEqual(len(reloaded.tasks), len(self.flow.tasks) + 1)
+        self.assertEqual(
+            [task['key']
+             for task in reloaded.get_nearest_tickable_pending_tasks()],
+            ['new'])
+
+    def test_gets_tail_tasks_in_opaque_graph(self):
+        flow = self._lazy_load()
+        self.assertEqual(sorted(task['key'] for task in flow.get_tail_tasks()),
+                         ['pending', 'side'])
+
+    def test_gets_tail_tasks_in_opaque_compact_graph(self):
+        flow_dict = self._generate_flow(graph_format='compact').to_flow_dict()
+        flow = self._lazy_load(flow_dict=flow_dict)
+        self.assertEqual(sorted(task['key'] for task in flow.get_tail_tasks()),
+                         ['pending', 'side'])
+        self.assertEqual(sorted(flow.to_flow_dict()['graph']['edges']),
+                         sorted(flow_dict['graph']['edges']))
+
+    def test_gets_tail_tasks_past_hydrated_neighbors(self):
+        flow = Flow.from_flow_spec(flow_spec={'tasks': [
+            {'key': 'failed', 'status': 'FAILED'},
+            {'key': 'neighbor', 'status': 'COMPLETED'},
+            {'key': 'tail', 'status': 'COMPLETED'},
+        ]})
+        flow = self._lazy_load(flow_dict=flow.to_flow_dict())
+        self.assertEqual([task['key'] for task in flow.get_tail_tasks()],
+                         ['tail'])
+        self.assertEqual(len(flow.to_flow_dict()['graph']['edges']), 3)
+
+
 class GetSuccessorsTestCase(BaseTestCase):
     def setUp(self):
         super().setUp()
@@ -289,11 +476,42 @@ class GetTasksByStatusTestCase(BaseTestCase):
             self.assertEqual(self._task_list_to_dict(result),
                              self._task_list_to_dict(expected_result))
 
+    def test_tracks_status_changes(self):
+        task = self.flow.add_task(task=self.generate_task(status='PENDING'))
+        self.flow.set_task_status(task=task, status='RUNNING')
+        self.assertEqual(self.flow.get_tasks_by_status(status='PENDING'), [])
+        self.assertEqual(self.flow.get_tasks_by_status(status='RUNNING'),
+                         [task])
+
+    def test_resyncs_directly_changed_statuses(self):
+        task = self.flow.add_task(task=self.generate_task(status='RUNNING'))
+        task['status'] = 'COMPLETED'
+        self.assertEqual(self.flow.get_tasks_by_status(status='RUNNING'), [])
+        self.assertEqual(self.flow.get_tasks_by_status(status='COMPLETED'),
+                         [task])
+
+    def test_excludes_root_task(self):
+        self.assertEqual(self.flow.get_tasks_by_status(status='COMPLETED'),
+                         [])
+
 class HasIncompleteTasksTestCase(BaseTestCase):
     def test_has_incomplete(self):
         self.flow.add_task(task=self.generate_task(status='PENDING'))
         self.assertTrue(self.flow.has_incomplete_tasks())
 
+    def test_tracks_status_changes(self):
+        tasks = [self.flow.add_task(task=self.generate_task(status='PENDING'))
+                 for i in range(2)]
+        self.flow.set_task_status(task=tasks[0], status='COMPLETED')
+        self.assertTrue(self.flow.has_incomplete_tasks())
+        self.flow.set_task_status(task=tasks[1], status='FAILED')
+        self.assertFalse(self.flow.has_incomplete_tasks())
+
+    def test_resyncs_directly_changed_statuses(self):
+        task = self.flow.add_task(task=self.generate_task(status='RUNNING'))
+        task['status'] = 'COMPLETED'
+        self.assertFalse(self.flow.has_incomplete_tasks())
+
     def test_does_not_have_incomplete(self):
         self.flow.add_task(task=self.generate_task(status='COMPLETED'))
         self.assertFalse(self.flow.has_incomplete_tasks())
@@ -40,6 +40,13 @@ class FlowDictToFlowTestCase(BaseTestCase):
                          call(flow_dict=flow_dict))
         self.assertEqual(result, _Flow.from_flow_dict.return_value)
 
+    @patch.object(flow_engine, 'Flow')
+    def test_passes_lazy_to_Flow(self, _Flow):
+        flow_dict = MagicMock()
+        flow_engine.FlowEngine.flow_dict_to_flow(flow_dict=flow_dict, lazy=True)
+        self.assertEqual(_Flow.from_flow_dict.call_args,
+                         call(flow_dict=flow_dict, lazy=True))
+
 class FlowToFlowDictTestCase(BaseTestCase):
     def setUp(self):
         super().setUp()
@@ -75,6 +82,87 @@ class RunFlowTestCase(BaseTestCase):
             self.engine.run_flow(flow=self.flow)
             self.assertEqual(self.flow.status, 'FAILED')
 
+class TickFlowUntilHasNoPendingTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.flow = MagicMock(status='RUNNING')
+        self.flow.get_startable_pending_tasks.return_value = [MagicMock()]
+        self.engine.tick_flow = MagicMock()
+
+    def test_ticks_until_no_pending(self):
+        def mock_tick(*args, **kwargs):
+            if self.engine.tick_flow.call_count == 3:
+                self.flow.get_startable_pending_tasks.return_value = []
+        self.engine.tick_flow.side_effect = mock_tick
+        self.engine.tick_flow_until_has_no_pending(flow=self.flow)
+        self.assertEqual(self.engine.tick_flow.call_count, 3)
+
+    @patch.object(flow_engine, 'time')
+    def test_stops_at_deadline(self, _time):
+        _time.time.side_effect = [1, 2, 3]
+        self.engine.tick_flow_until_has_no_pending(flow=self.flow, deadline=3)
+        self.assertEqual(self.engine.tick_flow.call_count, 3)
+
+
+class GetStartablePendingTasksTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.flow = flow_engine.Flow()
+
+    def _add_tasks(self, tasks=None):
+        for task in tasks:
+            self.flow.add_task(task={
+                'precursors': [self.flow.ROOT_TASK_KEY], **task})
+
+    def _get_startable_keys(self):
+        return [task['key'] for task in
+                self.engine.get_startable_pending_tasks(flow=self.flow)]
+
+    def test_returns_all_ready_tasks_without_caps(self):
+        self._add_tasks(tasks=[{'key': key} for key in ['a', 'b', 'c']])
+        self.assertEqual(sorted(self._get_startable_keys()), ['a', 'b', 'c'])
+
+    def test_orders_by_priority(self):
+        self._add_tasks(tasks=[{'key': 'low', 'priority': -1},
+                               {'key': 'default'},
+                               {'key': 'high', 'priority': 5}])
+        self.assertEqual(self._get_startable_keys(),
+                         ['high', 'default', 'low'])
+
+    def test_caps_running_tasks_per_flow(self):
+        self.flow.cfg['max_running_tasks'] = 3
+        self._add_tasks(tasks=[{'key': 'running', 'status': 'RUNNING'},
+                               {'key': 'a', 'priority': 2},
+                               {'key': 'b', 'priority': 1},
+                               {'key': 'c'}])
+        self.assertEqual(self._get_startable_keys(), ['a', 'b'])
+
+    def test_caps_running_tasks_per_task_type(self):
+        self._add_tasks(tasks=[
+            {'key': 'running', 'status': 'RUNNING', 'task_type': 'job'},
+            *[{'key': 'job_%s' % i, 'task_type': 'job',
+               'max_concurrency': 2} for i in range(3)],
+            {'key': 'other', 'task_type': 'other'},
+        ])
+        self.assertEqual(sorted(self._get_startable_keys()),
+                         ['job_0', 'other'])
+
+    def test_run_flow_streams_capped_tasks(self):
+        self.flow.cfg['max_running_tasks'] = 3
+        self._add_tasks(tasks=[{'key': 'task_%s' % i} for i in range(10)])
+        max_num_running = 0
+
+        def tick_task(task_ctx=None, **kwargs):
+            nonlocal max_num_running
+            max_num_running = max(max_num_running,
+                                  len(self.flow.get_running_tasks()))
+            task_ctx['task']['status'] = 'COMPLETED'
+        self.task_handler.tick_task.side_effect = tick_task
+        self.engine.run_flow(flow=self.flow)
+        self.assertEqual(self.flow.status, 'COMPLETED')
+        self.assertEqual(max_num_running, 3)
+
+
 class TickTestCase(BaseTestCase):
     def setUp(self):
         super().setUp()
@@ -200,6 +288,18 @@ class TickTaskTestCase(BaseTestCase):
         self.assertEqual(self.engine.complete_task.call_args,
                          call(flow=self.flow, task=self.task))
 
+    def test_updates_flow_frontier_for_handler_status_changes(self):
+        flow = flow_engine.Flow()
+        task = flow.add_task(task={'key': 'a', 'status': 'RUNNING'})
+        flow.add_task(task={'key': 'b', 'precursors': ['a']})
+
+        def mock_tick_task(*args, **kwargs): task['status'] = 'COMPLETED'
+        self.engine.task_handler.tick_task.side_effect = mock_tick_task
+        self.engine.tick_task(flow=flow, task=task)
+        self.assertEqual(
+            [task['key'] for task in flow.get_nearest_tickable_pending_tasks()],
+            ['b'])
+
 class TickProxyingTaskTestCase(BaseTestCase):
     def setUp(self):
         super().setUp()
@@ -0,0 +1,17 @@
+from ._base_subcommand import BaseSubcommand
+
+
+class Subcommand(BaseSubcommand):
+    help = "Check flow lock counts against lock records"
+
+    def add_arguments(self, parser=None):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help="Rebuild lock counts from lock records."
+        )
+
+    def _run(self):
+        result = {'mismatches': self.utils.db.get_lock_count_mismatches()}
+        if self.parsed_args.get('rebuild'):
+            result.update(self.utils.db.rebuild_lock_counts())
+        return result
@@ -3,5 +3,5 @@ from ._base_subcommand import BaseSubcommand
 
 class Subcommand(BaseSubcommand):
     def _run(self):
-        self.houston.db.ensure_tables()
-        return {'msg': 'ensured db'}
+        migration_result = self.utils.ensure_db()
+        return {'msg': 'ensured db', **migration_result}
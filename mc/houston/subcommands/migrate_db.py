@@ -0,0 +1,8 @@
+from ._base_subcommand import BaseSubcommand
+
+
+class Subcommand(BaseSubcommand):
+    help = "Add missing columns and indexes to existing db tables"
+
+    def _run(self):
+        return self.utils.db.migrate_tables()
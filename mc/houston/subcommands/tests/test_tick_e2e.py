@@ -69,6 +69,21 @@ class TickFlowRunnerTestCase(BaseTestCase):
         self._run_tick_command(tickee='flow_runner', until_finished=True)
 
 
+class TickEventDrivenFlowRunnerTestCase(BaseTestCase):
+    def setUp(self):
+        self.houston = _houston_test_utils.generate_test_houston(
+            cfg_overrides={'FLOW_RUNNER_EVENT_DRIVEN': True})
+        self.common_command_kwargs = {'interval': .01, 'max_ticks': int(1e2)}
+        self.flow_record = self._create_flow_record(
+            flow_spec=self._generate_flow_spec())
+
+    def test_runs_until_finished(self):
+        self._run_tick_command(tickee='flow_runner', until_finished=True)
+        flow_record = self.houston.utils.flow_record_client.get_flow_record(
+            flow_meta=self.flow_record)
+        self.assertEqual(flow_record['status'], 'COMPLETED')
+
+
 class TickJobRunnerTestCase(BaseTestCase):
     def setUp(self):
         super().setUp()
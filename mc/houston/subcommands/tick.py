@@ -110,17 +110,21 @@ class Subcommand(BaseSubcommand):
         return condition_fns
 
     def _tick_while(self, tick_fn=None, condition_fns=None):
-        condition_fns = condition_fns or []
         tick_interval = self._get_tick_interval()
-        while all([fn() for fn in condition_fns]):
-            self.tick_counter += 1
-            if self.parsed_args.get('verbose'):
-                self.logger.info("{self} Tick #{tick_counter}".format(
-                    self=self, tick_counter=self.tick_counter))
-            self._check_max_ticks()
+        while self._start_tick(condition_fns=condition_fns):
             tick_fn()
             self._sleep(tick_interval)
 
+    def _start_tick(self, condition_fns=None):
+        if not all([fn() for fn in (condition_fns or [])]):
+            return False
+        self.tick_counter += 1
+        if self.parsed_args.get('verbose'):
+            self.logger.info("{self} Tick #{tick_counter}".format(
+                self=self, tick_counter=self.tick_counter))
+        self._check_max_ticks()
+        return True
+
     def _get_common_condition_fns(self):
         common_condition_fns = []
         if self.parsed_args.get('until_finished'):
@@ -130,7 +134,8 @@ class Subcommand(BaseSubcommand):
         return common_condition_fns
 
     def _has_unfinished_mc_records(self):
-        return self.utils.has_unfinished_mc_records()
+        with self.utils.db.unit_of_work():
+            return self.utils.has_unfinished_mc_records()
 
     def _tick_counter_is_lt_nticks(self):
         return self.tick_counter < self.parsed_args['nticks']
@@ -148,11 +153,22 @@ class Subcommand(BaseSubcommand):
 
     def _run_for_flow_runner_tickee(self):
         self._ensure_mc()
+        if self.utils.flow_runner.event_driven:
+            return self._run_event_driven_flow_runner()
         self._tick_while(
             tick_fn=self._tick_flow_runner,
             condition_fns=self._get_common_condition_fns()
         )
 
+    def _run_event_driven_flow_runner(self):
+        """Let the flow runner wait for dirty flows between ticks, and sweep
+        every interval."""
+        condition_fns = self._get_common_condition_fns()
+        self.utils.flow_runner.run(
+            tick_interval=self._get_tick_interval(),
+            condition_fn=lambda: self._start_tick(condition_fns=condition_fns)
+        )
+
     def _ensure_mc(self):
         self.utils.db.ensure_tables()
         self.utils.ensure_queues()
@@ -206,9 +222,13 @@ class Subcommand(BaseSubcommand):
         self._tick_job_runner()
         self._tick_jobman()
 
-    def _tick_flow_runner(self): self.utils.flow_runner.tick()
+    def _tick_flow_runner(self):
+        with self.utils.db.unit_of_work():
+            self.utils.flow_runner.tick()
 
-    def _tick_job_runner(self): self.utils.job_runner.tick()
+    def _tick_job_runner(self):
+        with self.utils.db.unit_of_work():
+            self.utils.job_runner.tick()
 
     def _tick_jobman(self): self.utils.jobman.tick()
 
@@ -12,6 +12,11 @@ from mc.runners.jobman_job_runner.job_runner import JobRunner
 
 class HoustonUtils(object):
     JOBS_SUBDIRS = ['pending', 'queued', 'executed', 'archive']
+    UNFINISHED_QUERY = {
+        'filters': [
+            {'field': 'status', 'op': '! IN', 'arg': ['FAILED', 'COMPLETED']}
+        ]
+    }
 
     def __init__(self, houston=None):
         self.houston = houston
@@ -22,15 +27,38 @@ class HoustonUtils(object):
     @property
     def db(self):
         if not hasattr(self, '_db'):
-            self._db = self.generate_db(db_uri=self.cfg['MC_DB_URI'])
+            self._db = self.generate_db(
+                db_uri=self.cfg['MC_DB_URI'],
+                engine_kwargs=self.cfg.get('MC_DB_ENGINE_KWARGS', None),
+                json_compression=self.cfg.get('MC_DB_JSON_COMPRESSION', None))
         return self._db
 
-    def generate_db(self, db_uri=None, schema=None):
-        return Db(db_uri=db_uri, schema=schema)
+    def generate_db(self, db_uri=None, schema=None, engine_kwargs=None,
+                    json_compression=None):
+        """
+        Args:
+            db_uri (str): db uri.
+            schema (module, optional): db schema.
+            engine_kwargs (dict, optional): pool settings and other
+                create_engine kwargs, from cfg['MC_DB_ENGINE_KWARGS'], e.g.
+                {'pool_size': 5, 'max_overflow': 10, 'pool_pre_ping': True,
+                'pool_recycle': 3600}.
+            json_compression (dict, optional): kwargs for
+                :func:`mc.db.json_codecs.configure_compression`, from
+                cfg['MC_DB_JSON_COMPRESSION'], e.g. {'compression': 'zlib'}.
+                Only applies to this Db's engine. Default: None, to store
+                JSON columns uncompressed.
+        """
+        return Db(db_uri=db_uri, schema=schema, engine_kwargs=engine_kwargs,
+                  json_compression=json_compression)
 
     @db.setter
     def db(self, value): self._subcommands = value
 
+    def ensure_db(self):
+        """Create missing tables, and migrate existing ones in place."""
+        return self.db.ensure_tables()
+
     def ensure_queues(self):
         self.ensure_queue(queue_cfg=self.cfg['FLOW_QUEUE'])
         self.ensure_queue(queue_cfg=self.cfg['JOB_QUEUE'])
@@ -56,7 +84,15 @@ class HoustonUtils(object):
                 task_ctx={
                     'mc.flow_record_client': self.flow_record_client,
                     'mc.job_record_client': self.job_record_client,
-                }
+                },
+                lazy_hydration=self.cfg.get('FLOW_RUNNER_LAZY_HYDRATION',
+                                            False),
+                event_driven=self.cfg.get('FLOW_RUNNER_EVENT_DRIVEN', False),
+                max_workers=self.cfg.get('FLOW_RUNNER_MAX_WORKERS', None),
+                flow_tick_budget=self.cfg.get('FLOW_RUNNER_FLOW_TICK_BUDGET',
+                                              None),
+                skip_unchanged_flows=self.cfg.get(
+                    'FLOW_RUNNER_SKIP_UNCHANGED_FLOWS', False)
             )
         return self._flow_runner
 
@@ -112,9 +148,35 @@ class HoustonUtils(object):
                 jobman=self.jobman,
                 jobdirs_dir=self.cfg.get('JOBDIRS_DIR', None),
                 build_jobdir_fn=self.build_jobdir,
+                max_build_workers=self.cfg.get(
+                    'JOB_RUNNER_MAX_BUILD_WORKERS', None),
+                submission_batch_size=self.cfg.get(
+                    'JOB_RUNNER_SUBMISSION_BATCH_SIZE', None),
+                std_log_head_bytes=self.cfg.get(
+                    'JOB_RUNNER_STD_LOG_HEAD_BYTES', None),
+                std_log_tail_bytes=self.cfg.get(
+                    'JOB_RUNNER_STD_LOG_TAIL_BYTES', None),
+                std_log_archiver=(
+                    self.archiver
+                    if self.cfg.get('JOB_RUNNER_ARCHIVE_STD_LOGS', False)
+                    else None
+                ),
+                input_staging_cache=self._generate_input_staging_cache(),
             )
         return self._job_runner
 
+    def _generate_input_staging_cache(self):
+        cache_dir = self.cfg.get('JOB_RUNNER_INPUT_STAGING_CACHE_DIR', None)
+        if cache_dir is None:
+            return None
+        from mc.utils.input_staging_cache import InputStagingCache
+        return InputStagingCache(
+            cache_dir=cache_dir,
+            max_bytes=self.cfg.get('JOB_RUNNER_INPUT_STAGING_CACHE_MAX_BYTES',
+                                   None),
+            staging_mode=self.cfg.get('JOB_RUNNER_INPUT_STAGING_MODE', None)
+        )
+
     @job_runner.setter
     def job_runner(self, new_value): self._job_runner = new_value
 
@@ -136,11 +198,11 @@ class HoustonUtils(object):
         return build_jobdir_fn(*args, **kwargs)
 
     def has_unfinished_mc_records(self):
-        unfinished_records = self.get_unfinished_mc_records()
-        for record_type, records in unfinished_records.items():
-            if len(records) > 0:
-                return True
-        return False
+        return any(
+            self.db.exists_items(item_type=record_type,
+                                 query=self.UNFINISHED_QUERY)
+            for record_type in ['flow', 'job']
+        )
 
     def get_unfinished_mc_records(self):
         return {
@@ -149,12 +211,8 @@ class HoustonUtils(object):
         }
 
     def _get_unfinished_mc_items(self, item_type=None):
-        return self.db.query_items(item_type=item_type, query={
-            'filters': [
-                {'field': 'status', 'op': '! IN',
-                 'arg': ['FAILED', 'COMPLETED']}
-            ]
-        })
+        return self.db.query_items(item_type=item_type,
+                                   query=self.UNFINISHED_QUERY)
 
     def ensure_job_dirs(self):
         for dir in self.job_dirs.values():
@@ -179,6 +237,9 @@ class HoustonUtils(object):
         return self._archiver
 
     def _generate_archiver(self):
+        if self.cfg.get('ARCHIVE_DEDUPLICATE_FILES', False):
+            from mc.utils.archivers.cas_archiver import CasArchiver
+            return CasArchiver(root_dir=self.job_dirs['archive'])
         from mc.utils.archivers.dir_archiver import DirArchiver
         return DirArchiver(root_dir=self.job_dirs['archive'])
 
@@ -1,16 +1,41 @@
 from collections import defaultdict
+from concurrent import futures
 import logging
+import threading
 import time
 import traceback
 
+from mc.db import json_codecs
+
 
 class FlowRunner(object):
     """
     A FlowRunner encapsulates logic related to claiming and ticking flows.
     """
+    # Task data keys for child record metas, and the item types of those
+    # records.
+    CHILD_META_KEYS = {
+        '_job_task_job_meta': 'job',
+        '_flow_task_flow_meta': 'flow',
+    }
+    # task_ctx keys of the clients for child records, by item type.
+    CHILD_CLIENT_KEYS = {
+        'job': 'mc.job_record_client',
+        'flow': 'mc.flow_record_client',
+    }
+    # Seconds to set child watermarks back by. Children's 'modified' times
+    # are set before their transactions commit, so a child can commit after
+    # a claim with a 'modified' time from before it.
+    CHILD_WATERMARK_MARGIN = 5.0
+    # Uncompressed, with the fastest JSON library, for snapshotting records.
+    SNAPSHOT_CODEC = json_codecs.JsonCodec()
 
     def __init__(self, flow_record_client=None, flow_engine=None,
                  task_ctx=None, tick_interval=120, max_flows_per_tick=3,
+                 claim_order_by=None, lazy_hydration=False,
+                 event_driven=False, dirty_poll_interval=.25, max_workers=None,
+                 executor_type='thread', runner_factory=None,
+                 flow_tick_budget=None, skip_unchanged_flows=False,
                  logger=None):
         """
         Args:
@@ -23,6 +48,51 @@ class FlowRunner(object):
                 Default: 120.
             max_flows_per_tick (int, optional)]: maximum number of flows to
                 claim per tick. Default: 3.
+            claim_order_by (dict, optional): order_by spec that determines
+                which flows get claimed first, e.g.
+                {'field': 'depth', 'direction': 'desc'}. Default: the flow
+                queue's default ordering.
+            lazy_hydration (bool, optional): if True, only hydrate tasks of
+                claimed flows that are not COMPLETED, plus their neighbors.
+                See :meth:`mc.flows.flow.Flow.from_flow_dict`. Default: False.
+            event_driven (bool, optional): if True, :meth:`run` only claims
+                dirty flows, e.g. flows whose children just finished, and
+                waits for flows to become dirty instead of sleeping. All
+                claimable flows are still swept every tick_interval, for
+                tasks that do not wait on children. Default: False.
+            dirty_poll_interval (float, optional): seconds between checks for
+                dirty flows, for dbs without LISTEN/NOTIFY. Default: .25.
+            max_workers (int, optional): if greater than 1, tick claimed flows
+                concurrently on a pool with this many workers. Claims are
+                committed before flows are handed to workers, and each worker
+                ticks and releases a flow in its own db unit of work. For dbs
+                without concurrent writes, i.e. sqlite, workers' units of work
+                run one at a time. Default: None, for ticking flows one at a
+                time.
+            executor_type (str, optional): 'thread' or 'process'. Default:
+                'thread'.
+            runner_factory (callable, optional): for the 'process' executor,
+                a picklable callable that returns a FlowRunner. Each worker
+                process calls it once, to get a runner with its own db
+                engine. Required for the 'process' executor, which also
+                requires a db that supports concurrent writes.
+            flow_tick_budget (float, optional): seconds to spend ticking each
+                flow before saving and releasing it, even if it still has
+                tickable tasks. Task ticks are never interrupted, so this is a
+                soft limit. Default: no limit.
+            skip_unchanged_flows (bool, optional): if True, only claim flows
+                that may have something to do. If a ticked flow only waits
+                on child jobs and flows, the runner saves a 'child_watermark'
+                on it, and the flow is not claimed again until one of its
+                children finishes after the watermark. Only children whose
+                'parent_key' is the flow's key can wake it, so flows that wait
+                on other children are not skipped. Watermarks are
+                taken before claiming, minus
+                :attr:`CHILD_WATERMARK_MARGIN`, so that children that finish
+                while a flow is being ticked always wake it. All runners for a
+                flow queue should use the same setting, and hosts' clocks
+                should agree, since watermarks are compared to children's
+                'modified' times. Default: False.
         """
         self.logger = logger or logging
         self.flow_record_client = flow_record_client
@@ -30,6 +100,18 @@ class FlowRunner(object):
         self.task_ctx = self.decorate_task_ctx(task_ctx=task_ctx)
         self.tick_interval = tick_interval
         self.max_flows_per_tick = max_flows_per_tick
+        self.claim_order_by = claim_order_by
+        self.lazy_hydration = lazy_hydration
+        self.event_driven = event_driven
+        self.dirty_poll_interval = dirty_poll_interval
+        self._last_sweep_time = None
+        self.max_workers = max_workers
+        self.executor_type = executor_type
+        self.runner_factory = runner_factory
+        self.flow_tick_budget = flow_tick_budget
+        self.skip_unchanged_flows = skip_unchanged_flows
+        self._executor = None
+        self._unit_of_work_lock = threading.Lock()
         self.tick_counter = 0
         self._ticking = False
 
@@ -41,22 +123,32 @@ class FlowRunner(object):
         task_ctx = task_ctx or {}
         return {**task_ctx, 'flow_engine': self.flow_engine}
 
-    def run(self, ntimes=None, tick_interval=None):
+    def run(self, ntimes=None, tick_interval=None, condition_fn=None):
         """Run indefinitely or for several ticks.
 
+        Each tick runs in its own db unit of work, so that its claims,
+        patches and dirty marks are committed before the runner sleeps or
+        waits.
+
         Args:
             ntimes (int, optional): if specified, run this many ticks. If
                 empty, run indefinitely. Default: None.
             tick_interval (int, optional): run with this tick interval.
                 Default: self.tick_interval.
+            condition_fn (callable, optional): if specified, called before
+                each tick, and the runner stops when it returns False.
+                Default: None.
         """
         self._ticking = True
-        if ntimes:
-            for i in range(ntimes):
-                self._tick_and_sleep(tick_interval=tick_interval)
-        else:
-            while self._ticking:
+        num_ticks = 0
+        try:
+            while self._ticking and not (ntimes and num_ticks >= ntimes):
+                if condition_fn is not None and not condition_fn():
+                    break
                 self._tick_and_sleep(tick_interval=tick_interval)
+                num_ticks += 1
+        finally:
+            self.shutdown_executor()
 
     def stop(self):
         """Stop ticking."""
@@ -65,51 +157,429 @@ class FlowRunner(object):
     def _tick_and_sleep(self, tick_interval=None):
         if tick_interval is None:
             tick_interval = self.tick_interval
-        self.tick()
+        if self.event_driven:
+            return self._tick_and_wait(tick_interval=tick_interval)
+        self._tick_in_unit_of_work()
         time.sleep(tick_interval)
 
-    def tick(self):
-        """Run one claim-and-tick-flows cycle."""
+    def _tick_and_wait(self, tick_interval=None):
+        now = time.time()
+        sweep = (self._last_sweep_time is None
+                 or (now - self._last_sweep_time) >= tick_interval)
+        if sweep:
+            self._last_sweep_time = now
+        tick_stats = self._tick_in_unit_of_work(dirty_only=(not sweep))
+        if tick_stats['claimed'] >= self.max_flows_per_tick:
+            return  # There may be more flows to claim, so don't wait.
+        next_sweep_time = self._last_sweep_time + tick_interval
+        self.flow_record_client.wait_for_dirty_flow_records(
+            timeout=max(0, next_sweep_time - time.time()),
+            poll_interval=self.dirty_poll_interval)
+
+    def _tick_in_unit_of_work(self, dirty_only=False):
+        # Commit before waiting, so that other processes see the tick's
+        # changes, and get its NOTIFYs, and so that sqlite's write lock is not
+        # held while waiting.
+        with self.flow_record_client.mc_db.unit_of_work():
+            return self.tick(dirty_only=dirty_only)
+
+    def tick(self, dirty_only=False):
+        """Run one claim-and-tick-flows cycle.
+
+        Args:
+            dirty_only (bool, optional): if True, only claim dirty flows.
+                Default: False.
+        """
         self.tick_counter += 1
         self.logger.debug('%s, tick #%s' % (self, self.tick_counter))
-        claimed_flow_records = self.claim_flow_records()
-        tick_stats = {
-            'claimed': len(claimed_flow_records),
-            **self.tick_flow_records(flow_records=claimed_flow_records)
-        }
+        # Taken before claiming, so that tasks see every child modified
+        # before this time, in claimed records or prefetched statuses.
+        claim_time = time.time()
+        if dirty_only:
+            claimed_flow_records = self.claim_flow_records(dirty_only=True)
+        else:
+            claimed_flow_records = self.claim_flow_records()
+        self.prefetch_child_records(flow_records=claimed_flow_records)
+        try:
+            tick_stats = {
+                'claimed': len(claimed_flow_records),
+                **self.tick_flow_records(flow_records=claimed_flow_records,
+                                         claim_time=claim_time)
+            }
+        finally:
+            self.clear_prefetched_child_records()
         return tick_stats
 
-    def claim_flow_records(self):
-        return self.flow_record_client.claim_flow_records()
+    def prefetch_child_records(self, flow_records=None):
+        """Prefetch the statuses of claimed flows' child jobs and flows.
 
-    def tick_flow_records(self, flow_records=None):
-        tick_stats = defaultdict(int)
+        Fetches the statuses of all children that RUNNING tasks are waiting
+        on, with one query per record client, so that task handlers can skip
+        fetching children that are still running.
+
+        Args:
+            flow_records (list): claimed flow records.
+        """
+        child_metas = self.get_child_metas(flow_records=flow_records)
+        for item_type, metas in child_metas.items():
+            client = self.task_ctx.get(self.CHILD_CLIENT_KEYS[item_type])
+            if not metas or not hasattr(client, 'prefetch_records'):
+                continue
+            if self.is_concurrent:
+                with client.mc_db.unit_of_work():
+                    client.prefetch_records(metas=metas)
+            else:
+                client.prefetch_records(metas=metas)
+
+    def get_child_metas(self, flow_records=None):
+        """
+        Returns:
+            child_metas (dict): lists of the child record metas of RUNNING
+                tasks, keyed by item type.
+        """
+        child_metas = {item_type: [] for item_type
+                       in self.CHILD_CLIENT_KEYS}
         for flow_record in flow_records:
-            try:
-                patches = self.tick_flow_record(flow_record=flow_record)
-                status = patches.get('status')
-            except Exception as exception:
-                self.logger.exception(exception)
-                status = 'FAILED'
-                patches = {'status': status, 'error': traceback.format_exc()}
-            self.patch_and_release_flow_record(flow_record=flow_record,
-                                               patches=patches)
+            graph = flow_record.get('graph') or {}
+            for task in (graph.get('tasks') or {}).values():
+                if task.get('status') != 'RUNNING':
+                    continue
+                for item_type, meta in self.get_task_child_metas(task=task):
+                    child_metas[item_type].append(meta)
+        return child_metas
+
+    def get_task_child_metas(self, task=None):
+        """
+        Returns:
+            task_child_metas (list): (item_type, meta) tuples for the child
+                records of a task and its proxied task.
+        """
+        task_child_metas = []
+        for _task in [task, task.get('proxied_task') or {}]:
+            task_data = _task.get('data') or {}
+            for meta_key, item_type in self.CHILD_META_KEYS.items():
+                if task_data.get(meta_key):
+                    task_child_metas.append((item_type, task_data[meta_key]))
+        return task_child_metas
+
+    def get_prefetched_child_records(self, flow_record=None):
+        """Get the prefetched records of a flow record's children, for
+        passing to worker processes.
+
+        Returns:
+            prefetched_child_records (dict): prefetched records, keyed by
+                client key and then by record key.
+        """
+        child_metas = self.get_child_metas(flow_records=[flow_record])
+        prefetched_child_records = {}
+        for item_type, client_key in self.CHILD_CLIENT_KEYS.items():
+            client = self.task_ctx.get(client_key)
+            if hasattr(client, 'get_prefetched_records'):
+                prefetched_child_records[client_key] = (
+                    client.get_prefetched_records(
+                        metas=child_metas[item_type]))
+        return prefetched_child_records
+
+    def set_prefetched_child_records(self, prefetched_child_records=None):
+        for client_key, records in (prefetched_child_records or {}).items():
+            client = self.task_ctx.get(client_key)
+            if hasattr(client, 'set_prefetched_records'):
+                client.set_prefetched_records(records=records)
+
+    def clear_prefetched_child_records(self):
+        for client_key in self.CHILD_CLIENT_KEYS.values():
+            client = self.task_ctx.get(client_key)
+            if hasattr(client, 'clear_prefetched_records'):
+                client.clear_prefetched_records()
+
+    def claim_flow_records(self, dirty_only=False):
+        claim_params = self.get_claim_params(dirty_only=dirty_only)
+        if self.is_concurrent:
+            # Commit claims, so that workers' sessions see them.
+            with self.flow_record_client.mc_db.unit_of_work():
+                return self.flow_record_client.claim_flow_records(
+                    params=claim_params)
+        return self.flow_record_client.claim_flow_records(params=claim_params)
+
+    @property
+    def is_concurrent(self): return (self.max_workers or 1) > 1
+
+    def get_claim_params(self, dirty_only=False):
+        claim_params = {'limit': self.max_flows_per_tick}
+        if self.claim_order_by:
+            claim_params['order_by'] = self.claim_order_by
+        if dirty_only:
+            claim_params['dirty_only'] = True
+        if self.skip_unchanged_flows:
+            claim_params['changed_only'] = True
+        return claim_params
+
+    def tick_flow_records(self, flow_records=None, claim_time=None):
+        if self.is_concurrent:
+            statuses = self._tick_flow_records_concurrently(
+                flow_records=flow_records, claim_time=claim_time)
+        else:
+            statuses = [
+                self.tick_and_release_flow_record(flow_record=flow_record,
+                                                  claim_time=claim_time)
+                for flow_record in flow_records
+            ]
+        tick_stats = defaultdict(int)
+        for status in statuses:
             tick_stats[status] += 1
         return tick_stats
 
-    def tick_flow_record(self, flow_record=None):
+    def tick_and_release_flow_record(self, flow_record=None,
+                                     claim_time=None):
+        """Tick a flow record, then patch and release it.
+
+        Args:
+            flow_record (dict): a claimed flow record.
+            claim_time (float, optional): when the record was claimed, as for
+                :meth:`tick_flow_record`.
+
+        Returns:
+            status (str): the flow's status after ticking.
+        """
+        try:
+            patches = self.tick_flow_record(flow_record=flow_record,
+                                            claim_time=claim_time)
+            status = patches.get('status', flow_record.get('status'))
+        except Exception as exception:
+            self.logger.exception(exception)
+            status = 'FAILED'
+            patches = {'status': status, 'error': traceback.format_exc()}
+        self.patch_and_release_flow_record(flow_record=flow_record,
+                                           patches=patches)
+        return status
+
+    def _tick_flow_records_concurrently(self, flow_records=None,
+                                        claim_time=None):
+        executor = self.get_executor()
+        if self.executor_type == 'process':
+            # Worker processes have their own clients, so send them the
+            # children's prefetched records.
+            tick_futures = [
+                executor.submit(
+                    _tick_and_release_flow_record_in_worker_process,
+                    flow_record, claim_time,
+                    self.get_prefetched_child_records(flow_record=flow_record))
+                for flow_record in flow_records
+            ]
+        else:
+            tick_futures = [
+                executor.submit(
+                    self._tick_and_release_flow_record_in_unit_of_work,
+                    flow_record, claim_time)
+                for flow_record in flow_records
+            ]
+        return [tick_future.result() for tick_future in tick_futures]
+
+    def _tick_and_release_flow_record_in_unit_of_work(self, flow_record=None,
+                                                      claim_time=None):
+        mc_db = self.flow_record_client.mc_db
+        if not mc_db.supports_concurrent_writes:
+            with self._unit_of_work_lock, mc_db.unit_of_work():
+                return self.tick_and_release_flow_record(
+                    flow_record=flow_record, claim_time=claim_time)
+        with mc_db.unit_of_work():
+            return self.tick_and_release_flow_record(flow_record=flow_record,
+                                                     claim_time=claim_time)
+
+    def get_executor(self):
+        if self._executor is None:
+            if self.executor_type == 'process':
+                if self.runner_factory is None:
+                    raise Exception("The 'process' executor requires a"
+                                    " runner_factory.")
+                self._executor = futures.ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=_init_worker_process,
+                    initargs=(self.runner_factory,))
+            else:
+                self._executor = futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers)
+        return self._executor
+
+    def shutdown_executor(self):
+        """Shut down the worker pool, if one was started."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def tick_flow_record(self, flow_record=None, claim_time=None):
+        """Tick a flow record.
+
+        Args:
+            flow_record (dict): a claimed flow record.
+            claim_time (float, optional): a time taken before the record was
+                claimed, and before child statuses were prefetched. Children
+                modified later may not have been seen by the flow's tasks.
+                Default: now, for records that were claimed and prefetched
+                in the same transaction as this tick.
+
+        Returns:
+            patches (dict): changed flow record fields.
+        """
         self.logger.debug('tick_flow_record')
+        if claim_time is None:
+            claim_time = time.time()
+        # Snapshot before hydrating: the flow shares (and mutates) the
+        # record's dicts. With lazy hydration, only the hydrated part of the
+        # graph can change, so only that part gets snapshotted and compared.
+        flow_record_snapshot = self.snapshot_flow_record(
+            flow_record=flow_record,
+            exclude_fields=(['graph'] if self.lazy_hydration else None))
         flow = self.flow_record_to_flow(flow_record=flow_record)
+        if self.lazy_hydration:
+            hydrated_graph_snapshot = self._freeze_value(
+                flow.serialize_hydrated_graph())
         flow.data.setdefault('_flow_record_tick_counter', 0)
         flow.data['_flow_record_tick_counter'] += 1
-        self.flow_engine.tick_flow_until_has_no_pending(
-            flow=flow, task_ctx=self.task_ctx)
-        updated_flow_dict = self.flow_engine.flow_to_flow_dict(flow=flow)
-        return updated_flow_dict
+        tick_kwargs = {'flow': flow, 'task_ctx': self.task_ctx}
+        if self.flow_tick_budget is not None:
+            tick_kwargs['deadline'] = time.time() + self.flow_tick_budget
+        self.flow_engine.tick_flow_until_has_no_pending(**tick_kwargs)
+        if self.lazy_hydration:
+            updated_flow_dict = self.flow_engine.flow_to_flow_dict(
+                flow=flow, include_graph=False)
+        else:
+            updated_flow_dict = self.flow_engine.flow_to_flow_dict(flow=flow)
+        if self.skip_unchanged_flows:
+            updated_flow_dict = {
+                **updated_flow_dict,
+                **self.get_wait_fields(flow=flow, claim_time=claim_time)
+            }
+        patches = self.get_changed_fields(
+            flow_record_snapshot=flow_record_snapshot,
+            updated_flow_dict=updated_flow_dict)
+        if self.lazy_hydration and (
+            self._freeze_value(flow.serialize_hydrated_graph())
+            != hydrated_graph_snapshot
+        ):
+            # Merge in the graph's opaque part only when writing the graph.
+            patches['graph'] = flow.serialize_graph()
+        if 'deadline' in tick_kwargs and self.flow_has_startable_tasks(
+                flow=flow):
+            # The budget ran out before the flow's startable tasks started,
+            # so keep the flow dirty, for event-driven runners to reclaim
+            # it right away.
+            patches['dirty'] = True
+        return patches
+
+    def flow_has_startable_tasks(self, flow=None):
+        if flow.status not in {'PENDING', 'RUNNING'}:
+            return False
+        return len(self.flow_engine.get_startable_pending_tasks(flow=flow)) > 0
+
+    def get_wait_fields(self, flow=None, claim_time=None):
+        """Get fields that tell claimers whether a ticked flow is idle.
+
+        Args:
+            flow (mc.flows.flow.Flow): a ticked flow.
+            claim_time (float): as for :meth:`tick_flow_record`.
+
+        Returns:
+            wait_fields (dict): flow record fields, in this shape: ::
+
+                {'child_watermark': claim_time - CHILD_WATERMARK_MARGIN}
+
+            'child_watermark' is None if the flow has PENDING tasks that can
+            start, or RUNNING tasks that do not wait on children, or that
+            wait on children that would not wake the flow. See
+            :meth:`child_can_wake_flow`.
+        """
+        has_other_work = len(
+            self.flow_engine.get_startable_pending_tasks(flow=flow)) > 0
+        for task in flow.get_running_tasks():
+            task_child_metas = self.get_task_child_metas(task=task)
+            if not task_child_metas or not all(
+                self.child_can_wake_flow(flow=flow, item_type=item_type,
+                                         meta=meta)
+                for item_type, meta in task_child_metas
+            ):
+                has_other_work = True
+                break
+        if has_other_work:
+            return {'child_watermark': None}
+        return {'child_watermark': claim_time - self.CHILD_WATERMARK_MARGIN}
+
+    def child_can_wake_flow(self, flow=None, item_type=None, meta=None):
+        """Check whether a child will wake its flow when it finishes.
+
+        Claimers only find a flow's children by their 'parent_key' values,
+        so a child without the flow's key would never wake the flow. A
+        child that already finished would not wake it either.
+
+        Args:
+            flow (mc.flows.flow.Flow): a ticked flow.
+            item_type (str): the child's item type.
+            meta (dict): the child's record meta.
+
+        Returns:
+            can_wake_flow (bool): True if the child's prefetched record has
+                the flow's key as its 'parent_key', and is unfinished. False
+                if the child's record was not prefetched.
+        """
+        client = self.task_ctx.get(self.CHILD_CLIENT_KEYS[item_type])
+        if not hasattr(client, 'get_prefetched_records'):
+            return False
+        record = client.get_prefetched_records(metas=[meta]).get(meta['key'])
+        if record is None:
+            return False
+        return (record.get('parent_key') == flow.key
+                and record.get('status') in {'PENDING', 'RUNNING'})
+
+    def snapshot_flow_record(self, flow_record=None, exclude_fields=None):
+        return {field: self._freeze_value(value)
+                for field, value in flow_record.items()
+                if field not in (exclude_fields or [])}
+
+    def _freeze_value(self, value):
+        if isinstance(value, (dict, list)):
+            return self.SNAPSHOT_CODEC.encode(value)
+        return value
+
+    def get_changed_fields(self, flow_record_snapshot=None,
+                           updated_flow_dict=None):
+        """Get the fields in updated_flow_dict that differ from the snapshot.
+
+        Unchanged fields are left out, so that large JSON columns like
+        'graph' only get rewritten when a tick actually changed them.
+        """
+        missing = object()
+        return {
+            field: value for field, value in updated_flow_dict.items()
+            if (flow_record_snapshot.get(field, missing)
+                != self._freeze_value(value))
+        }
 
     def flow_record_to_flow(self, flow_record=None):
+        if self.lazy_hydration:
+            return self.flow_engine.flow_dict_to_flow(flow_dict=flow_record,
+                                                      lazy=True)
         return self.flow_engine.flow_dict_to_flow(flow_dict=flow_record)
 
     def patch_and_release_flow_record(self, flow_record=None, patches=None):
         self.flow_record_client.patch_and_release_flow_record(
             flow_record=flow_record, patches=patches)
+
+
+_worker_process_runner = None
+
+
+def _init_worker_process(runner_factory=None):
+    global _worker_process_runner
+    _worker_process_runner = runner_factory()
+
+
+def _tick_and_release_flow_record_in_worker_process(
+        flow_record=None, claim_time=None, prefetched_child_records=None):
+    runner = _worker_process_runner
+    runner.set_prefetched_child_records(
+        prefetched_child_records=prefetched_child_records)
+    try:
+        return runner._tick_and_release_flow_record_in_unit_of_work(
+            flow_record=flow_record, claim_time=claim_time)
+    finally:
+        runner.clear_prefetched_child_records()
@@ -1,7 +1,18 @@
 from collections import defaultdict
 import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import call, MagicMock, patch
+from mc.clients.flow_record_client import FlowRecordClient
+from mc.clients.job_record_client import JobRecordClient
+from mc.db import db
+from mc.flows.flow import Flow
+from mc.flows.flow_engine import FlowEngine
+from mc.utils.mc_sandbox import McSandbox
 from .. import flow_runner
 
 
@@ -28,9 +39,87 @@ class RunTestCase(BaseTestCase):
         )
 
 
-class TickTestCase(BaseTestCase):
+class EventDrivenRunTestCase(BaseTestCase):
     def setUp(self):
         super().setUp()
+        self.runner.event_driven = True
+        self.runner.tick_interval = 10
+        self.runner.max_flows_per_tick = 2
+        self.runner.tick = MagicMock(return_value={'claimed': 0})
+        self.wait = self.runner.flow_record_client.wait_for_dirty_flow_records
+
+    @patch.object(flow_runner, 'time')
+    def test_sweeps_then_ticks_dirty_flows(self, _time):
+        _time.time.side_effect = [100, 100, 103, 103, 111, 111]
+        self.runner.run(ntimes=3)
+        self.assertEqual(self.runner.tick.call_args_list,
+                         [call(dirty_only=False), call(dirty_only=True),
+                          call(dirty_only=False)])
+        self.assertEqual(
+            [wait_call[1]['timeout']
+             for wait_call in self.wait.call_args_list],
+            [10, 7, 10])
+        self.assertEqual(_time.sleep.call_count, 0)
+
+    @patch.object(flow_runner, 'time')
+    def test_does_not_wait_if_claimed_max_flows(self, _time):
+        _time.time.return_value = 100
+        self.runner.tick.return_value = {'claimed': 2}
+        self.runner.run(ntimes=1)
+        self.assertEqual(self.wait.call_count, 0)
+
+
+class EventDrivenRunE2ETestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.db_uri = 'sqlite:///' + os.path.join(self.tmp_dir, 'mc.db')
+        self.sandbox = McSandbox(mc_db_uri=self.db_uri)
+        self.parent_record = self.sandbox.create_flow(flow_spec={
+            'tasks': [{
+                'key': 'subflow',
+                'task_type': 'flow',
+                'task_params': {
+                    'flow_spec': {
+                        'tasks': [{'key': 'noop', 'task_type': 'noop'}]
+                    }
+                },
+            }]
+        })
+        self.sandbox.mc_db.session.commit()
+        self.runner = flow_runner.FlowRunner(
+            flow_record_client=self.sandbox.flow_record_client,
+            flow_engine=self.sandbox.flow_engine,
+            task_ctx=self.sandbox.task_ctx,
+            event_driven=True,
+            dirty_poll_interval=.01,
+        )
+
+    def test_other_connections_see_parent_completed(self):
+        other_db = db.Db(db_uri=self.db_uri)
+        runner_thread = threading.Thread(target=self.runner.run,
+                                         kwargs={'tick_interval': 1})
+        start_time = time.time()
+        runner_thread.start()
+        try:
+            status = None
+            while status != 'COMPLETED' and time.time() - start_time < 1:
+                time.sleep(.01)
+                with other_db.unit_of_work():
+                    status = other_db.get_item_by_key(
+                        item_type='flow', key=self.parent_record['key']
+                    )['status']
+        finally:
+            self.runner.stop()
+            runner_thread.join()
+        self.assertEqual(status, 'COMPLETED')
+
+
+class TickTestCase(BaseTestCase):
+    @patch.object(flow_runner, 'time')
+    def setUp(self, _time):
+        super().setUp()
+        _time.time.return_value = 100
         self.runner.claim_flow_records = MagicMock()
         self.runner.tick_flow_records = MagicMock()
         self.result = self.runner.tick()
@@ -41,7 +130,8 @@ class TickTestCase(BaseTestCase):
     def test_ticks_claimed_flow_records(self):
         self.assertEqual(
             self.runner.tick_flow_records.call_args,
-            call(flow_records=self.runner.claim_flow_records.return_value)
+            call(flow_records=self.runner.claim_flow_records.return_value,
+                 claim_time=100)
         )
 
     def test_returns_tick_stats(self):
@@ -52,12 +142,175 @@ class TickTestCase(BaseTestCase):
         self.assertEqual(self.result, expected_tick_stats)
 
 
+class PrefetchChildRecordsTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clients = {'mc.job_record_client': MagicMock(),
+                        'mc.flow_record_client': MagicMock()}
+        self.runner.task_ctx = self.clients
+        self.flow_records = [
+            {'graph': {'tasks': {
+                'job_task': {'status': 'RUNNING', 'data': {
+                    '_job_task_job_meta': {'key': 'job_1'}}},
+                'done_task': {'status': 'COMPLETED', 'data': {
+                    '_job_task_job_meta': {'key': 'job_2'}}},
+            }}},
+            {'graph': {'tasks': {
+                'proxying_task': {'status': 'RUNNING', 'proxied_task': {
+                    'data': {'_flow_task_flow_meta': {'key': 'flow_1'}}}},
+                'pending_task': {'status': 'PENDING'},
+            }}},
+        ]
+
+    def test_prefetches_running_tasks_children(self):
+        self.runner.prefetch_child_records(flow_records=self.flow_records)
+        self.assertEqual(
+            self.clients['mc.job_record_client'].prefetch_records.call_args,
+            call(metas=[{'key': 'job_1'}]))
+        self.assertEqual(
+            self.clients['mc.flow_record_client'].prefetch_records.call_args,
+            call(metas=[{'key': 'flow_1'}]))
+
+    def test_tick_clears_prefetched_records(self):
+        self.runner.claim_flow_records = MagicMock(
+            return_value=self.flow_records)
+        self.runner.tick_flow_records = MagicMock(
+            side_effect=Exception('tick error'))
+        with self.assertRaises(Exception):
+            self.runner.tick()
+        for client in self.clients.values():
+            self.assertEqual(client.prefetch_records.call_count, 1)
+            self.assertEqual(client.clear_prefetched_records.call_count, 1)
+
+
+class WorkerProcessPrefetchedRecordsTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clients = {
+            'mc.job_record_client': JobRecordClient(mc_db=MagicMock()),
+            'mc.flow_record_client': FlowRecordClient(mc_db=MagicMock()),
+        }
+        self.runner.task_ctx = self.clients
+        self.flow_records = [
+            {'graph': {'tasks': {'job_task': {'status': 'RUNNING', 'data': {
+                '_job_task_job_meta': {'key': 'job_1'}}}}}},
+            {'graph': {'tasks': {'flow_task': {'status': 'RUNNING', 'data': {
+                '_flow_task_flow_meta': {'key': 'flow_1'}}}}}},
+        ]
+        for client, key in [(self.clients['mc.job_record_client'], 'job_1'),
+                            (self.clients['mc.flow_record_client'], 'flow_1')]:
+            client.mc_db.get_items_by_keys.return_value = {
+                key: {'key': key, 'status': 'COMPLETED'}}
+        self.runner.prefetch_child_records(flow_records=self.flow_records)
+
+    def test_gets_flow_records_prefetched_child_records(self):
+        self.assertEqual(
+            self.runner.get_prefetched_child_records(
+                flow_record=self.flow_records[0]),
+            {'mc.job_record_client': {
+                'job_1': {'key': 'job_1', 'status': 'COMPLETED'}},
+             'mc.flow_record_client': {}})
+
+    def test_worker_process_ticks_with_prefetched_child_records(self):
+        worker_runner = flow_runner.FlowRunner(
+            flow_record_client=MagicMock(), flow_engine=MagicMock(),
+            task_ctx={'mc.job_record_client': JobRecordClient(
+                mc_db=MagicMock())})
+        worker_client = worker_runner.task_ctx['mc.job_record_client']
+        prefetched_statuses = []
+
+        def mock_tick(flow_record=None, claim_time=None):
+            prefetched_statuses.append(worker_client.get_prefetched_status(
+                meta={'key': 'job_1'}))
+            return 'RUNNING'
+        worker_runner._tick_and_release_flow_record_in_unit_of_work = \
+            mock_tick
+        with patch.object(flow_runner, '_worker_process_runner',
+                          worker_runner):
+            flow_runner._tick_and_release_flow_record_in_worker_process(
+                flow_record=self.flow_records[0], claim_time=1,
+                prefetched_child_records=(
+                    self.runner.get_prefetched_child_records(
+                        flow_record=self.flow_records[0])))
+        self.assertEqual(prefetched_statuses, ['COMPLETED'])
+        self.assertEqual(
+            worker_client.get_prefetched_status(meta={'key': 'job_1'}), None)
+
+
 class ClaimFlowRecordsTestCase(BaseTestCase):
     def test_dispatches_to_flow_record_client(self):
         self.runner.claim_flow_records()
         self.assertEqual(
             self.runner.flow_record_client.claim_flow_records.call_args,
-            call())
+            call(params={'limit': self.runner.max_flows_per_tick}))
+
+    def test_passes_claim_order_by(self):
+        self.runner.claim_order_by = {'field': 'depth', 'direction': 'desc'}
+        self.runner.claim_flow_records()
+        self.assertEqual(
+            self.runner.flow_record_client.claim_flow_records.call_args,
+            call(params={'limit': self.runner.max_flows_per_tick,
+                         'order_by': self.runner.claim_order_by}))
+
+    def test_passes_dirty_only(self):
+        self.runner.claim_flow_records(dirty_only=True)
+        self.assertEqual(
+            self.runner.flow_record_client.claim_flow_records.call_args,
+            call(params={'limit': self.runner.max_flows_per_tick,
+                         'dirty_only': True}))
+
+    def test_passes_changed_only_if_skip_unchanged_flows(self):
+        self.runner.skip_unchanged_flows = True
+        self.runner.claim_flow_records()
+        self.assertEqual(
+            self.runner.flow_record_client.claim_flow_records.call_args,
+            call(params={'limit': self.runner.max_flows_per_tick,
+                         'changed_only': True}))
+
+
+class ConcurrentTickFlowRecordsTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.runner.max_workers = 3
+        self.flow_records = [{'key': 'flow_%s' % i, 'status': 'RUNNING'}
+                             for i in range(3)]
+        self.runner.patch_and_release_flow_record = MagicMock()
+
+    def tearDown(self):
+        super().tearDown()
+        self.runner.shutdown_executor()
+
+    def test_ticks_flow_records_concurrently(self):
+        barrier = threading.Barrier(len(self.flow_records), timeout=5)
+
+        def mock_tick_flow_record(flow_record=None, claim_time=None):
+            barrier.wait()
+            return {'status': 'COMPLETED'}
+        self.runner.tick_flow_record = mock_tick_flow_record
+        result = self.runner.tick_flow_records(flow_records=self.flow_records)
+        self.assertEqual(result, {'COMPLETED': 3})
+        self.assertEqual(
+            sorted(patch_call[1]['flow_record']['key'] for patch_call in
+                   self.runner.patch_and_release_flow_record.call_args_list),
+            [flow_record['key'] for flow_record in self.flow_records])
+
+    def test_ticks_each_flow_record_in_a_unit_of_work(self):
+        self.runner.tick_flow_record = MagicMock(return_value={})
+        self.runner.tick_flow_records(flow_records=self.flow_records)
+        unit_of_work = self.runner.flow_record_client.mc_db.unit_of_work
+        self.assertEqual(unit_of_work.call_count, len(self.flow_records))
+
+    def test_commits_claims_before_ticking(self):
+        self.runner.claim_flow_records()
+        unit_of_work = self.runner.flow_record_client.mc_db.unit_of_work
+        self.assertEqual(unit_of_work.call_count, 1)
+        self.assertEqual(
+            self.runner.flow_record_client.claim_flow_records.call_count, 1)
+
+    def test_requires_runner_factory_for_process_executor(self):
+        self.runner.executor_type = 'process'
+        with self.assertRaises(Exception):
+            self.runner.get_executor()
 
 
 class TickFlowRecordsTestCase(BaseTestCase):
@@ -79,7 +332,7 @@ class TickFlowRecordsTestCase(BaseTestCase):
         self._tick_flow_records()
         self.assertEqual(
             self.runner.tick_flow_record.call_args_list,
-            [call(flow_record=flow_record)
+            [call(flow_record=flow_record, claim_time=None)
              for flow_record in self.flow_records]
         )
 
@@ -94,6 +347,12 @@ class TickFlowRecordsTestCase(BaseTestCase):
             ]
         )
 
+    def test_falls_back_to_record_status_for_unpatched_status(self):
+        self.flow_records = [{'key': 'k', 'status': 'RUNNING'}]
+        self.runner.tick_flow_record.return_value = {}
+        result = self._tick_flow_records()
+        self.assertEqual(result, {'RUNNING': 1})
+
     def test_returns_tick_stats(self):
         result = self._tick_flow_records()
         expected_tick_stats = defaultdict(int)
@@ -133,12 +392,220 @@ class TickFlowRecordTestCase(BaseTestCase):
             self.runner.flow_engine.tick_flow_until_has_no_pending.call_args,
             call(flow=self.expected_flow, task_ctx=self.runner.task_ctx))
 
+    @patch.object(flow_runner, 'time')
+    def test_passes_deadline_for_flow_tick_budget(self, _time):
+        _time.time.return_value = 100
+        self.runner.flow_tick_budget = 5
+        self.runner.tick_flow_record(flow_record=self.flow_record)
+        self.assertEqual(
+            self.runner.flow_engine.tick_flow_until_has_no_pending.call_args,
+            call(flow=self.expected_flow, task_ctx=self.runner.task_ctx,
+                 deadline=105))
+
+    def test_keeps_flow_dirty_if_budget_leaves_startable_tasks(self):
+        self.runner.flow_tick_budget = 5
+        self.expected_flow.status = 'RUNNING'
+        self.runner.flow_engine.get_startable_pending_tasks.return_value = [
+            MagicMock()]
+        self.runner.flow_engine.flow_to_flow_dict.return_value = {}
+        patches = self.runner.tick_flow_record(flow_record={'dirty': False})
+        self.assertEqual(patches, {'dirty': True})
+
+    def test_does_not_mark_dirty_if_no_startable_tasks_remain(self):
+        self.runner.flow_tick_budget = 5
+        self.expected_flow.status = 'RUNNING'
+        self.runner.flow_engine.get_startable_pending_tasks.return_value = []
+        self.runner.flow_engine.flow_to_flow_dict.return_value = {}
+        patches = self.runner.tick_flow_record(flow_record={'dirty': False})
+        self.assertEqual(patches, {})
+
     def test_returns_flow_dict(self):
         mock_flow_dict = {'key_%s' % i: MagicMock() for i in range(3)}
         self.runner.flow_engine.flow_to_flow_dict.return_value = mock_flow_dict
         result = self.runner.tick_flow_record(self.flow_record)
         self.assertEqual(result, mock_flow_dict)
 
+    def test_returns_only_changed_fields(self):
+        flow_record = {
+            'key': 'some_key',
+            'label': 'some_label',
+            'status': 'RUNNING',
+            'data': {},
+            'graph': {'tasks': {'t1': {'key': 't1', 'status': 'PENDING'}}},
+        }
+
+        def mock_flow_record_to_flow(flow_record=None):
+            # Mutate the record's dicts in place, as hydrated flows do.
+            flow_record['graph']['tasks']['t1']['status'] = 'COMPLETED'
+            return MagicMock(data=flow_record['data'])
+        self.runner.flow_record_to_flow = mock_flow_record_to_flow
+
+        def mock_flow_to_flow_dict(flow=None):
+            return {**flow_record, 'status': 'RUNNING'}
+        self.runner.flow_engine.flow_to_flow_dict = mock_flow_to_flow_dict
+        result = self.runner.tick_flow_record(flow_record)
+        self.assertEqual(sorted(result.keys()), ['data', 'graph'])
+        self.assertEqual(result['graph']['tasks']['t1']['status'],
+                         'COMPLETED')
+
+
+class LazyTickFlowRecordTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.runner.lazy_hydration = True
+        self.runner.flow_engine = FlowEngine()
+        tasks = [{'key': 'done_%s' % i, 'status': 'COMPLETED'}
+                 for i in range(3)]
+        tasks.append({'key': 'pending', 'task_type': 'noop'})
+        self.flow_dict = Flow.from_flow_spec(
+            flow_spec={'tasks': tasks}).to_flow_dict()
+
+    def test_skips_graph_if_hydrated_part_is_unchanged(self):
+        self.runner.flow_engine.tick_flow_until_has_no_pending = MagicMock()
+        with patch.object(Flow, '_merge_opaque_graph') as merge:
+            patches = self.runner.tick_flow_record(
+                flow_record=self.flow_dict)
+        self.assertNotIn('graph', patches)
+        self.assertEqual(merge.call_count, 0)
+
+    def test_patches_whole_graph_if_hydrated_part_changed(self):
+        patches = self.runner.tick_flow_record(flow_record=self.flow_dict)
+        self.assertEqual(sorted(patches['graph']['tasks'].keys()),
+                         ['ROOT', 'done_0', 'done_1', 'done_2', 'pending'])
+        self.assertEqual(patches['graph']['tasks']['pending']['status'],
+                         'COMPLETED')
+        self.assertEqual(len(patches['graph']['edges']), 4)
+
+
+class GetWaitFieldsTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.runner.flow_engine.get_startable_pending_tasks = (
+            FlowEngine().get_startable_pending_tasks)
+        self.flow = Flow()
+        self.flow.add_task(task={
+            'key': 'job_task', 'status': 'RUNNING',
+            'precursors': [Flow.ROOT_TASK_KEY],
+            'data': {'_job_task_job_meta': {'key': 'job_1'}}})
+        self.flow.add_task(task={
+            'key': 'flow_task', 'status': 'RUNNING',
+            'precursors': [Flow.ROOT_TASK_KEY],
+            'proxied_task': {
+                'data': {'_flow_task_flow_meta': {'key': 'flow_1'}}}})
+        self.flow.add_task(task={'key': 'next_task',
+                                 'precursors': ['job_task']})
+        self.flow.key = 'flow:parent'
+        self.clients = {
+            'mc.job_record_client': JobRecordClient(mc_db=MagicMock()),
+            'mc.flow_record_client': FlowRecordClient(mc_db=MagicMock()),
+        }
+        self.runner.task_ctx = self.clients
+        self._set_prefetched_child_records()
+
+    def _set_prefetched_child_records(self, job_1=None, flow_1=None):
+        for client_key, key, overrides in [
+            ('mc.job_record_client', 'job_1', job_1),
+            ('mc.flow_record_client', 'flow_1', flow_1),
+        ]:
+            record = {'key': key, 'status': 'RUNNING',
+                      'parent_key': self.flow.key, **(overrides or {})}
+            self.clients[client_key].set_prefetched_records(
+                records={key: record})
+
+    def test_sets_watermark_if_only_waiting_on_children(self):
+        self.assertEqual(
+            self.runner.get_wait_fields(flow=self.flow, claim_time=100),
+            {'child_watermark': 100 - self.runner.CHILD_WATERMARK_MARGIN})
+
+    def test_clears_watermark_if_child_has_no_parent_key(self):
+        self._set_prefetched_child_records(job_1={'parent_key': None})
+        wait_fields = self.runner.get_wait_fields(flow=self.flow,
+                                                  claim_time=100)
+        self.assertEqual(wait_fields['child_watermark'], None)
+
+    def test_clears_watermark_if_child_was_not_prefetched(self):
+        self.clients['mc.flow_record_client'].clear_prefetched_records()
+        wait_fields = self.runner.get_wait_fields(flow=self.flow,
+                                                  claim_time=100)
+        self.assertEqual(wait_fields['child_watermark'], None)
+
+    def test_clears_watermark_if_child_already_finished(self):
+        self._set_prefetched_child_records(job_1={'status': 'COMPLETED'})
+        wait_fields = self.runner.get_wait_fields(flow=self.flow,
+                                                  claim_time=100)
+        self.assertEqual(wait_fields['child_watermark'], None)
+
+    def test_clears_watermark_if_flow_has_other_running_tasks(self):
+        self.flow.add_task(task={'key': 'other_task', 'status': 'RUNNING',
+                                 'precursors': [Flow.ROOT_TASK_KEY]})
+        wait_fields = self.runner.get_wait_fields(flow=self.flow,
+                                                  claim_time=100)
+        self.assertEqual(wait_fields['child_watermark'], None)
+
+    def test_clears_watermark_if_flow_has_tickable_pending_tasks(self):
+        self.flow.add_task(task={'key': 'other_task',
+                                 'precursors': [Flow.ROOT_TASK_KEY]})
+        wait_fields = self.runner.get_wait_fields(flow=self.flow,
+                                                  claim_time=100)
+        self.assertEqual(wait_fields['child_watermark'], None)
+
+    @patch.object(flow_runner, 'time')
+    def test_tick_flow_record_patches_wait_fields(self, _time):
+        _time.time.return_value = 100
+        self.runner.skip_unchanged_flows = True
+        self.runner.flow_record_to_flow = MagicMock(return_value=self.flow)
+        self.runner.flow_engine.flow_to_flow_dict.return_value = {}
+        patches = self.runner.tick_flow_record(flow_record={'key': 'k'},
+                                               claim_time=90)
+        self.assertEqual(patches['child_watermark'],
+                         90 - self.runner.CHILD_WATERMARK_MARGIN)
+
+    def test_wakes_flow_for_child_that_finishes_during_tick(self):
+        mc_db = db.Db(db_uri='sqlite://', ensure_tables=True)
+        flow_record = mc_db.create_item(item_type='flow', item_kwargs={})
+        job = mc_db.create_item(item_type='job', item_kwargs={
+            'parent_key': flow_record['key'], 'status': 'RUNNING'})
+        claim_time = time.time()
+        # The job finishes after the claim and prefetch, so the flow's task
+        # still saw it RUNNING.
+        mc_db.patch_item(item_type='job', key=job['key'],
+                         patches={'status': 'COMPLETED'})
+        mc_db.patch_item(
+            item_type='flow', key=flow_record['key'],
+            patches=self.runner.get_wait_fields(flow=self.flow,
+                                                claim_time=claim_time))
+        claimable_keys = [
+            flow.key for flow in mc_db.generate_flow_queue_claim_query(
+                changed_only=True)
+        ]
+        self.assertEqual(claimable_keys, [flow_record['key']])
+
+    def test_does_not_wake_flow_for_child_that_gets_claimed(self):
+        mc_db = db.Db(db_uri='sqlite://', ensure_tables=True)
+        flow_record = mc_db.create_item(item_type='flow', item_kwargs={})
+        job = mc_db.create_item(item_type='job', item_kwargs={
+            'parent_key': flow_record['key'], 'status': 'PENDING'})
+        mc_db.patch_item(
+            item_type='flow', key=flow_record['key'],
+            patches=self.runner.get_wait_fields(flow=self.flow,
+                                                claim_time=time.time()))
+        mc_db.patch_item(item_type='job', key=job['key'],
+                         patches={'status': 'RUNNING', 'claimed': True})
+        self.assertEqual(
+            mc_db.generate_flow_queue_claim_query(changed_only=True).all(),
+            [])
+
+
+class GetChangedFieldsTestCase(BaseTestCase):
+    def test_gets_changed_fields(self):
+        flow_record = {'a': 1, 'b': {'x': 1}, 'c': [1], 'd': 'unchanged'}
+        snapshot = self.runner.snapshot_flow_record(flow_record=flow_record)
+        updated_flow_dict = {'a': 2, 'b': {'x': 1}, 'c': [1, 2],
+                             'd': 'unchanged', 'e': None}
+        result = self.runner.get_changed_fields(
+            flow_record_snapshot=snapshot, updated_flow_dict=updated_flow_dict)
+        self.assertEqual(result, {'a': 2, 'c': [1, 2], 'e': None})
+
 
 class FlowRecordToFlowTestCase(BaseTestCase):
     def test_to_flow(self):
@@ -151,6 +618,15 @@ class FlowRecordToFlowTestCase(BaseTestCase):
         self.assertEqual(
             flow, self.runner.flow_engine.flow_dict_to_flow.return_value)
 
+    def test_hydrates_lazily_if_lazy_hydration(self):
+        self.runner.lazy_hydration = True
+        flow_record = MagicMock()
+        self.runner.flow_record_to_flow(flow_record=flow_record)
+        self.assertEqual(
+            self.runner.flow_engine.flow_dict_to_flow.call_args,
+            call(flow_dict=flow_record, lazy=True)
+        )
+
 
 class PatchAndReleaseFlowRecordTestCase(BaseTestCase):
     def test_patch_flow_record(self):
@@ -1,8 +1,13 @@
+from concurrent import futures
 import datetime
+import functools
+import hashlib
 import json
 import os
 import logging
+import shutil
 import tempfile
+import time
 import traceback
 
 
@@ -14,11 +19,46 @@ class JobRunner(object):
             super().__init__(self, error, *args, **kwargs)
 
     PROCESSED_TAG = 'PROCESSED'
+    STD_LOG_CHUNK_SIZE = 2**20
+    ELIDED_LOG_MARKER = '\n...[{num_elided_bytes} bytes elided]...\n'
 
     def __init__(self, job_record_client=None, build_jobdir_fn=None,
                  jobman=None, max_claims_per_tick=None, logger=None,
                  logging_cfg=None, jobman_source_key=None,
-                 artifact_handler=None, jobdirs_dir=None, **kwargs):
+                 artifact_handler=None, jobdirs_dir=None,
+                 max_build_workers=None, submission_batch_size=None,
+                 std_log_head_bytes=None, std_log_tail_bytes=None,
+                 std_log_archiver=None, input_staging_cache=None, **kwargs):
+        """
+        Args:
+            max_build_workers (int, optional): if greater than 1, build
+                claimed jobs' jobdirs concurrently, on a thread pool with this
+                many workers, and submit jobs to jobman as their jobdirs are
+                built. build_jobdir_fn and artifact_handler must then be
+                thread-safe. Default: None, for building and submitting jobs
+                one at a time.
+            submission_batch_size (int, optional): when building jobdirs
+                concurrently, submit built jobs to jobman in batches of this
+                size. Default: 1, to submit each job as soon as it is built.
+            std_log_head_bytes (int, optional): if this or std_log_tail_bytes
+                is set, only store this many bytes from the start of each
+                exposed std log in job records, plus std_log_tail_bytes from
+                the end. Logs are read with seeks, so memory use does not
+                grow with log size. Jobs also get 'std_log_metas', with each
+                log's path, size and sha256. Default: None, to store whole
+                logs.
+            std_log_tail_bytes (int, optional): see std_log_head_bytes.
+            std_log_archiver (mc.utils.archivers.base_archiver.BaseArchiver,
+                optional): archiver to ingest copies of logs that were too
+                big to store whole. Their archive metas go in the logs'
+                std_log_metas. Default: None, to not archive logs.
+            input_staging_cache (
+                mc.utils.input_staging_cache.InputStagingCache, optional):
+                cache to stage input artifacts from. Each artifact with a
+                content digest is materialized once, and then staged into
+                jobdirs from the cache. Default: None, to materialize every
+                input artifact in every jobdir.
+        """
         self.logger = logger or self._generate_logger(logging_cfg=logging_cfg)
         self.job_record_client = job_record_client
         self.build_jobdir_fn = build_jobdir_fn
@@ -27,6 +67,12 @@ class JobRunner(object):
         self.jobman_source_key = jobman_source_key or 'mc'
         self.artifact_handler = artifact_handler
         self.jobdirs_dir = jobdirs_dir
+        self.max_build_workers = max_build_workers
+        self.submission_batch_size = submission_batch_size or 1
+        self.std_log_head_bytes = std_log_head_bytes
+        self.std_log_tail_bytes = std_log_tail_bytes
+        self.std_log_archiver = std_log_archiver
+        self.input_staging_cache = input_staging_cache
 
         self.tick_counter = 0
 
@@ -107,6 +153,10 @@ class JobRunner(object):
         std_log_contents = self.get_std_log_contents_for_jobman_job(
             jobman_job=jobman_job)
         parse_results['std_logs'] = std_log_contents
+        if self.caps_std_logs:
+            parse_results['std_log_metas'] = \
+                    self.get_std_log_metas_for_jobman_job(
+                        jobman_job=jobman_job)
         failure_log_content = std_log_contents.get('failure')
         if failure_log_content:
             parse_results['error'] = failure_log_content
@@ -115,7 +165,18 @@ class JobRunner(object):
             parse_results['status'] = 'COMPLETED'
         return parse_results
 
+    @property
+    def caps_std_logs(self):
+        return (self.std_log_head_bytes is not None
+                or self.std_log_tail_bytes is not None)
+
     def get_std_log_contents_for_jobman_job(self, jobman_job=None):
+        std_log_contents = self.read_jobdir_logs(
+            job_spec=jobman_job['job_spec'],
+            logs=self.get_logs_to_expose(jobman_job=jobman_job))
+        return std_log_contents
+
+    def get_logs_to_expose(self, jobman_job=None):
         job_spec = jobman_job['job_spec']
         mc_job = jobman_job['source_meta']['mc_job']
         logs_to_expose = mc_job.get('cfg', {}).get('std_logs_to_expose') or []
@@ -125,9 +186,71 @@ class JobRunner(object):
             )
         if 'failure' not in logs_to_expose:
             logs_to_expose.append('failure')
-        std_log_contents = self.read_jobdir_logs(job_spec=job_spec,
-                                                 logs=logs_to_expose)
-        return std_log_contents
+        return logs_to_expose
+
+    def get_std_log_metas_for_jobman_job(self, jobman_job=None):
+        """
+        Returns:
+            std_log_metas (dict): metas for the exposed logs that exist, as
+                per :meth:`get_jobdir_log_meta`, keyed by log name.
+        """
+        job_spec = jobman_job['job_spec']
+        mc_job = jobman_job['source_meta']['mc_job']
+        std_log_metas = {}
+        for log in self.get_logs_to_expose(jobman_job=jobman_job):
+            log_meta = self.get_jobdir_log_meta(job_spec=job_spec, log=log,
+                                                mc_job=mc_job)
+            if log_meta is not None:
+                std_log_metas[log] = log_meta
+        return std_log_metas
+
+    def get_jobdir_log_meta(self, job_spec=None, log=None, mc_job=None):
+        """Summarize a log, and archive it if it is too big to store whole.
+
+        Returns:
+            log_meta (dict): dict with the log's 'path', 'size', 'sha256' and
+                'truncated' values, plus 'archive_meta' if the log was
+                archived. None if the log does not exist.
+        """
+        abs_log_path = self.get_jobdir_log_path(job_spec=job_spec, log=log)
+        if not os.path.exists(abs_log_path):
+            return None
+        size = os.path.getsize(abs_log_path)
+        log_meta = {
+            'path': abs_log_path,
+            'size': size,
+            'sha256': self.hash_file(path=abs_log_path),
+            'truncated': size > self.get_std_log_window_size(),
+        }
+        if log_meta['truncated'] and self.std_log_archiver:
+            log_meta['archive_meta'] = self.archive_log(
+                abs_log_path=abs_log_path, log=log, mc_job=mc_job)
+        return log_meta
+
+    def get_std_log_window_size(self):
+        return (self.std_log_head_bytes or 0) + (self.std_log_tail_bytes or 0)
+
+    def hash_file(self, path=None):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.STD_LOG_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def archive_log(self, abs_log_path=None, log=None, mc_job=None):
+        # Archivers name archived files after their source files, so ingest
+        # a hard link named after the job and log. Logs can be big, so only
+        # copy them if they can't be linked.
+        spill_path = os.path.join(
+            os.path.dirname(abs_log_path),
+            '{job_key}__{log}'.format(job_key=mc_job.get('key'), log=log))
+        if os.path.lexists(spill_path):
+            os.remove(spill_path)
+        try:
+            os.link(abs_log_path, spill_path)
+        except OSError:
+            shutil.copyfile(abs_log_path, spill_path)
+        return self.std_log_archiver.ingest(src=spill_path)
 
     def read_jobdir_logs(self, job_spec=None, logs=None):
         logs = logs or []
@@ -135,12 +258,42 @@ class JobRunner(object):
                 for log in logs}
 
     def read_jobdir_log(self, job_spec=None, log=None):
-        rel_log_path = job_spec['std_log_file_names'][log]
-        abs_log_path = os.path.join(job_spec['dir'], rel_log_path)
+        abs_log_path = self.get_jobdir_log_path(job_spec=job_spec, log=log)
         if os.path.exists(abs_log_path):
+            if self.caps_std_logs:
+                return self.read_log_window(path=abs_log_path)
             with open(abs_log_path) as f:
                 return f.read()
 
+    def get_jobdir_log_path(self, job_spec=None, log=None):
+        rel_log_path = job_spec['std_log_file_names'][log]
+        return os.path.join(job_spec['dir'], rel_log_path)
+
+    def read_log_window(self, path=None):
+        """Read a log's head and tail, eliding the middle of big logs.
+
+        Returns:
+            content (str): the log's first std_log_head_bytes and last
+                std_log_tail_bytes, decoded as utf-8, joined by
+                :attr:`ELIDED_LOG_MARKER`. The whole log if it fits.
+        """
+        head_bytes = self.std_log_head_bytes or 0
+        tail_bytes = self.std_log_tail_bytes or 0
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            if size <= head_bytes + tail_bytes:
+                return self._decode_log_bytes(f.read())
+            head = f.read(head_bytes)
+            f.seek(size - tail_bytes)
+            tail = f.read(tail_bytes)
+        marker = self.ELIDED_LOG_MARKER.format(
+            num_elided_bytes=(size - head_bytes - tail_bytes))
+        return (self._decode_log_bytes(head) + marker
+                + self._decode_log_bytes(tail))
+
+    def _decode_log_bytes(self, log_bytes=None):
+        return log_bytes.decode('utf-8', errors='replace')
+
     def parsed_jobman_jobs_to_keyed_patches(self, parsed_jobman_jobs=None):
         keyed_patches = {}
         for parsed_jobman_job in parsed_jobman_jobs:
@@ -158,12 +311,16 @@ class JobRunner(object):
                 'std_logs': parsed_jobman_job.get('std_logs')
             }
         }
+        if 'std_log_metas' in parsed_jobman_job:
+            patch['data']['std_log_metas'] = \
+                    parsed_jobman_job['std_log_metas']
         return patch
 
     def patch_job_records(self, keyed_patches=None):
         if not keyed_patches:
             return {}
-        self.job_record_client.patch_job_records(keyed_patches=keyed_patches)
+        self.job_record_client.patch_job_records(keyed_patches=keyed_patches,
+                                                 return_records=False)
 
     def finalize_jobman_jobs(self, jobman_jobs=None):
         if not jobman_jobs:
@@ -175,40 +332,160 @@ class JobRunner(object):
         self.jobman.save_jobs(jobs=marked_jobman_jobs)
 
     def fill_jobman_queue(self):
+        """Claim jobs, build their jobdirs, and submit them to jobman.
+
+        Returns:
+            claimed_stats (dict): counts of claimed, submitted and failed
+                jobs, plus a 'timings' dict of seconds spent per stage:
+                'claim', 'submit' and 'patch'. When building jobdirs
+                concurrently, 'build' is the total of the jobs' build times,
+                and 'submit' only covers jobman submissions.
+        """
+        timings = {}
+        stage_start_time = time.time()
         limit = self.get_claim_limit()
         claimed_job_records = self.job_record_client.claim_job_records(
             params={'limit': limit})
+        timings['claim'] = time.time() - stage_start_time
         job_records_by_submission_outcome = {'submitted': [], 'failed': []}
-        for mc_job in claimed_job_records:
-            try:
-                self.submit_mc_job(mc_job=mc_job)
-                job_records_by_submission_outcome['submitted'].append(mc_job)
-            except Exception as exc:
-                self.logger.exception("SubmissionError")
-                error = self.SubmissionError(cause=traceback.format_exc(),
-                                             mc_job=mc_job)
-                mc_job['data']['error'] = str(error)
-                job_records_by_submission_outcome['failed'].append(mc_job)
+        if (self.max_build_workers or 1) > 1:
+            self.submit_mc_jobs_concurrently(
+                mc_jobs=claimed_job_records,
+                job_records_by_submission_outcome=(
+                    job_records_by_submission_outcome),
+                timings=timings
+            )
+        else:
+            stage_start_time = time.time()
+            for mc_job in claimed_job_records:
+                try:
+                    self.submit_mc_job(mc_job=mc_job)
+                    job_records_by_submission_outcome['submitted'].append(
+                        mc_job)
+                except Exception as exc:
+                    self.handle_submission_error(
+                        mc_job=mc_job,
+                        job_records_by_submission_outcome=(
+                            job_records_by_submission_outcome)
+                    )
+            timings['submit'] = time.time() - stage_start_time
+        stage_start_time = time.time()
         self.patch_job_records_per_submission_outcome(
             job_records_by_submission_outcome=(
                 job_records_by_submission_outcome)
         )
+        timings['patch'] = time.time() - stage_start_time
+        self.logger.debug('fill_jobman_queue timings: %s' % timings)
         claimed_stats = {
             'claimed': len(claimed_job_records),
             **{
                 outcome: len(job_records)
                 for outcome, job_records in (
                     job_records_by_submission_outcome.items())
-            }
+            },
+            'timings': timings,
         }
         return claimed_stats
 
+    def handle_submission_error(self, mc_job=None,
+                                job_records_by_submission_outcome=None):
+        self.logger.exception("SubmissionError")
+        error = self.SubmissionError(cause=traceback.format_exc(),
+                                     mc_job=mc_job)
+        mc_job['data']['error'] = str(error)
+        job_records_by_submission_outcome['failed'].append(mc_job)
+
+    def submit_mc_jobs_concurrently(self, mc_jobs=None,
+                                    job_records_by_submission_outcome=None,
+                                    timings=None):
+        """Build jobdirs on a thread pool, and submit jobs as they are built.
+
+        Jobs are submitted from the calling thread, in batches of
+        submission_batch_size. A job whose jobdir fails to build is marked
+        as failed, without holding up the other jobs.
+
+        Args:
+            mc_jobs (list): claimed job records.
+            job_records_by_submission_outcome (dict): dict of 'submitted' and
+                'failed' job record lists, to add jobs to.
+            timings (dict): dict to add 'build' and 'submit' seconds to.
+        """
+        timings.update({'build': 0, 'submit': 0})
+        with futures.ThreadPoolExecutor(
+            max_workers=self.max_build_workers
+        ) as executor:
+            build_futures = {
+                executor.submit(self._build_jobdir_and_time, mc_job): mc_job
+                for mc_job in mc_jobs
+            }
+            built_jobs = []
+            for build_future in futures.as_completed(build_futures):
+                mc_job = build_futures[build_future]
+                try:
+                    job_spec, build_time = build_future.result()
+                except Exception as exc:
+                    self.handle_submission_error(
+                        mc_job=mc_job,
+                        job_records_by_submission_outcome=(
+                            job_records_by_submission_outcome)
+                    )
+                    continue
+                timings['build'] += build_time
+                built_jobs.append((mc_job, job_spec))
+                if len(built_jobs) >= self.submission_batch_size:
+                    self.submit_built_jobs(
+                        built_jobs=built_jobs,
+                        job_records_by_submission_outcome=(
+                            job_records_by_submission_outcome),
+                        timings=timings
+                    )
+                    built_jobs = []
+            self.submit_built_jobs(
+                built_jobs=built_jobs,
+                job_records_by_submission_outcome=(
+                    job_records_by_submission_outcome),
+                timings=timings
+            )
+
+    def _build_jobdir_and_time(self, mc_job=None):
+        start_time = time.time()
+        job_spec = self.build_jobdir(mc_job=mc_job)
+        return job_spec, time.time() - start_time
+
+    def submit_built_jobs(self, built_jobs=None,
+                          job_records_by_submission_outcome=None,
+                          timings=None):
+        """Submit a batch of jobs whose jobdirs have been built.
+
+        Args:
+            built_jobs (list): (mc_job, job_spec) tuples.
+            job_records_by_submission_outcome (dict): as for
+                :meth:`submit_mc_jobs_concurrently`.
+            timings (dict): dict to add 'submit' seconds to.
+        """
+        start_time = time.time()
+        for mc_job, job_spec in built_jobs:
+            try:
+                self.submit_job_spec(mc_job=mc_job, job_spec=job_spec)
+                job_records_by_submission_outcome['submitted'].append(mc_job)
+            except Exception as exc:
+                self.handle_submission_error(
+                    mc_job=mc_job,
+                    job_records_by_submission_outcome=(
+                        job_records_by_submission_outcome)
+                )
+        timings['submit'] += time.time() - start_time
+
     def get_claim_limit(self):
         return min(self.max_claims_per_tick, self.jobman.get_num_free_slots())
 
     def submit_mc_job(self, mc_job=None):
+        self.submit_job_spec(mc_job=mc_job,
+                             job_spec=self.build_jobdir(mc_job=mc_job))
+
+    def submit_job_spec(self, mc_job=None, job_spec=None):
         self.jobman.submit_job_spec(
-            job_spec=self.build_jobdir(mc_job=mc_job),
+            job_spec=job_spec,
             source_key=self.jobman_source_key,
             source_meta={'mc_job': mc_job}
         )
@@ -232,7 +509,23 @@ class JobRunner(object):
         artifacts = mc_job.get('job_inputs', {}).get('artifacts') or {}
         for artifact_key, artifact in artifacts.items():
             dest = os.path.join(inputs_dir, artifact_key)
+            if self.input_staging_cache is None:
+                self.artifact_handler.artifact_to_dir(artifact=artifact,
+                                                      dest=dest)
+            else:
+                self.stage_job_input(artifact=artifact, dest=dest)
+
+    def stage_job_input(self, artifact=None, dest=None):
+        cache_key = self.input_staging_cache.get_artifact_cache_key(
+            artifact=artifact)
+        if cache_key is None:
             self.artifact_handler.artifact_to_dir(artifact=artifact, dest=dest)
+            return
+        self.input_staging_cache.stage(
+            key=cache_key, dest=dest,
+            materialize_fn=functools.partial(
+                self.artifact_handler.artifact_to_dir, artifact=artifact)
+        )
 
     def patch_job_records_per_submission_outcome(
         self, job_records_by_submission_outcome=None):  # noqa
@@ -1,7 +1,12 @@
 from collections import defaultdict, OrderedDict
+import hashlib
+import os
+import shutil
+import tempfile
 import unittest
-from unittest.mock import call, MagicMock, patch
+from unittest.mock import ANY, call, MagicMock, patch
 
+from mc.utils.archivers.cas_archiver import CasArchiver
 from .. import job_runner
 
 
@@ -290,6 +295,93 @@ class ReadJobdirLogTestCase(BaseTestCase):
                          call(expected_job_file_path))
 
 
+class CappedStdLogsTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.log_bytes = b'head' + b'x' * 100 + b'tail'
+        with open(os.path.join(self.tmp_dir, 'stdout.log'), 'wb') as f:
+            f.write(self.log_bytes)
+        self.job_spec = {'dir': self.tmp_dir,
+                         'std_log_file_names': {'stdout': 'stdout.log',
+                                                'failure': 'failure.log'}}
+        self.jobman_job = {
+            'job_spec': self.job_spec,
+            'source_meta': {'mc_job': {
+                'key': 'some_job_key',
+                'cfg': {'std_logs_to_expose': 'all'}}}
+        }
+        self.job_runner.std_log_head_bytes = 4
+        self.job_runner.std_log_tail_bytes = 4
+
+    def test_reads_head_and_tail(self):
+        self.assertEqual(
+            self.job_runner.read_jobdir_log(job_spec=self.job_spec,
+                                            log='stdout'),
+            'head' + self.job_runner.ELIDED_LOG_MARKER.format(
+                num_elided_bytes=100) + 'tail')
+
+    def test_reads_small_logs_whole(self):
+        self.job_runner.std_log_head_bytes = 1000
+        self.assertEqual(
+            self.job_runner.read_jobdir_log(job_spec=self.job_spec,
+                                            log='stdout'),
+            self.log_bytes.decode())
+
+    def test_parses_std_log_metas(self):
+        parse_results = self.job_runner._parse_std_log_contents(
+            jobman_job=self.jobman_job)
+        self.assertEqual(parse_results['status'], 'COMPLETED')
+        self.assertEqual(parse_results['std_log_metas'], {'stdout': {
+            'path': os.path.join(self.tmp_dir, 'stdout.log'),
+            'size': len(self.log_bytes),
+            'sha256': hashlib.sha256(self.log_bytes).hexdigest(),
+            'truncated': True,
+        }})
+
+    def test_archives_truncated_logs(self):
+        archiver = MagicMock()
+        self.job_runner.std_log_archiver = archiver
+        std_log_metas = self.job_runner.get_std_log_metas_for_jobman_job(
+            jobman_job=self.jobman_job)
+        spill_path = os.path.join(self.tmp_dir, 'some_job_key__stdout')
+        self.assertEqual(archiver.ingest.call_args, call(src=spill_path))
+        self.assertEqual(std_log_metas['stdout']['archive_meta'],
+                         archiver.ingest.return_value)
+        with open(spill_path, 'rb') as f:
+            self.assertEqual(f.read(), self.log_bytes)
+
+    def test_links_logs_to_archive(self):
+        self.job_runner.std_log_archiver = MagicMock()
+        self.job_runner.get_std_log_metas_for_jobman_job(
+            jobman_job=self.jobman_job)
+        self.assertTrue(os.path.samefile(
+            os.path.join(self.tmp_dir, 'some_job_key__stdout'),
+            os.path.join(self.tmp_dir, 'stdout.log')))
+
+    @patch.object(job_runner.os, 'link')
+    def test_copies_logs_to_archive_if_they_cant_be_linked(self, _link):
+        _link.side_effect = OSError()
+        self.job_runner.std_log_archiver = MagicMock()
+        self.job_runner.get_std_log_metas_for_jobman_job(
+            jobman_job=self.jobman_job)
+        spill_path = os.path.join(self.tmp_dir, 'some_job_key__stdout')
+        self.assertFalse(os.path.samefile(
+            spill_path, os.path.join(self.tmp_dir, 'stdout.log')))
+        with open(spill_path, 'rb') as f:
+            self.assertEqual(f.read(), self.log_bytes)
+
+    def test_archives_truncated_logs_with_cas_archiver(self):
+        archiver = CasArchiver(root_dir=os.path.join(self.tmp_dir, 'archive'))
+        self.job_runner.std_log_archiver = archiver
+        std_log_metas = self.job_runner.get_std_log_metas_for_jobman_job(
+            jobman_job=self.jobman_job)
+        path = archiver.materialize_as_path(
+            meta=std_log_metas['stdout']['archive_meta'])
+        self.assertEqual(path.read_bytes(), self.log_bytes)
+
+
 class ParsedJobmanJobsToKeyedPatchesTestCase(BaseTestCase):
     def setUp(self):
         super().setUp()
@@ -338,7 +430,7 @@ class PatchJobRecordsTestCase(BaseTestCase):
     def test_dispatches_to_job_record_client(self):
         self.assertEqual(
             self.job_runner.job_record_client.patch_job_records.call_args,
-            call(keyed_patches=self.keyed_patches)
+            call(keyed_patches=self.keyed_patches, return_records=False)
         )
 
 
@@ -387,7 +479,57 @@ class FillJobmanQueueTestCase(BaseTestCase):
         expected_claimed_stats = {'claimed': expected_num_claimed,
                                   'submitted': expected_num_claimed,
                                   'failed': 0}
+        timings = self.result.pop('timings')
         self.assertEqual(self.result, expected_claimed_stats)
+        self.assertEqual(sorted(timings.keys()),
+                         ['claim', 'patch', 'submit'])
+
+
+class FillJobmanQueueConcurrentlyTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mockify_job_runner_attrs(attrs=[
+            'get_claim_limit', 'patch_job_records_per_submission_outcome'])
+        self.job_runner.max_build_workers = 4
+        self.job_runner.submission_batch_size = 2
+        self.mc_jobs = [{'key': 'job_%s' % i, 'data': {}} for i in range(5)]
+        self.job_runner.job_record_client.claim_job_records.return_value = (
+            self.mc_jobs)
+
+        def build_jobdir(mc_job=None):
+            if mc_job['key'] == 'job_1':
+                raise Exception('build error')
+            return {'dir': mc_job['key']}
+        self.job_runner.build_jobdir = build_jobdir
+        self.result = self.job_runner.fill_jobman_queue()
+
+    def _get_outcomes(self):
+        return (self.job_runner.patch_job_records_per_submission_outcome
+                .call_args[1]['job_records_by_submission_outcome'])
+
+    def test_submits_built_jobs(self):
+        submit_calls = self.job_runner.jobman.submit_job_spec.call_args_list
+        self.assertEqual(
+            sorted(submit_call[1]['job_spec']['dir']
+                   for submit_call in submit_calls),
+            ['job_0', 'job_2', 'job_3', 'job_4'])
+        for submit_call in submit_calls:
+            self.assertEqual(submit_call[1]['source_meta']['mc_job']['key'],
+                             submit_call[1]['job_spec']['dir'])
+
+    def test_fails_jobs_with_build_errors(self):
+        outcomes = self._get_outcomes()
+        self.assertEqual([job['key'] for job in outcomes['failed']],
+                         ['job_1'])
+        self.assertTrue('build error' in outcomes['failed'][0]['data'][
+            'error'])
+        self.assertEqual(len(outcomes['submitted']), 4)
+
+    def test_returns_stats_with_stage_timings(self):
+        self.assertEqual(self.result['submitted'], 4)
+        self.assertEqual(self.result['failed'], 1)
+        self.assertEqual(sorted(self.result['timings'].keys()),
+                         ['build', 'claim', 'patch', 'submit'])
 
 
 class SubmitMcJobTestCase(BaseTestCase):
@@ -469,3 +611,49 @@ class PrepareJobInputsTestCase(BaseTestCase):
             self.job_runner.artifact_handler.artifact_to_dir.call_args_list,
             expected_call_args_list
         )
+
+
+class PrepareJobInputsWithStagingCacheTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.job_runner.input_staging_cache = MagicMock()
+        self.artifacts = {'artifact_%s' % i: MagicMock() for i in range(3)}
+        self.mc_job = {'job_inputs': {'artifacts': self.artifacts}}
+        self.jobdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.jobdir)
+        self.expected_inputs_dir = os.path.join(self.jobdir, 'inputs')
+
+    def prepare_job_inputs(self):
+        self.job_runner.prepare_job_inputs(mc_job=self.mc_job,
+                                           jobdir=self.jobdir)
+
+    def test_stages_artifacts_from_cache(self):
+        cache = self.job_runner.input_staging_cache
+        self.prepare_job_inputs()
+        self.assertEqual(
+            cache.stage.call_args_list,
+            [call(key=cache.get_artifact_cache_key.return_value,
+                  dest=os.path.join(self.expected_inputs_dir, artifact_key),
+                  materialize_fn=ANY)
+             for artifact_key in self.artifacts]
+        )
+        self.assertEqual(
+            self.job_runner.artifact_handler.artifact_to_dir.call_count, 0)
+
+    def test_materialize_fn_calls_artifact_to_dir(self):
+        self.prepare_job_inputs()
+        materialize_fn = (self.job_runner.input_staging_cache.stage
+                          .call_args[1]['materialize_fn'])
+        materialize_fn(dest='some_dest')
+        self.assertEqual(
+            self.job_runner.artifact_handler.artifact_to_dir.call_args,
+            call(artifact=self.artifacts['artifact_2'], dest='some_dest')
+        )
+
+    def test_calls_artifact_to_dir_for_uncacheable_artifacts(self):
+        cache = self.job_runner.input_staging_cache
+        cache.get_artifact_cache_key.return_value = None
+        self.prepare_job_inputs()
+        self.assertEqual(cache.stage.call_count, 0)
+        self.assertEqual(
+            self.job_runner.artifact_handler.artifact_to_dir.call_count, 3)
@@ -0,0 +1,35 @@
+from .base_async_task_handler import BaseAsyncTaskHandler
+from .job_task_handler import JobTaskHandler
+
+
+class AsyncJobTaskHandler(BaseAsyncTaskHandler, JobTaskHandler):
+    """Creates and tracks jobs, via an async job_record client.
+
+    Expects task_ctx['mc.job_record_client'] to be an
+    :class:`mc.clients.async_clients.AsyncJobRecordClient`.
+    """
+
+    async def initial_tick(self):
+        self.task['data']['_job_task_job_meta'] = (
+            await self.create_job_record())
+
+    async def intermediate_tick(self):
+        if self.job_is_unfinished():
+            return
+        job_record = await self.get_job_record()
+        self.handle_job_record(job_record=job_record)
+
+    async def create_job_record(self):
+        job_kwargs = {
+            **self.task['task_params'],
+            'parent_key': self.task_ctx['flow'].key
+        }
+        return await self.job_record_client.create_job_record(
+            job_kwargs=job_kwargs)
+
+    async def get_job_record(self):
+        return await self.job_record_client.get_job_record(
+            job_meta=self.task['data']['_job_task_job_meta'])
+
+
+TaskHandler = AsyncJobTaskHandler
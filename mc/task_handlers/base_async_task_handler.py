@@ -0,0 +1,28 @@
+from .base_task_handler import BaseTaskHandler
+
+
+class BaseAsyncTaskHandler(BaseTaskHandler):
+    """A BaseTaskHandler whose ticks are coroutines.
+
+    For use with :class:`mc.flows.async_flow_engine.AsyncFlowEngine`.
+    Subclasses implement :code:`async def initial_tick` and
+    :code:`async def intermediate_tick`, and should await I/O rather than
+    block on it.
+    """
+
+    @classmethod
+    async def tick_task(cls, task_ctx=None, logger=None, **kwargs):
+        await cls(task_ctx=task_ctx, logger=logger, **kwargs)._tick_task(
+            **kwargs)
+
+    async def _tick_task(self, **kwargs):
+        try:
+            await self._start_tick()(**kwargs)
+        except Exception:
+            self._fail_task()
+
+    async def initial_tick(self, task=None, **kwargs):
+        raise NotImplementedError
+
+    async def intermediate_tick(self, task=None, **kwargs):
+        raise NotImplementedError
@@ -47,25 +47,37 @@ class BaseTaskHandler(object):
 
     def _tick_task(self, **kwargs):
         try:
-            self._ensure_task()
+            self._start_tick()(**kwargs)
+        except Exception:
+            self._fail_task()
+
+    def _start_tick(self):
+        """Validate the task and count the tick.
+
+        Returns:
+            tick_fn (callable): initial_tick on the task's first tick, and
+                intermediate_tick after that.
+        """
+        self._ensure_task()
+        try:
+            self.validate_task_ctx()
+        except Exception as exc:
+            raise self.InvalidTaskCtxError() from exc
+        self.increment_tick_counter()
+        if self.task['data']['_tick_counter'] == 1:
+            self.task['status'] = 'RUNNING'
             try:
-                self.validate_task_ctx()
+                self.validate_task_params()
             except Exception as exc:
-                raise self.InvalidTaskCtxError() from exc
-            self.increment_tick_counter()
-            if self.task['data']['_tick_counter'] == 1:
-                self.task['status'] = 'RUNNING'
-                try:
-                    self.validate_task_params()
-                except Exception as exc:
-                    raise self.InvalidTaskParamsError() from exc
-                self.initial_tick(**kwargs)
-            else:
-                self.intermediate_tick(**kwargs)
-        except Exception as exception:
-            self.logger.exception(self.__class__.__name__ + ".tick_task")
-            self.task['status'] = 'FAILED'
-            self.task['data']['error'] = traceback.format_exc()
+                raise self.InvalidTaskParamsError() from exc
+            return self.initial_tick
+        return self.intermediate_tick
+
+    def _fail_task(self):
+        """Mark the task FAILED. Call from an exception handler."""
+        self.logger.exception(self.__class__.__name__ + ".tick_task")
+        self.task['status'] = 'FAILED'
+        self.task['data']['error'] = traceback.format_exc()
 
     def _ensure_task(self):
         self.task.setdefault('data', {})
@@ -40,9 +40,27 @@ class FlowTaskHandler(BaseFlowTaskHandler):
     def flow_record_client(self, value): self._flow_record_client = value
 
     def intermediate_tick(self):
+        if self.flow_is_unfinished():
+            return
         flow = self.get_flow()
         self.handle_flow_status(flow=flow)
 
+    def flow_is_unfinished(self):
+        """Check the subflow's prefetched status, if the runner prefetched
+        it.
+
+        Returns:
+            is_unfinished (bool): True if the subflow's prefetched status is
+                PENDING or RUNNING, False otherwise.
+        """
+        get_prefetched_status = getattr(self.flow_record_client,
+                                        'get_prefetched_status', None)
+        if get_prefetched_status is None:
+            return False
+        prefetched_status = get_prefetched_status(
+            meta=self.task['data']['_flow_task_flow_meta'])
+        return prefetched_status in {'PENDING', 'RUNNING'}
+
     def get_flow(self):
         flow_record = self.get_flow_record()
         return self.flow_engine.flow_dict_to_flow(flow_dict=flow_record)
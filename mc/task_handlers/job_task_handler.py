@@ -14,7 +14,26 @@ class JobTaskHandler(BaseTaskHandler):
         self.task['data']['_job_task_job_meta'] = self.create_job_record()
 
     def intermediate_tick(self):
-        job_record = self.get_job_record()
+        if self.job_is_unfinished():
+            return
+        self.handle_job_record(job_record=self.get_job_record())
+
+    def job_is_unfinished(self):
+        """Check the job's prefetched status, if the runner prefetched it.
+
+        Returns:
+            is_unfinished (bool): True if the job's prefetched status is
+                PENDING or RUNNING, False otherwise.
+        """
+        get_prefetched_status = getattr(self.job_record_client,
+                                        'get_prefetched_status', None)
+        if get_prefetched_status is None:
+            return False
+        prefetched_status = get_prefetched_status(
+            meta=self.task['data']['_job_task_job_meta'])
+        return prefetched_status in {'PENDING', 'RUNNING'}
+
+    def handle_job_record(self, job_record=None):
         job_data = job_record.get('data', {})
         job_status = job_record.get('status')
         if job_status == 'COMPLETED':
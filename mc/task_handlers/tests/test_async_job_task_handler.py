@@ -0,0 +1,53 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, call, MagicMock
+
+from ..async_job_task_handler import AsyncJobTaskHandler
+
+
+class BaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.task = {'key': 'some_task', 'task_params': {'job_type': 'a'}}
+        self.job_record_client = MagicMock()
+        self.job_record_client.create_job_record = AsyncMock(
+            return_value={'key': 'some_job'})
+        self.job_record_client.get_job_record = AsyncMock()
+        self.task_ctx = {'task': self.task, 'flow': MagicMock(),
+                         'mc.job_record_client': self.job_record_client}
+
+    def _tick(self):
+        asyncio.run(AsyncJobTaskHandler.tick_task(task_ctx=self.task_ctx))
+
+
+class TickTaskTestCase(BaseTestCase):
+    def test_creates_job_record_on_initial_tick(self):
+        self._tick()
+        self.assertEqual(
+            self.job_record_client.create_job_record.call_args,
+            call(job_kwargs={'job_type': 'a',
+                             'parent_key': self.task_ctx['flow'].key}))
+        self.assertEqual(self.task['data']['_job_task_job_meta'],
+                         {'key': 'some_job'})
+        self.assertEqual(self.task['status'], 'RUNNING')
+
+    def test_completes_when_job_completes(self):
+        self._tick()
+        self.job_record_client.get_job_record.return_value = {
+            'status': 'COMPLETED', 'data': {'artifact': 'some_artifact'}}
+        self._tick()
+        self.assertEqual(self.job_record_client.get_job_record.call_args,
+                         call(job_meta={'key': 'some_job'}))
+        self.assertEqual(self.task['status'], 'COMPLETED')
+        self.assertEqual(self.task['data']['artifact'], 'some_artifact')
+
+    def test_fails_when_job_fails(self):
+        self._tick()
+        self.job_record_client.get_job_record.return_value = {
+            'status': 'FAILED', 'data': {'error': 'some_error'}}
+        self._tick()
+        self.assertEqual(self.task['status'], 'FAILED')
+        self.assertIn('some_error', self.task['data']['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
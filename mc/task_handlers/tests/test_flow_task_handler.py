@@ -100,6 +100,28 @@ class IntermediateTickTestCase(BaseTestCase):
         self.assertEqual(self.task_handler.handle_flow_status.call_args,
                          call(flow=self.task_handler.get_flow.return_value))
 
+class PrefetchedStatusTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.setup_handler_mocks(attrs=['get_flow', 'handle_flow_status',
+                                        'flow_record_client'])
+
+    def test_skips_fetch_for_unfinished_prefetched_flow(self):
+        self.task_handler.flow_record_client.get_prefetched_status \
+                .return_value = 'RUNNING'
+        self.task_handler.intermediate_tick()
+        self.assertEqual(
+            self.task_handler.flow_record_client.get_prefetched_status
+            .call_args,
+            call(meta=self.task['data']['_flow_task_flow_meta']))
+        self.assertEqual(self.task_handler.get_flow.call_count, 0)
+
+    def test_fetches_finished_prefetched_flow(self):
+        self.task_handler.flow_record_client.get_prefetched_status \
+                .return_value = 'COMPLETED'
+        self.task_handler.intermediate_tick()
+        self.assertEqual(self.task_handler.get_flow.call_count, 1)
+
 class GetFlowTestCase(BaseTestCase):
     def setUp(self):
         super().setUp()
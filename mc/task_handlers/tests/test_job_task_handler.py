@@ -113,6 +113,34 @@ class FailedJobTestCase(BaseTestCase, IntermediateTickMixin):
             })
             self.assertTrue(error in ctx.exception)
 
+class PrefetchedStatusTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.task_handler.task = {'data': {'_job_task_job_meta': {
+            'key': 'some_key'}}}
+        self.task_handler.get_job_record = MagicMock()
+        self.task_handler.handle_job_record = MagicMock()
+
+    def _tick_with_prefetched_status(self, status=None):
+        self.task_handler.job_record_client.get_prefetched_status \
+                .return_value = status
+        self.task_handler.intermediate_tick()
+
+    def test_skips_fetch_for_unfinished_prefetched_job(self):
+        self._tick_with_prefetched_status(status='RUNNING')
+        self.assertEqual(self.task_handler.get_job_record.call_count, 0)
+        self.assertEqual(self.task_handler.handle_job_record.call_count, 0)
+
+    def test_fetches_finished_prefetched_job(self):
+        self._tick_with_prefetched_status(status='COMPLETED')
+        self.assertEqual(
+            self.task_handler.handle_job_record.call_args,
+            call(job_record=self.task_handler.get_job_record.return_value))
+
+    def test_fetches_job_that_was_not_prefetched(self):
+        self._tick_with_prefetched_status(status=None)
+        self.assertEqual(self.task_handler.get_job_record.call_count, 1)
+
 class GetJobRecordTestCase(BaseTestCase):
     def test_dispatches_to_job_record_client(self):
         result = self.task_handler.get_job_record()
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import stat
+import uuid
+
+from mc.utils.file_link_utils import link_or_copy, reflink_or_copy
+from .dir_archiver import DirArchiver
+
+
+class CasArchiver(DirArchiver):
+    """Archiver that stores files in a content-addressed object store.
+
+    Each ingested file is hashed, and stored once under
+    'objects/<2 hex>/<rest of hex>', no matter how many dirs contain it.
+    Each ingested dir gets a JSON manifest of its files, subdirs and
+    symlinks, at 'manifests/<key>.json'. Single files, like logs, can also be
+    ingested, and get a manifest with a single entry. Keys are generated as
+    for :class:`DirArchiver`.
+
+    Objects are moved into the store when possible, and otherwise copied,
+    with a reflink if the filesystem supports it. Objects are read-only,
+    since materialized trees hardlink to them. Files that differ only in
+    their executable bits are stored as separate objects.
+
+    :meth:`materialize_as_path` rebuilds a dir from its manifest, as a tree
+    of hardlinks to objects, or an ingested file as a hardlink.
+    """
+    OBJECTS_DIR_NAME = 'objects'
+    MANIFESTS_DIR_NAME = 'manifests'
+    MATERIALIZED_DIR_NAME = 'materialized'
+    CHUNK_SIZE = 2**20
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.objects_path = self.root_path / self.OBJECTS_DIR_NAME
+        self.manifests_path = self.root_path / self.MANIFESTS_DIR_NAME
+        self.materialized_path = self.root_path / self.MATERIALIZED_DIR_NAME
+        self.tmp_path = self.root_path / 'tmp'
+        self.tmp_path.mkdir(parents=True, exist_ok=True)
+
+    def ingest(self, src=None, remove_src=True, **kwargs):
+        """Ingest a dir or a file.
+
+        Args:
+            src (str): path to dir or file to ingest.
+            remove_src (bool, optional): remove src after ingesting it. This
+                lets files be moved into the object store, rather than
+                copied. Default: True.
+
+        Returns:
+            meta (dict): dict with src's 'key', and 'num_files',
+                'num_new_objects' and 'num_bytes' stats.
+        """
+        if os.path.isdir(src) and not os.path.islink(src):
+            root_type = 'dir'
+            entries, num_new_objects = self.ingest_tree(
+                src=src, take_files=remove_src)
+        else:
+            root_type = 'file'
+            entry, is_new = self.ingest_file(path=src, take_file=remove_src)
+            entries = [{**entry, 'path': '.'}]
+            num_new_objects = int(is_new)
+        rel_dest_path = self._generate_rel_dest_path(src=src)
+        self.write_manifest(key=str(rel_dest_path),
+                            manifest={'root_type': root_type,
+                                      'entries': entries})
+        if remove_src:
+            if root_type == 'dir':
+                shutil.rmtree(src)
+            elif os.path.lexists(src):
+                os.remove(src)
+        file_entries = [entry for entry in entries if entry['type'] == 'file']
+        return {
+            'key': str(rel_dest_path),
+            'num_files': len(file_entries),
+            'num_new_objects': num_new_objects,
+            'num_bytes': sum(entry['size'] for entry in file_entries),
+        }
+
+    def ingest_tree(self, src=None, take_files=False):
+        """Store a dir's files as objects.
+
+        Returns:
+            (entries, num_new_objects) (tuple): entries is a list of manifest
+                entries for the dir's subdirs, files and symlinks.
+        """
+        src_path = Path(src)
+        entries = []
+        num_new_objects = 0
+        for dir_path, dir_names, file_names in os.walk(src):
+            dir_names.sort()
+            rel_dir_path = Path(dir_path).relative_to(src_path)
+            for dir_name in list(dir_names):
+                abs_path = Path(dir_path, dir_name)
+                if abs_path.is_symlink():
+                    # os.walk does not follow dir symlinks, so store them as
+                    # symlinks.
+                    dir_names.remove(dir_name)
+                    file_names.append(dir_name)
+                    continue
+                entries.append({'type': 'dir',
+                                'path': str(rel_dir_path / dir_name)})
+            for file_name in sorted(file_names):
+                abs_path = Path(dir_path, file_name)
+                rel_path = str(rel_dir_path / file_name)
+                if abs_path.is_symlink():
+                    entries.append({'type': 'symlink', 'path': rel_path,
+                                    'target': os.readlink(abs_path)})
+                    continue
+                entry, is_new = self.ingest_file(path=abs_path,
+                                                 take_file=take_files)
+                entries.append({**entry, 'path': rel_path})
+                num_new_objects += int(is_new)
+        return entries, num_new_objects
+
+    def ingest_file(self, path=None, take_file=False):
+        """Store a file as an object, unless an identical object exists.
+
+        Returns:
+            (entry, is_new) (tuple): entry is a manifest entry without a
+                'path', and is_new is True if a new object was stored.
+        """
+        file_stat = os.stat(path)
+        executable = bool(file_stat.st_mode & stat.S_IXUSR)
+        entry = {
+            'type': 'file',
+            'digest': self.hash_file(path=path),
+            'size': file_stat.st_size,
+            'executable': executable,
+        }
+        object_path = self.get_object_path(**entry)
+        if object_path.exists():
+            return entry, False
+        tmp_object_path = self.tmp_path / uuid.uuid4().hex
+        if take_file:
+            try:
+                os.rename(path, tmp_object_path)
+            except OSError:
+                reflink_or_copy(src=path, dest=tmp_object_path)
+        else:
+            reflink_or_copy(src=path, dest=tmp_object_path)
+        os.chmod(tmp_object_path, 0o555 if executable else 0o444)
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_object_path, object_path)
+        return entry, True
+
+    def hash_file(self, path=None):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def get_object_path(self, digest=None, executable=False, **kwargs):
+        object_name = digest[2:] + ('.x' if executable else '')
+        return self.objects_path / digest[:2] / object_name
+
+    def get_manifest_path(self, key=None):
+        return self.manifests_path / (key + '.json')
+
+    def write_manifest(self, key=None, manifest=None):
+        manifest_path = self.get_manifest_path(key=key)
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+
+    def read_manifest(self, meta=None):
+        with open(self.get_manifest_path(key=meta['key'])) as f:
+            return json.load(f)
+
+    def materialize_as_path(self, meta=None, dest=None):
+        """Rebuild an ingested dir as a tree of hardlinks to objects, or an
+        ingested file as a hardlink to its object.
+
+        Files are read-only, and shared with other trees.
+
+        Args:
+            meta (dict): meta returned by :meth:`ingest`.
+            dest (str, optional): where to build the tree. Default: a path
+                under the archive's 'materialized' dir, which is reused if it
+                was already built.
+
+        Returns:
+            path (pathlib.Path): path to the tree.
+        """
+        if dest is None:
+            dest_path = self.materialized_path / meta['key']
+            if dest_path.exists():
+                return dest_path
+        else:
+            dest_path = Path(dest)
+        manifest = self.read_manifest(meta=meta)
+        # Build at a tmp path, so that partial trees are never visible.
+        tmp_tree_path = self.tmp_path / uuid.uuid4().hex
+        if manifest.get('root_type') == 'file':
+            link_or_copy(src=self.get_object_path(**manifest['entries'][0]),
+                         dest=tmp_tree_path)
+            dest_path.parent.mkdir(parents=True, exist_ok=True)
+            os.rename(tmp_tree_path, dest_path)
+            return dest_path
+        tmp_tree_path.mkdir()
+        for entry in manifest['entries']:
+            entry_path = tmp_tree_path / entry['path']
+            if entry['type'] == 'dir':
+                entry_path.mkdir(exist_ok=True)
+            elif entry['type'] == 'symlink':
+                os.symlink(entry['target'], entry_path)
+            else:
+                link_or_copy(src=self.get_object_path(**entry),
+                             dest=entry_path)
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        os.rename(tmp_tree_path, dest_path)
+        return dest_path
@@ -0,0 +1,174 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..cas_archiver import CasArchiver
+
+
+class BaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.archiver = CasArchiver(
+            root_dir=os.path.join(self.tmp_dir, 'archive'),
+            time_components_generator=lambda src=None: ['t'])
+        self.shared_content = os.urandom(1000)
+
+    def generate_job_dir(self, name=None, unique_content=None):
+        job_dir = os.path.join(self.tmp_dir, name)
+        os.makedirs(os.path.join(job_dir, 'inputs'))
+        files = {
+            os.path.join('inputs', 'shared.bin'): self.shared_content,
+            'unique.txt': unique_content or name.encode(),
+        }
+        for rel_path, content in files.items():
+            with open(os.path.join(job_dir, rel_path), 'wb') as f:
+                f.write(content)
+        os.symlink('unique.txt', os.path.join(job_dir, 'link.txt'))
+        return job_dir, files
+
+    def count_objects(self):
+        return sum(len(file_names) for _, _, file_names
+                   in os.walk(self.archiver.objects_path))
+
+
+class IngestTestCase(BaseTestCase):
+    def test_returns_key_and_stats(self):
+        job_dir, _ = self.generate_job_dir(name='job_1')
+        meta = self.archiver.ingest(src=job_dir)
+        self.assertEqual(meta, {'key': os.path.join('t', 'job_1'),
+                                'num_files': 2, 'num_new_objects': 2,
+                                'num_bytes': 1005})
+
+    def test_removes_src(self):
+        job_dir, _ = self.generate_job_dir(name='job_1')
+        self.archiver.ingest(src=job_dir)
+        self.assertFalse(os.path.exists(job_dir))
+
+    def test_keeps_src_if_not_remove_src(self):
+        job_dir, files = self.generate_job_dir(name='job_1')
+        self.archiver.ingest(src=job_dir, remove_src=False)
+        for rel_path, content in files.items():
+            with open(os.path.join(job_dir, rel_path), 'rb') as f:
+                self.assertEqual(f.read(), content)
+
+    def test_stores_shared_files_once(self):
+        metas = [
+            self.archiver.ingest(
+                src=self.generate_job_dir(name='job_%s' % i)[0])
+            for i in range(3)
+        ]
+        self.assertEqual([meta['num_new_objects'] for meta in metas],
+                         [2, 1, 1])
+        self.assertEqual(self.count_objects(), 4)
+
+    def test_objects_are_read_only(self):
+        job_dir, _ = self.generate_job_dir(name='job_1')
+        self.archiver.ingest(src=job_dir)
+        for dir_path, _, file_names in os.walk(self.archiver.objects_path):
+            for file_name in file_names:
+                mode = os.stat(os.path.join(dir_path, file_name)).st_mode
+                self.assertEqual(mode & 0o222, 0)
+
+    def test_stores_executable_files_as_separate_objects(self):
+        job_dir_1, _ = self.generate_job_dir(name='job_1')
+        job_dir_2, _ = self.generate_job_dir(name='job_2')
+        os.chmod(os.path.join(job_dir_2, 'inputs', 'shared.bin'), 0o755)
+        self.archiver.ingest(src=job_dir_1)
+        meta = self.archiver.ingest(src=job_dir_2)
+        self.assertEqual(meta['num_new_objects'], 2)
+
+    def test_writes_manifest(self):
+        job_dir, _ = self.generate_job_dir(name='job_1')
+        meta = self.archiver.ingest(src=job_dir)
+        manifest = self.archiver.read_manifest(meta=meta)
+        entries_by_path = {entry['path']: entry
+                           for entry in manifest['entries']}
+        self.assertEqual(sorted(entries_by_path.keys()),
+                         ['inputs', 'inputs/shared.bin', 'link.txt',
+                          'unique.txt'])
+        self.assertEqual(entries_by_path['link.txt'],
+                         {'type': 'symlink', 'path': 'link.txt',
+                          'target': 'unique.txt'})
+        self.assertEqual(entries_by_path['inputs/shared.bin']['size'], 1000)
+
+
+class IngestFileTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.file_path = os.path.join(self.tmp_dir, 'job_1__stdout')
+        with open(self.file_path, 'wb') as f:
+            f.write(self.shared_content)
+
+    def test_ingests_file(self):
+        meta = self.archiver.ingest(src=self.file_path)
+        self.assertEqual(meta, {'key': os.path.join('t', 'job_1', 'stdout'),
+                                'num_files': 1, 'num_new_objects': 1,
+                                'num_bytes': 1000})
+        self.assertFalse(os.path.exists(self.file_path))
+        manifest = self.archiver.read_manifest(meta=meta)
+        self.assertEqual(manifest['root_type'], 'file')
+        self.assertEqual(len(manifest['entries']), 1)
+
+    def test_removes_src_if_object_exists(self):
+        job_dir, _ = self.generate_job_dir(name='job_2')
+        self.archiver.ingest(src=job_dir)
+        meta = self.archiver.ingest(src=self.file_path)
+        self.assertEqual(meta['num_new_objects'], 0)
+        self.assertFalse(os.path.exists(self.file_path))
+
+    def test_keeps_src_if_not_remove_src(self):
+        self.archiver.ingest(src=self.file_path, remove_src=False)
+        self.assertTrue(os.path.exists(self.file_path))
+
+    def test_materializes_file(self):
+        meta = self.archiver.ingest(src=self.file_path)
+        path = self.archiver.materialize_as_path(meta=meta)
+        self.assertTrue(path.is_file())
+        self.assertEqual(path.read_bytes(), self.shared_content)
+
+
+class MaterializeAsPathTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        job_dir, self.files = self.generate_job_dir(name='job_1')
+        self.meta = self.archiver.ingest(src=job_dir)
+
+    def assert_tree_matches_files(self, path=None):
+        for rel_path, content in self.files.items():
+            with open(os.path.join(path, rel_path), 'rb') as f:
+                self.assertEqual(f.read(), content)
+        self.assertEqual(os.readlink(os.path.join(path, 'link.txt')),
+                         'unique.txt')
+
+    def test_rebuilds_tree(self):
+        path = self.archiver.materialize_as_path(meta=self.meta)
+        self.assertEqual(
+            path, self.archiver.materialized_path / self.meta['key'])
+        self.assert_tree_matches_files(path=path)
+
+    def test_hardlinks_objects(self):
+        path = self.archiver.materialize_as_path(meta=self.meta)
+        entry = next(
+            entry for entry in self.archiver.read_manifest(
+                meta=self.meta)['entries']
+            if entry['path'] == 'unique.txt'
+        )
+        self.assertTrue(os.path.samefile(
+            os.path.join(path, 'unique.txt'),
+            self.archiver.get_object_path(**entry)))
+
+    def test_reuses_materialized_tree(self):
+        path = self.archiver.materialize_as_path(meta=self.meta)
+        marker_path = os.path.join(path, 'marker')
+        open(marker_path, 'w').close()
+        self.assertEqual(self.archiver.materialize_as_path(meta=self.meta),
+                         path)
+        self.assertTrue(os.path.exists(marker_path))
+
+    def test_materializes_to_dest(self):
+        dest = os.path.join(self.tmp_dir, 'dest')
+        path = self.archiver.materialize_as_path(meta=self.meta, dest=dest)
+        self.assertEqual(str(path), dest)
+        self.assert_tree_matches_files(path=dest)
@@ -0,0 +1,157 @@
+import gzip
+import hashlib
+import os
+import tarfile
+import tempfile
+
+from .base_artifact_processor import BaseArtifactProcessor
+
+
+class BlobStoreArtifactProcessor(BaseArtifactProcessor):
+    """ArtifactProcessor that converts dir <=> compressed tarball in a local,
+    content-addressed blob store.
+
+    Tarballs are streamed to a temp file in the store, and hashed as they are
+    written. They are then moved to a path derived from their sha256 digest,
+    so artifacts only hold the digest and size: ::
+
+        {'artifact_type': 'blob:tgz',
+         'artifact_params': {'digest': 'sha256:<hex digest>', 'size': 1234}}
+
+    Extraction streams from the blob file, so artifacts never pass through
+    memory or the db in full.
+
+    Tarballs only depend on dir contents: entries' times and owners are
+    normalized, and gzip headers carry no timestamp. So the same dir always
+    gets the same digest, and is stored once. Extracted files get the epoch
+    as their mtime.
+
+    'zstd' compression requires the zstandard package.
+    """
+
+    ARTIFACT_TYPES = {'gz': 'blob:tgz', 'zstd': 'blob:tzst'}
+    DIGEST_ALGORITHM = 'sha256'
+    CHUNK_SIZE = 2**20
+
+    def __init__(self, store_dir=None, compression='gz', ensure_store=True):
+        """
+        Args:
+            store_dir (str): root dir for blobs.
+            compression (str, optional): 'gz' or 'zstd'. Default: 'gz'.
+            ensure_store (bool, optional): create store dirs if they do not
+                exist. Default: True.
+        """
+        if compression not in self.ARTIFACT_TYPES:
+            raise ValueError("Unknown compression '%s'" % compression)
+        self.store_dir = store_dir
+        self.compression = compression
+        if ensure_store:
+            os.makedirs(self.get_tmp_dir(), exist_ok=True)
+
+    def get_tmp_dir(self): return os.path.join(self.store_dir, 'tmp')
+
+    def get_blob_path(self, digest=None):
+        algorithm, hex_digest = digest.split(':', 1)
+        return os.path.join(self.store_dir, algorithm, hex_digest[:2],
+                            hex_digest[2:])
+
+    def dir_to_artifact(self, dir_=None, **kwargs):
+        blob_meta = self.dir_to_blob(dir_=dir_)
+        return {
+            'artifact_type': self.ARTIFACT_TYPES[self.compression],
+            'artifact_params': blob_meta,
+        }
+
+    def dir_to_blob(self, dir_=None):
+        """Stream a dir into the store as a compressed tarball.
+
+        Returns:
+            blob_meta (dict): the blob's 'digest' and 'size'.
+        """
+        tmp_file = tempfile.NamedTemporaryFile(dir=self.get_tmp_dir(),
+                                               delete=False)
+        try:
+            with tmp_file:
+                hashing_writer = _HashingWriter(
+                    fileobj=tmp_file,
+                    hasher=hashlib.new(self.DIGEST_ALGORITHM))
+                self._write_tarball(dir_=dir_, fileobj=hashing_writer)
+            digest = '%s:%s' % (self.DIGEST_ALGORITHM,
+                                hashing_writer.hasher.hexdigest())
+            blob_path = self.get_blob_path(digest=digest)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(tmp_file.name, blob_path)
+        except Exception:
+            if os.path.exists(tmp_file.name):
+                os.remove(tmp_file.name)
+            raise
+        return {'digest': digest, 'size': hashing_writer.size}
+
+    def _write_tarball(self, dir_=None, fileobj=None):
+        if self.compression == 'zstd':
+            import zstandard
+            compressed_writer = zstandard.ZstdCompressor().stream_writer(
+                fileobj, closefd=False)
+        else:
+            # GzipFile, unlike tarfile's 'w|gz' mode, lets the header's
+            # timestamp be fixed.
+            compressed_writer = gzip.GzipFile(filename='', mode='wb',
+                                              fileobj=fileobj, mtime=0)
+        with compressed_writer, tarfile.open(
+            mode='w|', fileobj=compressed_writer
+        ) as tar:
+            tar.add(dir_, arcname='.', filter=self._normalize_tarinfo)
+
+    def _normalize_tarinfo(self, tarinfo):
+        tarinfo.mtime = 0
+        tarinfo.uid = tarinfo.gid = 0
+        tarinfo.uname = tarinfo.gname = ''
+        return tarinfo
+
+    def artifact_to_dir(self, artifact=None, dest=None, **kwargs):
+        compression = self.get_compression_for_artifact_type(
+            artifact_type=artifact['artifact_type'])
+        blob_path = self.get_blob_path(
+            digest=artifact['artifact_params']['digest'])
+        with open(blob_path, 'rb') as blob_file:
+            if compression == 'zstd':
+                import zstandard
+                with zstandard.ZstdDecompressor().stream_reader(
+                    blob_file, closefd=False
+                ) as zstd_reader:
+                    self._extract_tarball(fileobj=zstd_reader, mode='r|',
+                                          dest=dest)
+            else:
+                self._extract_tarball(fileobj=blob_file, mode='r|gz',
+                                      dest=dest)
+
+    def get_compression_for_artifact_type(self, artifact_type=None):
+        for compression, _artifact_type in self.ARTIFACT_TYPES.items():
+            if _artifact_type == artifact_type:
+                return compression
+        raise self.InvalidArtifactError(
+            "Unknown artifact_type '%s'" % artifact_type)
+
+    def _extract_tarball(self, fileobj=None, mode=None, dest=None):
+        extract_kwargs = {}
+        if hasattr(tarfile, 'data_filter'):
+            # Reject absolute paths, '..' and links out of dest.
+            extract_kwargs['filter'] = 'data'
+        with tarfile.open(mode=mode, fileobj=fileobj) as tar:
+            tar.extractall(path=dest, **extract_kwargs)
+
+
+class _HashingWriter(object):
+    """File-like writer that hashes and counts bytes as it writes them."""
+
+    def __init__(self, fileobj=None, hasher=None):
+        self.fileobj = fileobj
+        self.hasher = hasher
+        self.size = 0
+
+    def write(self, bytes_):
+        self.hasher.update(bytes_)
+        self.size += len(bytes_)
+        return self.fileobj.write(bytes_)
+
+    def flush(self): self.fileobj.flush()
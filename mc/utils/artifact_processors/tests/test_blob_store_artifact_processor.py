@@ -0,0 +1,90 @@
+import gzip
+import hashlib
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from ..blob_store_artifact_processor import BlobStoreArtifactProcessor
+
+HAS_ZSTANDARD = importlib.util.find_spec('zstandard') is not None
+
+
+class BaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.src_dir = os.path.join(self.tmp_dir, 'src')
+        os.makedirs(os.path.join(self.src_dir, 'subdir'))
+        self.files = {'a.txt': b'a' * 1000,
+                      os.path.join('subdir', 'b.bin'): os.urandom(1000)}
+        for rel_path, content in self.files.items():
+            with open(os.path.join(self.src_dir, rel_path), 'wb') as f:
+                f.write(content)
+        self.processor = BlobStoreArtifactProcessor(
+            store_dir=os.path.join(self.tmp_dir, 'store'))
+
+    def assert_dir_matches_src(self, dir_=None):
+        for rel_path, content in self.files.items():
+            with open(os.path.join(dir_, rel_path), 'rb') as f:
+                self.assertEqual(f.read(), content)
+
+
+class DirToArtifactTestCase(BaseTestCase):
+    def test_returns_digest_and_size(self):
+        artifact = self.processor.dir_to_artifact(dir_=self.src_dir)
+        self.assertEqual(artifact['artifact_type'], 'blob:tgz')
+        self.assertEqual(sorted(artifact['artifact_params'].keys()),
+                         ['digest', 'size'])
+
+    def test_stores_blob_at_digest_path(self):
+        artifact_params = self.processor.dir_to_artifact(
+            dir_=self.src_dir)['artifact_params']
+        blob_path = self.processor.get_blob_path(
+            digest=artifact_params['digest'])
+        with open(blob_path, 'rb') as f:
+            blob_bytes = f.read()
+        self.assertEqual(len(blob_bytes), artifact_params['size'])
+        self.assertEqual(artifact_params['digest'],
+                         'sha256:' + hashlib.sha256(blob_bytes).hexdigest())
+        self.assertEqual(os.listdir(self.processor.get_tmp_dir()), [])
+
+    def test_same_content_gets_same_digest(self):
+        with patch.object(gzip.time, 'time', return_value=1000):
+            artifact = self.processor.dir_to_artifact(dir_=self.src_dir)
+        copy_dir = os.path.join(self.tmp_dir, 'copy')
+        shutil.copytree(self.src_dir, copy_dir)
+        for dir_path, _, file_names in os.walk(copy_dir):
+            for name in file_names:
+                os.utime(os.path.join(dir_path, name), (2000, 2000))
+        with patch.object(gzip.time, 'time', return_value=3000):
+            copy_artifact = self.processor.dir_to_artifact(dir_=copy_dir)
+        self.assertEqual(copy_artifact, artifact)
+
+
+class ArtifactToDirTestCase(BaseTestCase):
+    def test_round_trips(self):
+        artifact = self.processor.dir_to_artifact(dir_=self.src_dir)
+        dest = os.path.join(self.tmp_dir, 'dest')
+        self.processor.artifact_to_dir(artifact=artifact, dest=dest)
+        self.assert_dir_matches_src(dir_=dest)
+
+    @unittest.skipUnless(HAS_ZSTANDARD, 'zstandard is not installed')
+    def test_round_trips_zstd(self):
+        self.processor.compression = 'zstd'
+        artifact = self.processor.dir_to_artifact(dir_=self.src_dir)
+        self.assertEqual(artifact['artifact_type'], 'blob:tzst')
+        dest = os.path.join(self.tmp_dir, 'dest')
+        self.processor.artifact_to_dir(artifact=artifact, dest=dest)
+        self.assert_dir_matches_src(dir_=dest)
+
+    def test_rejects_unknown_artifact_types(self):
+        with self.assertRaises(self.processor.InvalidArtifactError):
+            self.processor.artifact_to_dir(
+                artifact={'artifact_type': 'tgz:bytes'}, dest=self.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import shutil
+
+# Linux ioctl for cloning a file's extents (a reflink copy).
+FICLONE = 0x40049409
+
+
+def reflink_or_copy(src=None, dest=None):
+    """Copy a file as a reflink, if the filesystem supports it, else copy it
+    in full."""
+    try:
+        import fcntl
+        with open(src, 'rb') as src_file, open(dest, 'wb') as dest_file:
+            fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copyfile(src, dest)
+
+
+def link_or_copy(src=None, dest=None):
+    """Hardlink a file, or copy it if it is on another device."""
+    try:
+        os.link(src, dest)
+    except OSError:
+        reflink_or_copy(src=src, dest=dest)
+
+
+def link_tree(src=None, dest=None, link_fn=link_or_copy):
+    """Recreate a dir tree, with files added by link_fn.
+
+    Symlinks are copied as symlinks.
+    """
+    os.makedirs(dest)
+    for dir_path, dir_names, file_names in os.walk(src):
+        rel_dir_path = os.path.relpath(dir_path, src)
+        dest_dir_path = os.path.normpath(os.path.join(dest, rel_dir_path))
+        for name in dir_names + file_names:
+            src_path = os.path.join(dir_path, name)
+            dest_path = os.path.join(dest_dir_path, name)
+            if os.path.islink(src_path):
+                os.symlink(os.readlink(src_path), dest_path)
+            elif os.path.isdir(src_path):
+                os.mkdir(dest_path)
+            else:
+                link_fn(src=src_path, dest=dest_path)
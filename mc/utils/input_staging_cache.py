@@ -0,0 +1,214 @@
+import collections
+import os
+import shutil
+import stat
+import threading
+import uuid
+
+from mc.utils import hash_utils
+from mc.utils.file_link_utils import link_or_copy, link_tree, reflink_or_copy
+
+
+class InputStagingCache(object):
+    """Cache of materialized artifacts, for staging job inputs.
+
+    Each artifact is materialized once, into an entry dir in the cache that
+    is keyed by the artifact's digest. It is then staged into jobdirs from
+    the entry, which is much faster than materializing it again.
+
+    Staging modes:
+
+    - 'hardlink': a tree of hardlinks to the entry's files. Entry files are
+      made read-only, since jobs share their inodes. Files on another device
+      are copied.
+    - 'reflink': a tree of copy-on-write clones of the entry's files, where
+      the filesystem supports them, else of full copies. Jobs may modify
+      their copies.
+
+    Either way, staged inputs are self-contained trees, so they outlive
+    evicted entries, and can be archived with the rest of their jobdir.
+
+    Entries are evicted least recently used first, when the cache holds more
+    than max_bytes.
+
+    Entries and their recency are kept on disk, so a reopened cache reuses
+    them. Staging counts and locks are kept in memory, so a cache dir may be
+    shared by threads, but only used by one process at a time.
+    """
+    STAGING_MODES = {'hardlink', 'reflink'}
+    ENTRIES_DIR_NAME = 'entries'
+
+    def __init__(self, cache_dir=None, max_bytes=None, staging_mode=None):
+        """
+        Args:
+            cache_dir (str): root dir for cache entries.
+            max_bytes (int, optional): evict entries when the cache holds more
+                than this many bytes. The most recently used entry is never
+                evicted. Default: None, for no eviction.
+            staging_mode (str, optional): 'hardlink' or 'reflink'. Default:
+                'hardlink'.
+        """
+        staging_mode = staging_mode or 'hardlink'
+        if staging_mode not in self.STAGING_MODES:
+            raise ValueError("Unknown staging_mode '%s'" % staging_mode)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.staging_mode = staging_mode
+        self.entries_dir = os.path.join(cache_dir, self.ENTRIES_DIR_NAME)
+        self.tmp_dir = os.path.join(cache_dir, 'tmp')
+        for dir_ in [self.entries_dir, self.tmp_dir]:
+            os.makedirs(dir_, exist_ok=True)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._staging_counts = collections.Counter()
+        self._entry_sizes = self._load_entry_sizes()
+
+    def _load_entry_sizes(self):
+        return {key: self.get_tree_size(path=self.get_entry_path(key=key))
+                for key in os.listdir(self.entries_dir)}
+
+    def get_entry_path(self, key=None):
+        return os.path.join(self.entries_dir, key)
+
+    def get_tree_size(self, path=None):
+        size = 0
+        for dir_path, _, file_names in os.walk(path):
+            for file_name in file_names:
+                size += os.lstat(os.path.join(dir_path, file_name)).st_size
+        return size
+
+    @property
+    def total_bytes(self): return sum(self._entry_sizes.values())
+
+    def get_artifact_cache_key(self, artifact=None):
+        """Get a cache key for an artifact.
+
+        Artifacts with a content digest, like blob store artifacts, are keyed
+        by their digest. Artifacts that carry their content inline, like
+        'tgz:bytes' artifacts, are keyed by a hash of the artifact.
+
+        Returns:
+            key (str): the key, or None if the artifact's content could
+                change, e.g. for 'local_path' artifacts.
+        """
+        artifact_params = artifact.get('artifact_params') or {}
+        if 'digest' in artifact_params:
+            return artifact_params['digest'].replace(':', '_')
+        if 'encoded_bytes' in artifact_params:
+            return 'inline_' + hash_utils.hash_obj(artifact)
+        return None
+
+    def stage(self, key=None, dest=None, materialize_fn=None):
+        """Stage a cache entry at dest, materializing it first if needed.
+
+        Args:
+            key (str): cache key for the entry.
+            dest (str): path to stage the entry to. Must not exist.
+            materialize_fn (callable): fn that takes a 'dest' kwarg, and
+                materializes the entry's content there.
+
+        Returns:
+            was_cached (bool): True if the entry was already in the cache.
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+            # Entries being staged are never evicted.
+            self._staging_counts[key] += 1
+        try:
+            # Hold a per-key lock, so that concurrent stagers of one artifact
+            # materialize it once, without blocking stagers of other
+            # artifacts.
+            with key_lock:
+                was_cached = self.ensure_entry(key=key,
+                                               materialize_fn=materialize_fn)
+            self.stage_entry(key=key, dest=dest)
+        finally:
+            with self._lock:
+                self._staging_counts[key] -= 1
+                if self._staging_counts[key] == 0:
+                    # Later stagers of the key get a new lock, so that
+                    # locks are only kept for keys being staged.
+                    del self._staging_counts[key]
+                    del self._key_locks[key]
+                self.evict(keep_keys={key})
+        return was_cached
+
+    def ensure_entry(self, key=None, materialize_fn=None):
+        entry_path = self.get_entry_path(key=key)
+        if os.path.exists(entry_path):
+            self.touch_entry(key=key)
+            return True
+        self.add_entry(key=key, materialize_fn=materialize_fn)
+        return False
+
+    def stage_entry(self, key=None, dest=None):
+        entry_path = self.get_entry_path(key=key)
+        if self.staging_mode == 'reflink':
+            link_tree(src=entry_path, dest=dest, link_fn=reflink_or_copy)
+        else:
+            link_tree(src=entry_path, dest=dest, link_fn=link_or_copy)
+
+    def touch_entry(self, key=None):
+        try:
+            os.utime(self.get_entry_path(key=key))
+        except FileNotFoundError:
+            pass
+
+    def add_entry(self, key=None, materialize_fn=None):
+        # Materialize in a tmp dir, so that partial entries are never
+        # visible.
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        try:
+            materialize_fn(dest=tmp_path)
+            self.make_read_only(path=tmp_path)
+            size = self.get_tree_size(path=tmp_path)
+            os.rename(tmp_path, self.get_entry_path(key=key))
+        except Exception:
+            if os.path.lexists(tmp_path):
+                self.remove_tree(path=tmp_path)
+            raise
+        with self._lock:
+            self._entry_sizes[key] = size
+
+    def make_read_only(self, path=None):
+        # Dirs stay writable, so entries can be evicted without restoring
+        # write bits.
+        for dir_path, _, file_names in os.walk(path):
+            for name in file_names:
+                self._remove_write_bits(path=os.path.join(dir_path, name))
+
+    def _remove_write_bits(self, path=None):
+        if os.path.islink(path):
+            return
+        mode = os.stat(path).st_mode
+        os.chmod(path, stat.S_IMODE(mode) & ~0o222)
+
+    def evict(self, keep_keys=None):
+        """Evict least recently used entries until the cache fits in
+        max_bytes. Call with self._lock held."""
+        if self.max_bytes is None:
+            return
+        total_bytes = self.total_bytes
+        if total_bytes <= self.max_bytes:
+            return
+        for key in self.get_keys_by_recency():
+            if total_bytes <= self.max_bytes:
+                break
+            if key in (keep_keys or set()) or self._staging_counts[key] > 0:
+                continue
+            self.remove_tree(path=self.get_entry_path(key=key))
+            total_bytes -= self._entry_sizes.pop(key)
+
+    def get_keys_by_recency(self):
+        """Get entry keys, least recently used first."""
+        def get_last_used_time(key):
+            return os.stat(self.get_entry_path(key=key)).st_mtime
+        return sorted(self._entry_sizes.keys(), key=get_last_used_time)
+
+    def remove_tree(self, path=None):
+        if not os.path.lexists(path):
+            return
+        if os.path.islink(path) or not os.path.isdir(path):
+            os.remove(path)
+            return
+        shutil.rmtree(path)
@@ -63,16 +63,21 @@ class McSandbox(object):
         return self.has_incomplete_flows() or self.has_incomplete_jobs()
 
     def has_incomplete_flows(self):
-        return len(self.get_incomplete_items(item_type='flow')) > 0
+        return self.mc_db.exists_items(item_type='flow',
+                                       query=self.get_incomplete_query())
 
     def get_incomplete_items(self, item_type=None):
+        return self.mc_db.query_items(item_type=item_type,
+                                      query=self.get_incomplete_query())
+
+    def get_incomplete_query(self):
         incomplete_filter = {'field': 'status', 'op': '! IN',
                              'arg': ['COMPLETED', 'FAILED']}
-        return self.mc_db.query_items(
-            item_type=item_type, query={'filters':  [incomplete_filter]})
+        return {'filters': [incomplete_filter]}
 
     def has_incomplete_jobs(self):
-        return len(self.get_incomplete_items(item_type='job')) > 0
+        return self.mc_db.exists_items(item_type='job',
+                                       query=self.get_incomplete_query())
 
     def run_until_completed(self, max_ticks=10, tick_interval=.1,
                             log_ticks=False, job_runner=None):
@@ -102,7 +107,7 @@ class McSandbox(object):
     def print_items(self, item_type=None, keys_to_exclude=None, filters=None):
         print('==== ' + item_type.upper() + ' ====')
         keys_to_exclude = keys_to_exclude or {}
-        for item in self.mc_db.query_items(item_type=item_type):
+        for item in self.mc_db.iter_items(item_type=item_type):
             if not all([filter_(item) for filter_ in (filters or [])]):
                 continue
             for key, value in item.items():
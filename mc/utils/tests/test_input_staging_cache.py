@@ -0,0 +1,168 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from ..input_staging_cache import InputStagingCache
+
+
+class BaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.cache = self.generate_cache()
+        self.materialize_fn = MagicMock(side_effect=self.write_tree)
+
+    def generate_cache(self, **kwargs):
+        return InputStagingCache(cache_dir=self.cache_dir, **kwargs)
+
+    def write_tree(self, dest=None, size=10):
+        os.makedirs(os.path.join(dest, 'subdir'))
+        for rel_path in ['a.txt', os.path.join('subdir', 'b.txt')]:
+            with open(os.path.join(dest, rel_path), 'w') as f:
+                f.write('x' * size)
+
+    def stage(self, key='key_1', dest_name=None, materialize_fn=None):
+        dest = os.path.join(self.tmp_dir, dest_name or 'dest')
+        was_cached = self.cache.stage(
+            key=key, dest=dest,
+            materialize_fn=(materialize_fn or self.materialize_fn))
+        return dest, was_cached
+
+    def assert_tree_matches(self, path=None):
+        for rel_path in ['a.txt', os.path.join('subdir', 'b.txt')]:
+            with open(os.path.join(path, rel_path)) as f:
+                self.assertEqual(f.read(), 'x' * 10)
+
+
+class GetArtifactCacheKeyTestCase(BaseTestCase):
+    def test_uses_digest(self):
+        artifact = {'artifact_type': 'blob:tgz',
+                    'artifact_params': {'digest': 'sha256:abc', 'size': 1}}
+        self.assertEqual(self.cache.get_artifact_cache_key(artifact=artifact),
+                         'sha256_abc')
+
+    def test_hashes_inline_artifacts(self):
+        artifact = {'artifact_type': 'tgz:bytes',
+                    'artifact_params': {'encoded_bytes': 'abc'}}
+        key = self.cache.get_artifact_cache_key(artifact=artifact)
+        self.assertTrue(key.startswith('inline_'))
+        self.assertEqual(
+            self.cache.get_artifact_cache_key(artifact=dict(artifact)), key)
+
+    def test_returns_none_for_local_paths(self):
+        artifact = {'artifact_type': 'local_path',
+                    'artifact_params': {'path': '/some/path'}}
+        self.assertEqual(
+            self.cache.get_artifact_cache_key(artifact=artifact), None)
+
+
+class StageTestCase(BaseTestCase):
+    def test_materializes_once(self):
+        dest_1, was_cached_1 = self.stage(dest_name='dest_1')
+        dest_2, was_cached_2 = self.stage(dest_name='dest_2')
+        self.assertEqual(self.materialize_fn.call_count, 1)
+        self.assertEqual([was_cached_1, was_cached_2], [False, True])
+        self.assert_tree_matches(path=dest_1)
+        self.assert_tree_matches(path=dest_2)
+
+    def test_hardlinks_read_only_files(self):
+        dest, _ = self.stage()
+        entry_file = os.path.join(self.cache.get_entry_path(key='key_1'),
+                                  'a.txt')
+        dest_file = os.path.join(dest, 'a.txt')
+        self.assertTrue(os.path.samefile(entry_file, dest_file))
+        self.assertEqual(os.stat(dest_file).st_mode & 0o222, 0)
+
+    def test_reflink_mode_copies_files(self):
+        self.cache = self.generate_cache(staging_mode='reflink')
+        dest, _ = self.stage()
+        self.assert_tree_matches(path=dest)
+        self.assertFalse(os.path.samefile(
+            os.path.join(self.cache.get_entry_path(key='key_1'), 'a.txt'),
+            os.path.join(dest, 'a.txt')))
+
+    def test_stages_trees_without_links_to_cache(self):
+        for staging_mode in ['hardlink', 'reflink']:
+            self.cache = self.generate_cache(staging_mode=staging_mode)
+            dest, _ = self.stage(dest_name=staging_mode)
+            for dir_path, dir_names, file_names in os.walk(dest):
+                for name in dir_names + file_names:
+                    self.assertFalse(
+                        os.path.islink(os.path.join(dir_path, name)))
+
+    def test_materializes_once_for_concurrent_stagers(self):
+        threads = [
+            threading.Thread(target=self.stage,
+                             kwargs={'dest_name': 'dest_%s' % i})
+            for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.materialize_fn.call_count, 1)
+        for i in range(8):
+            self.assert_tree_matches(
+                path=os.path.join(self.tmp_dir, 'dest_%s' % i))
+
+    def test_drops_key_locks_after_staging(self):
+        for i in range(3):
+            self.stage(key='key_%s' % i, dest_name='dest_%s' % i)
+        with self.assertRaises(Exception):
+            self.stage(key='failing_key', dest_name='failing_dest',
+                       materialize_fn=MagicMock(side_effect=Exception()))
+        self.assertEqual(self.cache._key_locks, {})
+        self.assertEqual(self.cache._staging_counts, {})
+
+    def test_rejects_unknown_staging_mode(self):
+        with self.assertRaises(ValueError):
+            self.generate_cache(staging_mode='symlink')
+
+    def test_does_not_keep_failed_entries(self):
+        def failing_materialize_fn(dest=None):
+            os.makedirs(dest)
+            raise Exception('some error')
+        with self.assertRaises(Exception):
+            self.stage(materialize_fn=failing_materialize_fn)
+        self.assertEqual(os.listdir(self.cache.entries_dir), [])
+        self.assertEqual(os.listdir(self.cache.tmp_dir), [])
+
+    def test_reopened_cache_reuses_entries(self):
+        self.stage(dest_name='dest_1')
+        self.cache = self.generate_cache()
+        self.assertEqual(self.cache.total_bytes, 20)
+        _, was_cached = self.stage(dest_name='dest_2')
+        self.assertTrue(was_cached)
+
+
+class EvictTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = self.generate_cache(max_bytes=50)
+
+    def stage_keys(self, keys=None):
+        for i, key in enumerate(keys):
+            dest, _ = self.stage(key=key, dest_name='dest_%s' % i)
+            # Make recency independent of mtime resolution.
+            os.utime(self.cache.get_entry_path(key=key), (i, i))
+
+    def test_evicts_least_recently_used_entries(self):
+        self.stage_keys(keys=['key_1', 'key_2', 'key_1', 'key_3'])
+        self.assertEqual(sorted(os.listdir(self.cache.entries_dir)),
+                         ['key_1', 'key_3'])
+        self.assertEqual(self.cache.total_bytes, 40)
+
+    def test_keeps_staged_hardlinks_of_evicted_entries(self):
+        self.stage_keys(keys=['key_1', 'key_2', 'key_3'])
+        self.assertNotIn('key_1', os.listdir(self.cache.entries_dir))
+        self.assert_tree_matches(path=os.path.join(self.tmp_dir, 'dest_0'))
+
+    def test_keeps_entry_bigger_than_max_bytes(self):
+        self.stage(materialize_fn=MagicMock(
+            side_effect=lambda dest=None: self.write_tree(dest=dest,
+                                                          size=100)))
+        self.assertEqual(os.listdir(self.cache.entries_dir), ['key_1'])